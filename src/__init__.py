@@ -3,6 +3,7 @@ from .formula_engine import FormulaEngine
 from .grid import Grid
 from .pattern_manager import PatternManager
 from .pattern_ui import PatternUI
+from .renderer import Renderer
 from .music_tracker import MusicTracker
 
 __all__ = [
@@ -11,5 +12,6 @@ __all__ = [
     'Grid',
     'PatternManager',
     'PatternUI',
+    'Renderer',
     'MusicTracker'
 ]
\ No newline at end of file
@@ -1,14 +1,405 @@
+import logging
 import numpy as np
-import sounddevice as sd
-import wave
+import os
+import struct
+import threading
+from collections import deque
 from typing import Optional
 
+from .sinks import AudioSink, SoundDeviceSink
+
+logger = logging.getLogger(__name__)
+
+WAVE_FORMAT_PCM = 1
+WAVE_FORMAT_IEEE_FLOAT = 3
+
+# sample format name -> (bytes per sample, RIFF format tag)
+SAMPLE_FORMATS = {
+    'int16': (2, WAVE_FORMAT_PCM),
+    'int24': (3, WAVE_FORMAT_PCM),
+    'float32': (4, WAVE_FORMAT_IEEE_FLOAT),
+}
+
+
+class WavWriter:
+    """Write a WAV file block by block with constant memory.
+
+    The RIFF and data chunk sizes are written as placeholders and patched
+    when the writer is closed, so the total length need not be known up
+    front. Blocks are float arrays in [-1, 1], shaped ``(frames,)`` for
+    mono or ``(frames, channels)``.
+
+    With ``resume_frames`` an existing file written with the same settings
+    is reopened and truncated after that many frames, so an interrupted
+    export can carry on where it stopped.
+    """
+
+    def __init__(self, filename: str, sample_rate: int = 44100, channels: int = 1,
+                 sample_format: str = 'int16', dither: bool = False,
+                 resume_frames: Optional[int] = None):
+        if sample_format not in SAMPLE_FORMATS:
+            raise ValueError(f"Unsupported sample format: {sample_format}")
+        self.filename = filename
+        self.sample_rate = sample_rate
+        self.channels = channels
+        self.sample_format = sample_format
+        self.sample_width, self.format_tag = SAMPLE_FORMATS[sample_format]
+        self.dither = dither and sample_format != 'float32'
+        self.frames_written = 0
+        self._file = open(filename, 'wb' if resume_frames is None else 'r+b')
+        self._write_header()
+        if resume_frames is not None:
+            self._file.seek(self.data_start + resume_frames * self.block_align)
+            self._file.truncate()
+            self.frames_written = resume_frames
+
+    @property
+    def block_align(self) -> int:
+        return self.channels * self.sample_width
+
+    def _write_header(self):
+        block_align = self.block_align
+        f = self._file
+        f.write(b'RIFF')
+        self._riff_size_pos = f.tell()
+        f.write(struct.pack('<I', 0))
+        f.write(b'WAVE')
+
+        fmt = struct.pack('<HHIIHH', self.format_tag, self.channels, self.sample_rate,
+                          self.sample_rate * block_align, block_align, self.sample_width * 8)
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            fmt += struct.pack('<H', 0)  # cbSize
+        f.write(b'fmt ' + struct.pack('<I', len(fmt)) + fmt)
+
+        self._fact_pos = None
+        if self.format_tag == WAVE_FORMAT_IEEE_FLOAT:
+            # Non-PCM files carry the frame count in a fact chunk
+            f.write(b'fact' + struct.pack('<I', 4))
+            self._fact_pos = f.tell()
+            f.write(struct.pack('<I', 0))
+
+        f.write(b'data')
+        self._data_size_pos = f.tell()
+        f.write(struct.pack('<I', 0))
+        self.data_start = f.tell()
+
+    def _encode(self, block: np.ndarray) -> bytes:
+        block = np.asarray(block, dtype=np.float32)
+        if block.ndim == 1:
+            block = block.reshape(-1, 1)
+        if block.shape[1] != self.channels:
+            raise ValueError(f"Expected {self.channels} channels, got {block.shape[1]}")
+
+        if self.sample_format == 'float32':
+            return block.astype('<f4').tobytes()
+
+        scale = 32767 if self.sample_format == 'int16' else 8388607
+        scaled = np.clip(block, -1.0, 1.0) * scale
+        if self.dither:
+            # TPDF dither of one LSB peak
+            scaled += np.random.random(scaled.shape) - np.random.random(scaled.shape)
+        ints = np.clip(np.round(scaled), -scale - 1, scale)
+
+        if self.sample_format == 'int16':
+            return ints.astype('<i2').tobytes()
+        # Pack 24-bit little-endian by dropping the high byte of each int32
+        return ints.astype('<i4').view(np.uint8).reshape(-1, 4)[:, :3].tobytes()
+
+    def write(self, block: np.ndarray):
+        data = self._encode(block)
+        self._file.write(data)
+        self.frames_written += len(data) // self.block_align
+
+    def overwrite(self, frame: int, block: np.ndarray):
+        """Replace already written frames starting at ``frame``"""
+        data = self._encode(block)
+        if frame + len(data) // self.block_align > self.frames_written:
+            raise ValueError("Cannot overwrite past the end of the written data")
+        self._file.seek(self.data_start + frame * self.block_align)
+        self._file.write(data)
+        self._file.seek(self.data_start + self.frames_written * self.block_align)
+
+    def flush(self):
+        self._file.flush()
+        os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is None:
+            return
+        f = self._file
+        data_size = self.frames_written * self.block_align
+        if data_size % 2:
+            f.write(b'\x00')  # chunks are word aligned
+        end = f.tell()
+        f.seek(self._riff_size_pos)
+        f.write(struct.pack('<I', end - 8))
+        f.seek(self._data_size_pos)
+        f.write(struct.pack('<I', data_size))
+        if self._fact_pos is not None:
+            f.seek(self._fact_pos)
+            f.write(struct.pack('<I', self.frames_written))
+        f.close()
+        self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class RingBuffer:
+    """Fixed-size single-producer, single-consumer sample queue.
+
+    The producer blocks in ``write`` while ``limit`` samples are queued;
+    the audio callback never blocks and gets fewer samples when it runs
+    dry. ``limit`` can be changed at any time up to ``capacity``.
+
+    The consumer also copies the last ``tap_size`` samples it takes into a
+    tap, which ``recent`` reads without taking the lock, so meters on the
+    UI thread never hold up the audio callback.
+    """
+
+    def __init__(self, capacity: int, tap_size: int = 8192):
+        self.capacity = capacity
+        self.limit = capacity
+        # Running totals of samples queued and taken; ``read`` is the clock
+        # the playhead follows
+        self.written = 0
+        self.read = 0
+        self._data = np.zeros(capacity, dtype=np.float32)
+        self._start = 0
+        self._size = 0
+        # Samples taken since the last clear, for ``recent``
+        self._taken = 0
+        # Written only by the consumer; ``_tap_seq`` is odd while it writes
+        self._tap = np.zeros(tap_size, dtype=np.float32)
+        self._tapped = 0
+        self._tap_seq = 0
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        return self._size
+
+    def write(self, block: np.ndarray, stop_event: Optional[threading.Event] = None,
+              timeout: float = 0.05) -> int:
+        """Append ``block``, waiting for room; returns samples written before a stop"""
+        block = np.asarray(block, dtype=np.float32)
+        written = 0
+        while written < len(block):
+            with self._cond:
+                while self._size >= self.limit:
+                    if stop_event is not None and stop_event.is_set():
+                        return written
+                    self._cond.wait(timeout)
+                n = min(len(block) - written, self.limit - self._size)
+                end = (self._start + self._size) % self.capacity
+                first = min(n, self.capacity - end)
+                self._data[end:end + first] = block[written:written + first]
+                self._data[:n - first] = block[written + first:written + n]
+                self._size += n
+                self.written += n
+                written += n
+                self._cond.notify_all()
+        return written
+
+    def read_into(self, out: np.ndarray) -> int:
+        """Fill ``out`` from the front of the buffer; returns samples copied"""
+        with self._cond:
+            n = min(len(out), self._size)
+            first = min(n, self.capacity - self._start)
+            out[:first] = self._data[self._start:self._start + first]
+            out[first:n] = self._data[:n - first]
+            self._start = (self._start + n) % self.capacity
+            self._size -= n
+            self.read += n
+            self._record_tap(out[:n])
+            self._taken += n
+            self._cond.notify_all()
+        return n
+
+    def _record_tap(self, samples: np.ndarray):
+        size = len(self._tap)
+        samples = samples[-size:]
+        self._tap_seq += 1
+        begin = self._tapped % size
+        first = min(len(samples), size - begin)
+        self._tap[begin:begin + first] = samples[:first]
+        self._tap[:len(samples) - first] = samples[first:]
+        self._tapped += len(samples)
+        self._tap_seq += 1
+
+    def read_wait(self, out: np.ndarray, timeout: float = 0.05) -> int:
+        """Like ``read_into``, but wait up to ``timeout`` seconds for audio"""
+        with self._cond:
+            if not self._size:
+                self._cond.wait(timeout)
+        return self.read_into(out)
+
+    def recent(self, out: np.ndarray) -> int:
+        """Copy the last samples taken into the end of ``out``; returns how many.
+
+        Reads the tap without the lock and copies again if the consumer
+        wrote to it meanwhile. After a few tries the last copy is kept,
+        which at worst mixes two neighbouring blocks.
+        """
+        size = len(self._tap)
+        n = 0
+        for _ in range(3):
+            seq = self._tap_seq
+            n = min(len(out), size, self._taken)
+            begin = (self._tapped - n) % size
+            first = min(n, size - begin)
+            tail = out[len(out) - n:]
+            tail[:first] = self._tap[begin:begin + first]
+            tail[first:] = self._tap[:n - first]
+            if seq % 2 == 0 and self._tap_seq == seq:
+                break
+        return n
+
+    def clear(self):
+        with self._cond:
+            self._start = 0
+            self._size = 0
+            self._taken = 0
+            self.read = self.written
+            self._cond.notify_all()
+
+
+class PlaybackStats:
+    """Underrun and render timing counters for the playback pipeline.
+
+    The producer records how long each block took to render against its
+    deadline (the block's duration); the audio callback records underruns
+    and how much audio was queued each time it ran.
+    """
+
+    def __init__(self, sample_rate: int = 44100, history: int = 256):
+        self.sample_rate = sample_rate
+        self.history = history
+        self.reset()
+
+    def reset(self):
+        self.underruns = 0
+        self.blocks = 0
+        self.late_blocks = 0
+        self.render_times = deque(maxlen=self.history)
+        self.deadlines = deque(maxlen=self.history)
+        self.queue_depth = 0
+        self.min_queue_depth: Optional[int] = None
+
+    def record_render(self, seconds: float, samples: int):
+        deadline = samples / self.sample_rate
+        self.blocks += 1
+        if seconds > deadline:
+            self.late_blocks += 1
+        self.render_times.append(seconds)
+        self.deadlines.append(deadline)
+
+    def record_callback(self, requested: int, delivered: int, depth: int, active: bool):
+        self.queue_depth = depth
+        if not active:
+            return
+        if delivered < requested:
+            self.underruns += 1
+        if self.min_queue_depth is None or depth < self.min_queue_depth:
+            self.min_queue_depth = depth
+
+    def snapshot(self) -> dict:
+        """Current figures; times in milliseconds"""
+        render_times = list(self.render_times)
+        deadlines = list(self.deadlines)
+        mean_render = sum(render_times) / len(render_times) if render_times else 0.0
+        mean_deadline = sum(deadlines) / len(deadlines) if deadlines else 0.0
+        return {
+            'underruns': self.underruns,
+            'blocks': self.blocks,
+            'late_blocks': self.late_blocks,
+            'render_ms': mean_render * 1000,
+            'max_render_ms': max(render_times, default=0.0) * 1000,
+            'deadline_ms': mean_deadline * 1000,
+            'load': mean_render / mean_deadline if mean_deadline else 0.0,
+            'queue_depth': self.queue_depth,
+            'min_queue_depth': self.min_queue_depth or 0,
+            'latency_ms': self.queue_depth / self.sample_rate * 1000,
+        }
+
+    def summary(self) -> str:
+        stats = self.snapshot()
+        return (f"Underruns: {stats['underruns']}  "
+                f"Render: {stats['render_ms']:.1f}/{stats['deadline_ms']:.1f} ms  "
+                f"Queue: {stats['latency_ms']:.0f} ms")
+
+
+class BlockSizeController:
+    """Pick the playback block size and look-ahead from measured render cost.
+
+    After every ``window`` blocks the average render load (render time over
+    block duration) is checked: above ``high_load`` the block size doubles,
+    below ``low_load`` it halves. An underrun doubles it straight away. The
+    look-ahead follows at four blocks, capped at ``max_latency`` seconds.
+    """
+
+    def __init__(self, sample_rate: int = 44100, block_size: int = 2048,
+                 min_block: int = 256, max_block: int = 8192, max_latency: float = 0.5,
+                 high_load: float = 0.5, low_load: float = 0.15, window: int = 16):
+        self.sample_rate = sample_rate
+        self.min_block = min_block
+        self.max_latency_samples = max(int(max_latency * sample_rate), 2 * min_block)
+        self.max_block = min(max_block, self.max_latency_samples // 2)
+        self.high_load = high_load
+        self.low_load = low_load
+        self.window = window
+        self.block_size = 0
+        self.lookahead = 0
+        self._blocks = 0
+        self._underruns = 0
+        self._resize(block_size)
+
+    def _resize(self, size: int) -> bool:
+        size = min(max(size, self.min_block), self.max_block)
+        self._blocks = 0
+        if size == self.block_size:
+            return False
+        self.block_size = size
+        self.lookahead = min(size * 4, self.max_latency_samples)
+        logger.info(f"Playback block size {size}, look-ahead {self.lookahead}")
+        return True
+
+    def update(self, stats: PlaybackStats) -> bool:
+        """Call after each block; returns True when the sizes changed"""
+        self._blocks += 1
+        underran = stats.underruns > self._underruns
+        self._underruns = stats.underruns
+        if underran:
+            return self._resize(self.block_size * 2)
+        if self._blocks < self.window:
+            return False
+        render_time = sum(list(stats.render_times)[-self.window:])
+        deadline = sum(list(stats.deadlines)[-self.window:])
+        load = render_time / deadline if deadline else 0.0
+        if load > self.high_load:
+            return self._resize(self.block_size * 2)
+        if load < self.low_load:
+            return self._resize(self.block_size // 2)
+        self._blocks = 0
+        return False
+
+
 class AudioEngine:
-    def __init__(self, sample_rate=44100, buffer_size=2048, fade_samples=500):
+    def __init__(self, sample_rate=44100, buffer_size=2048, fade_samples=500,
+                 lookahead=None, sink: Optional[AudioSink] = None):
         self.sample_rate = sample_rate
         self.buffer_size = buffer_size
         self.fade_samples = fade_samples
-        self.stream: Optional[sd.OutputStream] = None
+        self.sink = sink or SoundDeviceSink()
+        self._sink_open = False
+        # Audio waiting for the device; the stream plays silence when empty.
+        # Room for up to a second, of which ``lookahead`` samples are used
+        self.ring = RingBuffer(max(sample_rate, buffer_size * 4))
+        self.stats = PlaybackStats(sample_rate)
+        self.active = False
+        self.set_lookahead(lookahead or buffer_size * 4)
 
     def crossfade(self, s1: np.ndarray, s2: np.ndarray) -> np.ndarray:
         fade_len = min(len(s1), len(s2), self.fade_samples)
@@ -18,7 +409,8 @@ class AudioEngine:
         result[-fade_len:] = (s1[-fade_len:] * (1 - fade)) + (s2[:fade_len] * fade)
         return result
 
-    def create_stream(self) -> sd.OutputStream:
+    def create_stream(self):
+        import sounddevice as sd
         return sd.OutputStream(
             samplerate=self.sample_rate,
             channels=1,
@@ -26,9 +418,60 @@ class AudioEngine:
             blocksize=self.buffer_size
         )
 
-    def write_wav(self, data: np.ndarray, filename: str):
-        with wave.open(filename, 'w') as f:
-            f.setnchannels(1)
-            f.setsampwidth(2)
-            f.setframerate(self.sample_rate)
-            f.writeframes((data * 32767).astype(np.int16).tobytes())
\ No newline at end of file
+    def _callback(self, outdata, frames, time, status):
+        out = outdata[:, 0]
+        n = self.ring.read_into(out)
+        out[n:] = 0
+        self.stats.record_callback(frames, n, len(self.ring), self.active)
+
+    def clock(self) -> int:
+        """Position of the audio now being heard, in samples queued since startup"""
+        return max(0, self.ring.read - self.sink.latency)
+
+    def set_lookahead(self, samples: int):
+        """How much audio the producer may queue ahead of the device"""
+        self.lookahead = int(min(max(samples, 1), self.ring.capacity))
+        self.ring.limit = self.lookahead
+
+    def start(self):
+        """Open the sink once and keep it running for the session"""
+        if not self._sink_open:
+            self.sink.open(self)
+            self._sink_open = True
+
+    def set_sink(self, sink: AudioSink):
+        """Send output somewhere else from now on"""
+        was_open = self._sink_open
+        self.close()
+        self.sink = sink
+        if was_open:
+            self.start()
+
+    def write(self, block: np.ndarray, stop_event: Optional[threading.Event] = None) -> int:
+        """Queue audio for the warm stream, waiting while the buffer is full"""
+        self.start()
+        self.active = True
+        return self.ring.write(block, stop_event)
+
+    def silence(self):
+        """Drop queued audio so the stream goes quiet at the next callback"""
+        self.active = False
+        self.ring.clear()
+
+    def close(self):
+        if self._sink_open:
+            self.sink.close()
+            self._sink_open = False
+
+    def open_wav(self, filename: str, channels: int = 1, sample_format: str = 'int16',
+                 dither: bool = False, resume_frames: Optional[int] = None) -> WavWriter:
+        return WavWriter(filename, self.sample_rate, channels, sample_format, dither, resume_frames)
+
+    def write_wav(self, data: np.ndarray, filename: str, sample_format: str = 'int16',
+                  block_size: int = 65536):
+        # Write block by block so a long (possibly memory-mapped) render
+        # never needs a second full-length converted copy
+        channels = 1 if data.ndim == 1 else data.shape[1]
+        with self.open_wav(filename, channels, sample_format) as writer:
+            for i in range(0, len(data), block_size):
+                writer.write(data[i:i + block_size])
@@ -0,0 +1,690 @@
+import os
+import json
+import hashlib
+import queue
+import tempfile
+import threading
+import time
+import logging
+from typing import Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .renderer import RenderState
+
+logger = logging.getLogger(__name__)
+
+
+def db_to_gain(db: float) -> float:
+    return 10 ** (db / 20)
+
+
+def gain_to_db(gain: float) -> float:
+    return 20 * np.log10(gain) if gain > 0 else float('-inf')
+
+
+def _sliding_min(a: np.ndarray, width: int) -> np.ndarray:
+    """Minimum over every window of ``width`` samples (len(a) - width + 1 values)"""
+    out = a
+    span = 1
+    while span * 2 <= width:
+        out = np.minimum(out[:-span], out[span:])
+        span *= 2
+    if span < width:
+        n = len(a) - width + 1
+        out = np.minimum(out[:n], out[width - span:width - span + n])
+    return out
+
+
+def _interpolation_filter(factor: int, taps_per_phase: int = 12) -> np.ndarray:
+    """Windowed-sinc interpolation filter split into ``factor`` phases"""
+    n = np.arange(factor * taps_per_phase) - (factor * taps_per_phase - 1) / 2
+    h = np.sinc(n / factor) * np.kaiser(len(n), 8.0)
+    h /= h.sum() / factor
+    return h.reshape(taps_per_phase, factor).T.copy()
+
+
+class LoudnessStats:
+    def __init__(self, peak: float, true_peak: float, rms: float, samples: int):
+        self.peak = peak
+        self.true_peak = true_peak
+        self.rms = rms
+        self.samples = samples
+
+    def __repr__(self):
+        return (f"LoudnessStats(peak={gain_to_db(self.peak):.2f} dBFS, "
+                f"true_peak={gain_to_db(self.true_peak):.2f} dBTP, "
+                f"rms={gain_to_db(self.rms):.2f} dBFS, samples={self.samples})")
+
+
+class LookaheadLimiter:
+    """Brickwall peak limiter working on consecutive blocks.
+
+    Output is delayed by ``lookahead`` samples so gain reduction can ramp
+    in before a peak arrives. Call ``flush`` after the last block to get
+    the delayed tail.
+    """
+
+    def __init__(self, ceiling: float = 1.0, lookahead: int = 220, channels: int = 1):
+        self.ceiling = ceiling
+        self.lookahead = max(1, int(lookahead))
+        self.channels = channels
+        shape = (self.lookahead,) if channels == 1 else (self.lookahead, channels)
+        self._delay = np.zeros(shape, dtype=np.float32)
+        self._required = np.ones(self.lookahead)
+        self._minima = np.ones(self.lookahead)
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        L = self.lookahead
+        level = np.abs(block) if block.ndim == 1 else np.abs(block).max(axis=1)
+        required = np.minimum(1.0, self.ceiling / np.maximum(level, 1e-12))
+
+        # Hold the smallest required gain over the look-ahead window, then
+        # smooth it with a box filter of the same length. Every value that
+        # is averaged already covers the delayed sample, so the ramp never
+        # lets it exceed the ceiling.
+        required = np.concatenate([self._required, required])
+        minima = np.concatenate([self._minima, _sliding_min(required, L + 1)])
+        csum = np.concatenate([[0.0], np.cumsum(minima)])
+        gain = (csum[L + 1:] - csum[:-L - 1]) / (L + 1)
+        self._required = required[-L:]
+        self._minima = minima[-L:]
+
+        delayed = np.concatenate([self._delay, block.astype(np.float32)])
+        self._delay = delayed[-L:]
+        delayed = delayed[:len(block)]
+        if delayed.ndim == 2:
+            gain = gain[:, None]
+        return (delayed * gain).astype(np.float32)
+
+    def flush(self) -> np.ndarray:
+        shape = (self.lookahead,) if self.channels == 1 else (self.lookahead, self.channels)
+        return self.process(np.zeros(shape, dtype=np.float32))
+
+
+class ScratchRender:
+    """A render held in a memory-mapped float32 scratch file.
+
+    Acts as a writer for ``Renderer.render_to``. Once closed, the samples
+    can be measured and exported any number of times, at different gains,
+    without re-rendering and without loading the whole signal into RAM.
+
+    A fixed ``path`` keeps the scratch file where a checkpointed export can
+    find it again; ``resume_frames`` reopens it and truncates it to that
+    many frames.
+    """
+
+    def __init__(self, channels: int = 1, scratch_dir: Optional[str] = None,
+                 block_size: int = 65536, path: Optional[str] = None,
+                 resume_frames: Optional[int] = None):
+        self.channels = channels
+        self.block_size = block_size
+        self.frames_written = 0
+        if path is None:
+            fd, self.path = tempfile.mkstemp(suffix='.f32', dir=scratch_dir)
+            self._file = os.fdopen(fd, 'wb')
+        else:
+            self.path = path
+            self._file = open(path, 'wb' if resume_frames is None else 'r+b')
+        if resume_frames is not None:
+            self._file.seek(resume_frames * self.frame_bytes)
+            self._file.truncate()
+            self.frames_written = resume_frames
+        self._data: Optional[np.memmap] = None
+        self._stats: Optional[LoudnessStats] = None
+
+    @property
+    def frame_bytes(self) -> int:
+        return self.channels * np.dtype(np.float32).itemsize
+
+    def write(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.float32)
+        self._file.write(block.tobytes())
+        self.frames_written += len(block)
+
+    def overwrite(self, frame: int, block: np.ndarray):
+        """Replace already written frames starting at ``frame``"""
+        block = np.asarray(block, dtype=np.float32)
+        if frame + len(block) > self.frames_written:
+            raise ValueError("Cannot overwrite past the end of the written data")
+        self.close()
+        self._data = None
+        self._stats = None
+        with open(self.path, 'r+b') as f:
+            f.seek(frame * self.frame_bytes)
+            f.write(block.tobytes())
+
+    def flush(self):
+        if self._file is not None:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    @property
+    def data(self) -> np.ndarray:
+        self.close()
+        if self._data is None:
+            if self.frames_written == 0:
+                return np.zeros(0, dtype=np.float32)
+            shape = (self.frames_written,) if self.channels == 1 else (self.frames_written, self.channels)
+            self._data = np.memmap(self.path, dtype=np.float32, mode='r', shape=shape)
+        return self._data
+
+    def _blocks(self):
+        data = self.data
+        for i in range(0, len(data), self.block_size):
+            yield data[i:i + self.block_size]
+
+    def measure(self, oversample: int = 4) -> LoudnessStats:
+        """Measure sample peak, true peak and RMS in a single chunked pass"""
+        if self._stats is not None:
+            return self._stats
+
+        phases = _interpolation_filter(oversample)
+        taps = phases.shape[1]
+        history = np.zeros((taps - 1,) + self.data.shape[1:], dtype=np.float64)
+        peak = true_peak = 0.0
+        sum_squares = 0.0
+        for block in self._blocks():
+            block = np.asarray(block, dtype=np.float64)
+            peak = max(peak, float(np.abs(block).max(initial=0.0)))
+            sum_squares += float(np.square(block).sum())
+
+            # Inter-sample peaks from each phase of the interpolation filter
+            extended = np.concatenate([history, block])
+            history = extended[-(taps - 1):]
+            channels = extended.reshape(len(extended), -1).T
+            for phase in phases:
+                for channel in channels:
+                    interp = np.convolve(channel, phase, mode='valid')
+                    true_peak = max(true_peak, float(np.abs(interp).max(initial=0.0)))
+
+        count = self.data.size
+        rms = float(np.sqrt(sum_squares / count)) if count else 0.0
+        self._stats = LoudnessStats(peak, max(peak, true_peak), rms, len(self.data))
+        logger.info(f"Measured render: {self._stats}")
+        return self._stats
+
+    def export(self, writer, target_peak_db: float = -1.0, target_rms_db: Optional[float] = None,
+               limit: bool = True, lookahead_ms: float = 5.0, sample_rate: int = 44100) -> float:
+        """Apply loudness normalization while streaming into ``writer``.
+
+        Gain brings the true peak to ``target_peak_db``, or the RMS to
+        ``target_rms_db`` when given. With ``limit`` a look-ahead limiter
+        holds peaks at the ceiling; without it the gain is reduced instead
+        so nothing clips. Returns the applied gain.
+        """
+        stats = self.measure()
+        ceiling = db_to_gain(target_peak_db)
+        if target_rms_db is not None and stats.rms > 0:
+            gain = db_to_gain(target_rms_db) / stats.rms
+        elif stats.true_peak > 0:
+            gain = ceiling / stats.true_peak
+        else:
+            gain = 1.0
+
+        needs_limiting = stats.true_peak * gain > ceiling * (1 + 1e-6)
+        if needs_limiting and not limit:
+            gain = ceiling / stats.true_peak
+            needs_limiting = False
+        logger.info(f"Normalizing with gain {gain_to_db(gain):+.2f} dB"
+                    f"{' and limiting' if needs_limiting else ''}")
+
+        limiter = None
+        if needs_limiting:
+            lookahead = int(sample_rate * lookahead_ms / 1000)
+            limiter = LookaheadLimiter(ceiling, lookahead, self.channels)
+
+        # The limiter's output lags by its look-ahead; skip that many leading
+        # samples and flush the tail so the export lines up with the render
+        skip = limiter.lookahead if limiter else 0
+        for block in self._blocks():
+            block = np.asarray(block, dtype=np.float32) * np.float32(gain)
+            if limiter:
+                block = limiter.process(block)
+                trimmed = min(skip, len(block))
+                block = block[trimmed:]
+                skip -= trimmed
+            if len(block):
+                writer.write(block)
+        if limiter:
+            writer.write(limiter.flush()[skip:])
+        return gain
+
+    def discard(self):
+        self.close()
+        self._data = None
+        try:
+            os.remove(self.path)
+        except OSError as e:
+            logger.error(f"Error removing scratch file: {e}")
+
+
+class ExportProgress:
+    """A progress report posted by an ExportJob.
+
+    ``state`` is one of 'render', 'normalize', 'done', 'cancelled' or
+    'error'.
+    """
+
+    def __init__(self, state: str, rows_done: int = 0, total_rows: int = 0,
+                 realtime_factor: float = 0.0, eta: Optional[float] = None,
+                 error: Optional[str] = None):
+        self.state = state
+        self.rows_done = rows_done
+        self.total_rows = total_rows
+        self.realtime_factor = realtime_factor
+        self.eta = eta
+        self.error = error
+
+    @property
+    def finished(self) -> bool:
+        return self.state in ('done', 'cancelled', 'error')
+
+    @property
+    def fraction(self) -> float:
+        return self.rows_done / self.total_rows if self.total_rows else 0.0
+
+
+def song_hashes(renderer) -> Tuple[str, List[str]]:
+    """Content hashes of what ``renderer`` renders.
+
+    The first covers the formula, globals and timing every entry depends
+    on; the list has one hash per play order entry, of its pattern's cells.
+    """
+    def digest(*parts) -> str:
+        h = hashlib.sha1()
+        for part in parts:
+            h.update(repr(part).encode())
+            h.update(b'\0')
+        return h.hexdigest()
+
+    song_hash = digest(renderer.formula_text, renderer.globals_text, renderer.speed,
+                       renderer.samples_per_row, renderer.oversample)
+    return song_hash, [digest(renderer.patterns.get(num)) for num in renderer.order_list]
+
+
+class ExportCheckpoint:
+    """Render state recorded at each play order boundary of an export.
+
+    Stored as JSON next to the output file. Each entry holds the
+    RenderState at the start of an order entry and the number of frames
+    written to the render target at that point. An entry at
+    ``len(order_list)`` marks the end of the render. The output's sample
+    format and channel count are kept too, since frames written in one
+    format cannot be continued in another, and so are the song's content
+    hashes from ``song_hashes``, so edits made since are noticed.
+    """
+
+    def __init__(self, path: str, order_list: List[int], sample_rate: int, normalize: bool,
+                 entries: Optional[Dict[int, Dict[str, object]]] = None,
+                 sample_format: Optional[str] = 'int16', channels: Optional[int] = 1,
+                 song_hash: Optional[str] = None, entry_hashes: Optional[List[str]] = None):
+        self.path = path
+        self.order_list = list(order_list)
+        self.sample_rate = sample_rate
+        self.normalize = normalize
+        self.sample_format = sample_format
+        self.channels = channels
+        self.song_hash = song_hash
+        self.entry_hashes = list(entry_hashes or [])
+        self.entries: Dict[int, Dict[str, object]] = dict(entries or {})
+
+    @staticmethod
+    def path_for(export_path: str) -> str:
+        return export_path + '.checkpoint.json'
+
+    @staticmethod
+    def scratch_path_for(export_path: str) -> str:
+        return export_path + '.render.f32'
+
+    @classmethod
+    def load(cls, path: str) -> Optional['ExportCheckpoint']:
+        try:
+            with open(path) as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        entries = {int(index): entry for index, entry in data['entries'].items()}
+        # Checkpoints from before formats and hashes were recorded never match
+        return cls(path, data['order_list'], data['sample_rate'], data['normalize'], entries,
+                   data.get('sample_format'), data.get('channels'), data.get('song_hash'),
+                   data.get('entry_hashes'))
+
+    def save(self):
+        data = {
+            'order_list': self.order_list,
+            'sample_rate': self.sample_rate,
+            'normalize': self.normalize,
+            'sample_format': self.sample_format,
+            'channels': self.channels,
+            'song_hash': self.song_hash,
+            'entry_hashes': self.entry_hashes,
+            'entries': {str(index): entry for index, entry in self.entries.items()},
+        }
+        # Write then rename so a crash never leaves a half-written checkpoint
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(data, f)
+        os.replace(tmp_path, self.path)
+
+    def record(self, state: RenderState, frames: int):
+        # Anything after this boundary is about to be rewritten
+        self.entries = {i: e for i, e in self.entries.items() if i < state.order_index}
+        self.entries[state.order_index] = {'state': state.to_dict(), 'frames': frames}
+        self.save()
+
+    def matches(self, order_list: List[int], sample_rate: int, normalize: bool,
+                sample_format: str = 'int16', channels: int = 1,
+                song_hash: Optional[str] = None) -> bool:
+        """True if this export can be continued; edited patterns are left to ``changed``"""
+        return (self.order_list == list(order_list) and self.sample_rate == sample_rate
+                and self.normalize == normalize and self.sample_format == sample_format
+                and self.channels == channels and self.song_hash == song_hash)
+
+    def changed(self, entry_hashes: List[str]) -> List[int]:
+        """Already rendered order entries whose pattern has been edited since"""
+        rendered = range(min(self.latest() or 0, len(self.order_list)))
+        return [index for index in rendered
+                if index >= len(self.entry_hashes) or index >= len(entry_hashes)
+                or self.entry_hashes[index] != entry_hashes[index]]
+
+    @property
+    def complete(self) -> bool:
+        return len(self.order_list) in self.entries
+
+    def latest(self) -> Optional[int]:
+        return max(self.entries, default=None)
+
+    def state(self, order_index: int) -> RenderState:
+        return RenderState.from_dict(self.entries[order_index]['state'])
+
+    def frames(self, order_index: int) -> int:
+        return self.entries[order_index]['frames']
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ExportJob:
+    """Render a song to a WAV file on a worker thread.
+
+    Progress reports go to ``self.progress``, a thread-safe queue the UI
+    can poll. ``cancel`` stops the job at the next row.
+
+    Without checkpoints a cancelled or failed export removes its partial
+    file. With ``checkpoints`` the render state is saved at every play
+    order boundary and the partial output is kept, so a later job with
+    ``resume`` continues from the last completed pattern, or from the
+    first one edited since if that comes earlier. A finished export kept
+    with ``keep_checkpoint`` whose only edit is one pattern is patched in
+    place with ``rerender``.
+
+    A renderer built with ``track_memory`` records the peak memory of the
+    render and normalize stages in its ``memory`` tracker, logged when
+    the job ends.
+    """
+
+    def __init__(self, renderer, path: str, open_writer: Callable[..., object],
+                 normalize: bool = True, target_peak_db: float = -1.0,
+                 target_rms_db: Optional[float] = None, report_interval: float = 0.1,
+                 checkpoints: bool = False, resume: bool = False,
+                 keep_checkpoint: bool = False, sample_format: str = 'int16', channels: int = 1):
+        self.renderer = renderer
+        self.path = path
+        self.open_writer = open_writer
+        # What ``open_writer`` produces, recorded so a resume never mixes formats
+        self.sample_format = sample_format
+        self.channels = channels
+        self.normalize = normalize
+        self.target_peak_db = target_peak_db
+        self.target_rms_db = target_rms_db
+        self.report_interval = report_interval
+        self.checkpoints = checkpoints or resume
+        self.resume = resume
+        self.keep_checkpoint = keep_checkpoint
+        self.progress: "queue.Queue[ExportProgress]" = queue.Queue()
+        self._cancel = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.checkpoint: Optional[ExportCheckpoint] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, daemon=True)
+        self._thread.start()
+
+    def cancel(self):
+        self._cancel.set()
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _render(self, target, start: Optional[RenderState] = None) -> bool:
+        """Stream rows into ``target``; returns False when cancelled"""
+        renderer = self.renderer
+        sample_rate = renderer.sample_rate
+        renderer.prepare()
+        total_rows = total_samples = 0
+        for *_, num_samples in renderer.control_rows():
+            total_rows += 1
+            total_samples += num_samples
+        rows_done = samples_done = 0
+        if start is not None:
+            # Count the rows already on disk so progress starts where it left off
+            for *_, num_samples in renderer.control_rows(end_order=start.order_index):
+                rows_done += 1
+                samples_done += num_samples
+
+        def pattern_started(state: RenderState):
+            if self.checkpoint is not None:
+                target.flush()
+                self.checkpoint.record(state, target.frames_written)
+
+        gain = 1.0 if self.normalize else 0.5
+        started = last_report = time.perf_counter()
+        started_samples = samples_done
+        with renderer.memory.stage('render'):
+            for _, _, block in renderer.iter_rows(start, on_pattern=pattern_started):
+                if self._cancel.is_set():
+                    return False
+                if gain != 1.0:
+                    block *= gain
+                target.write(block)
+                rows_done += 1
+                samples_done += len(block)
+
+                now = time.perf_counter()
+                if now - last_report >= self.report_interval or rows_done == total_rows:
+                    last_report = now
+                    elapsed = now - started
+                    # Seconds of audio rendered per second of wall time
+                    rendered = samples_done - started_samples
+                    realtime_factor = rendered / sample_rate / elapsed if elapsed > 0 else 0.0
+                    eta = ((total_samples - samples_done) / sample_rate / realtime_factor
+                           if realtime_factor > 0 else None)
+                    self.progress.put(ExportProgress('render', rows_done, total_rows,
+                                                     realtime_factor, eta))
+
+        if self._cancel.is_set():
+            return False
+        if self.checkpoint is not None:
+            target.flush()
+            end = RenderState(len(renderer.order_list), t=renderer.t, phases=renderer.formula.phases)
+            self.checkpoint.record(end, target.frames_written)
+        return True
+
+    def load_checkpoint(self) -> Optional[ExportCheckpoint]:
+        """The checkpoint of an earlier export of this song to this path, if any"""
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(self.path))
+        if checkpoint is None or checkpoint.latest() is None:
+            return None
+        if not self._matches(checkpoint):
+            logger.warning("Checkpoint does not match this song or output format; starting over")
+            return None
+        return checkpoint
+
+    def _matches(self, checkpoint: ExportCheckpoint, content: bool = True) -> bool:
+        song_hash = song_hashes(self.renderer)[0] if content else checkpoint.song_hash
+        return checkpoint.matches(self.renderer.order_list, self.renderer.sample_rate,
+                                  self.normalize, self.sample_format, self.channels, song_hash)
+
+    def _patch(self, checkpoint: ExportCheckpoint) -> bool:
+        """Re-render the one edited entry of a finished export; False to resume instead"""
+        changed = checkpoint.changed(song_hashes(self.renderer)[1])
+        if not checkpoint.complete or len(changed) != 1:
+            return False
+        try:
+            return self.rerender(changed[0])
+        except ValueError as e:
+            logger.info(f"Cannot patch the export in place: {e}")
+            return False
+
+    def _open_target(self, resume_frames: Optional[int]):
+        """Open the file rows are rendered into: the scratch render or the WAV itself"""
+        if not self.normalize:
+            if resume_frames is None:
+                return self.open_writer(self.path)
+            return self.open_writer(self.path, resume_frames=resume_frames)
+        scratch_path = ExportCheckpoint.scratch_path_for(self.path) if self.checkpoints else None
+        return ScratchRender(path=scratch_path, resume_frames=resume_frames)
+
+    def run(self):
+        writer = None
+        target = None
+        state = 'done'
+        error = None
+        try:
+            start = None
+            resume_frames = None
+            if self.checkpoints:
+                self.checkpoint = self.load_checkpoint() if self.resume else None
+                if self.checkpoint is not None and self._patch(self.checkpoint):
+                    return
+                song_hash, entry_hashes = song_hashes(self.renderer)
+                if self.checkpoint is not None:
+                    latest = self.checkpoint.latest()
+                    changed = self.checkpoint.changed(entry_hashes)
+                    if changed:
+                        logger.info(f"Order position {changed[0]} was edited since the export")
+                        latest = min(latest, changed[0])
+                    # Everything from ``latest`` on is rendered again with the current song
+                    self.checkpoint.entry_hashes = entry_hashes
+                    start = self.checkpoint.state(latest)
+                    resume_frames = self.checkpoint.frames(latest)
+                    logger.info(f"Resuming export at order position {latest}, frame {resume_frames}")
+                else:
+                    self.checkpoint = ExportCheckpoint(
+                        ExportCheckpoint.path_for(self.path), self.renderer.order_list,
+                        self.renderer.sample_rate, self.normalize,
+                        sample_format=self.sample_format, channels=self.channels,
+                        song_hash=song_hash, entry_hashes=entry_hashes
+                    )
+
+            target = self._open_target(resume_frames)
+            if start is not None and start.order_index >= len(self.renderer.order_list):
+                completed = True  # rendering finished before the interruption
+            else:
+                completed = self._render(target, start)
+
+            if completed and self.normalize:
+                self.progress.put(ExportProgress('normalize'))
+                writer = self.open_writer(self.path)
+                with self.renderer.memory.stage('normalize'):
+                    target.export(writer, self.target_peak_db, self.target_rms_db,
+                                  sample_rate=self.renderer.sample_rate)
+            if not completed:
+                state = 'cancelled'
+        except Exception as e:
+            logger.error(f"Error exporting audio: {e}", exc_info=True)
+            state = 'error'
+            error = str(e)
+        finally:
+            if writer is not None:
+                writer.close()
+            if target is not None:
+                target.close()
+            self._finish(state, target)
+            if self.renderer.memory.enabled:
+                logger.info(f"Export peak memory by stage: {self.renderer.memory.report()}")
+            self.progress.put(ExportProgress(state, error=error))
+
+    def _finish(self, state: str, target):
+        keep_files = self.checkpoint is not None and (state != 'done' or self.keep_checkpoint)
+        if keep_files:
+            return
+        if self.normalize and target is not None:
+            target.discard()
+        elif self.normalize and self.checkpoint is not None:
+            # Patched in place by ``rerender``, which closes its own scratch render
+            scratch_path = ExportCheckpoint.scratch_path_for(self.path)
+            if os.path.exists(scratch_path):
+                os.remove(scratch_path)
+        if self.checkpoint is not None:
+            self.checkpoint.remove()
+        if state != 'done' and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def rerender(self, order_index: int) -> bool:
+        """Re-render one play order entry in place from the kept checkpoint.
+
+        The entry must render to the same number of samples as before.
+        Returns False if it changed the state the following entries start
+        from, in which case they need re-rendering as well. Content hashes
+        are not checked: the entry is re-rendered with the current song
+        even if other edits were made since.
+        """
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(self.path))
+        if checkpoint is None or order_index not in checkpoint.entries \
+                or order_index + 1 not in checkpoint.entries:
+            raise ValueError(f"No checkpoints around order position {order_index}")
+        if not self._matches(checkpoint, content=False):
+            raise ValueError("Checkpoint does not match this song or output format")
+
+        renderer = self.renderer
+        renderer.prepare()
+        start_frame = checkpoint.frames(order_index)
+        span = checkpoint.frames(order_index + 1) - start_frame
+        gain = 1.0 if self.normalize else 0.5
+        blocks = [block for _, _, block in renderer.iter_rows(checkpoint.state(order_index),
+                                                              end_order=order_index + 1)]
+        audio = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+        if len(audio) != span:
+            raise ValueError(f"Order position {order_index} now renders {len(audio)} samples "
+                             f"instead of {span}; resume from there instead")
+
+        end_state = {}
+        for *_, vars_dict, _ in renderer.control_rows(checkpoint.state(order_index),
+                                                      end_order=order_index + 1):
+            end_state = RenderState(order_index + 1, vars_dict).to_dict()['vars']
+        # Nothing follows the last entry, and its end record holds no variables
+        unchanged = (order_index + 1 == len(checkpoint.order_list)
+                     or end_state == checkpoint.state(order_index + 1).vars)
+
+        if self.normalize:
+            target = ScratchRender(path=ExportCheckpoint.scratch_path_for(self.path),
+                                   resume_frames=checkpoint.frames(len(checkpoint.order_list)))
+            target.overwrite(start_frame, audio)
+            with self.open_writer(self.path) as writer:
+                target.export(writer, self.target_peak_db, self.target_rms_db,
+                              sample_rate=renderer.sample_rate)
+            target.close()
+        else:
+            with self.open_writer(self.path, resume_frames=checkpoint.frames(len(checkpoint.order_list))) as writer:
+                writer.overwrite(start_frame, audio * gain)
+        if not unchanged:
+            logger.warning(f"Order position {order_index} now ends in a different state; "
+                           f"later patterns may need re-rendering")
+        elif order_index < len(checkpoint.entry_hashes):
+            # Left stale otherwise, so a resume starts over from this entry
+            checkpoint.entry_hashes[order_index] = song_hashes(renderer)[1][order_index]
+            checkpoint.save()
+        return unchanged
@@ -1,5 +1,5 @@
 # Basic system variables
-s = 44100  # sample rate
+s = 44100  # sample rate; the renderer sets this to the rate it renders at
 f = 432    # base frequency
 
 import numpy as np
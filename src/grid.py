@@ -1,21 +1,48 @@
 import tkinter as tk
 from tkinter import ttk
 import re
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+
+from .renderer import playback_values
 
 class Grid:
+    """Pattern editor drawn on a canvas, one text item per visible cell.
+
+    Cell values live in ``data``; only the rows in the viewport are drawn,
+    using a fixed pool of canvas items that are relabelled as the view
+    scrolls. A single Entry overlays the focused cell for typing, so the
+    widget count does not grow with the pattern.
+    """
+
+    row_height = 22
+    col_width = 44
+    header_height = 22
+
     def __init__(self, parent: ttk.Frame, canvas: tk.Canvas):
         self.parent = parent
         self.grid_frame = parent
         self.canvas = canvas  # Store canvas reference
-        self.cells: List[List[ttk.Entry]] = []
+        self.data: List[List[str]] = []
         self.current_row = 0
         self.current_col = 0
         self.editing = False
         self.column_vars: Dict[int, str] = {}
         self.num_columns = 32
         self.cell_width = 4
-        self.current_cell: Optional[ttk.Entry] = None
+        self.current_cell: Optional[Tuple[int, int]] = None
+        self.playhead_row: Optional[int] = None
+        # Recycled canvas items: one (rectangle, text) pair per column for
+        # each visible row slot; row r is drawn in slot r % len(slots)
+        self._slots: List[List[Tuple[int, int]]] = []
+        self._slot_rows: List[Optional[int]] = []
+        self._header_items: List[int] = []
+        # Scrolling and redraws requested while handling input are run once,
+        # when Tk is next idle; the view height is kept from <Configure>
+        self._view_height = self.row_height
+        self._scroll_target: Optional[int] = None
+        self._scroll_after: Optional[str] = None
+        self._redraw_after: Optional[str] = None
+        self._redraw_force = False
         self._setup_ui()
 
     def _setup_ui(self):
@@ -46,81 +73,273 @@ class Grid:
         self.preview_text.bind('<Button-1>', self.enter_edit_mode)
 
     def _setup_grid_frame(self):
-        self.grid_frame = ttk.Frame(self.container)
-        self.grid_frame.pack(fill=tk.BOTH, expand=True)
-
-        # Add column headers
+        canvas = self.canvas
+        canvas.configure(background="white", yscrollincrement=self.row_height)
+        canvas.bind('<Configure>', self._on_configure)
+        canvas.bind('<Button-1>', self._on_click)
+        canvas.bind('<MouseWheel>', self._on_mousewheel)
+        canvas.bind('<Button-4>', lambda e: self.yview('scroll', -3, 'units'))
+        canvas.bind('<Button-5>', lambda e: self.yview('scroll', 3, 'units'))
+
+        # Column headers stay pinned to the top of the view
         for i in range(self.num_columns):
-            ttk.Label(self.grid_frame, text=str(i+1), width=self.cell_width).grid(
-                row=0, column=i, padx=1, pady=1
-            )
+            x0 = i * self.col_width
+            self._header_items.append(canvas.create_rectangle(
+                x0, 0, x0 + self.col_width, self.header_height,
+                fill="#e9ecef", outline="#ced4da", tags=('header',)))
+            self._header_items.append(canvas.create_text(
+                x0 + self.col_width / 2, self.header_height / 2, text=str(i + 1),
+                tags=('header',)))
+
+        # The one real Entry, moved onto whichever cell has focus
+        self.editor = ttk.Entry(canvas, width=self.cell_width)
+        self.editor.bind('<Return>', self.handle_return)
+        self.editor.bind('<KeyPress>', self.handle_keypress)
+        self.editor.bind('<KeyRelease>', self._on_editor_change)
+        self.editor.bind('<Tab>', self.handle_tab)
+        self.editor.bind('<Shift-Tab>', self.handle_shift_tab)
+        self._editor_window = canvas.create_window(0, 0, window=self.editor, anchor='nw',
+                                                   width=self.col_width,
+                                                   height=self.row_height, state='hidden')
+
+        # Playhead: one outline moved from row to row during playback
+        self._playhead = canvas.create_rectangle(0, 0, 0, 0, outline="#ff6b6b", width=2,
+                                                 state='hidden')
+
+    @property
+    def num_rows(self) -> int:
+        return len(self.data)
 
     def update(self, rows: int, existing: Optional[List[List[str]]] = None):
         """Update grid with proper handling of 32 columns"""
         # Default first row with extended columns
         defaults = ["{x}", "{v}", "{speed}"] + [""] * (self.num_columns - 3)
 
-        # Store current focus position if any cell is focused
-        focused = self.grid_frame.focus_get()
-        was_focused = isinstance(focused, ttk.Entry) and focused in [cell for row in self.cells for cell in row]
+        data = []
+        for r in range(rows):
+            old = self.data[r] if r < len(self.data) else [""] * self.num_columns
+            row = []
+            for c in range(self.num_columns):
+                if existing and r < len(existing) and c < len(existing[r]):
+                    row.append(existing[r][c])
+                elif r == 0:
+                    row.append(defaults[c])
+                else:
+                    row.append(old[c])
+            data.append(row)
+        self.data = data
+
+        self.current_row = min(self.current_row, max(0, rows - 1))
+        self.current_col = min(self.current_col, self.num_columns - 1)
+        self.canvas.configure(scrollregion=(
+            0, 0, self.num_columns * self.col_width,
+            self.header_height + rows * self.row_height))
+        self.redraw(force=True)
+        if self.current_cell is not None:
+            self.current_cell = (self.current_row, self.current_col)
+            self._place_editor()
+
+    def load(self, rows: List[List[str]]) -> int:
+        """Show another pattern, touching only the cells that differ.
+
+        Returns the number of cells that changed.
+        """
+        changed = 0
+        old_len = len(self.data)
+        del self.data[len(rows):]
+        for r, source in enumerate(rows):
+            if r >= len(self.data):
+                self.data.append([""] * self.num_columns)
+            target = self.data[r]
+            for c in range(self.num_columns):
+                value = source[c] if c < len(source) else ""
+                if target[c] != value:
+                    target[c] = value
+                    changed += 1
+                    self._draw_cell(r, c)
+
+        if len(rows) != old_len:
+            self.current_row = min(self.current_row, max(0, len(rows) - 1))
+            self.canvas.configure(scrollregion=(
+                0, 0, self.num_columns * self.col_width,
+                self.header_height + len(rows) * self.row_height))
+            self.redraw(force=True)
+        if self.current_cell is not None:
+            self.current_cell = (self.current_row, self.current_col)
+            self._place_editor()
+            self.show_cell_content(self.current_row, self.current_col)
+        return changed
+
+    def clear(self):
+        """Blank every cell"""
+        self.data = [[""] * self.num_columns for _ in self.data]
+        self.redraw(force=True)
+        self._place_editor()
+
+    def get_value(self, row: int, col: int) -> str:
+        return self.data[row][col]
+
+    def set_value(self, row: int, col: int, value: str):
+        """Set a cell without triggering edit callbacks"""
+        self.data[row][col] = value
+        self._draw_cell(row, col)
+        if self.current_cell == (row, col) and self.editor.get() != value:
+            self.editor.delete(0, tk.END)
+            self.editor.insert(0, value)
+
+    def yview(self, *args):
+        """Scroll the view; hooked up to the vertical scrollbar"""
+        self.canvas.yview(*args)
+        self.schedule_redraw()
+
+    def _on_configure(self, event):
+        self._view_height = max(event.height, self.row_height)
+        self.schedule_redraw(force=True)
+
+    def schedule_redraw(self, force: bool = False):
+        """Redraw once when idle, however many times this is called before"""
+        self._redraw_force = self._redraw_force or force
+        if self._redraw_after is None:
+            self._redraw_after = self.canvas.after_idle(self._run_redraw)
+
+    def _run_redraw(self):
+        self._redraw_after = None
+        force, self._redraw_force = self._redraw_force, False
+        self.redraw(force)
+
+    def _on_mousewheel(self, event):
+        self.yview('scroll', int(-event.delta / 120) * 3, 'units')
+
+    def _visible_range(self) -> Tuple[int, int]:
+        top = self.canvas.canvasy(0)
+        first = max(0, int((top - self.header_height) // self.row_height))
+        return first, int(self._view_height // self.row_height) + 2
+
+    def redraw(self, force: bool = False):
+        """Draw the rows in view, relabelling only slots whose row changed"""
+        canvas = self.canvas
+        first, count = self._visible_range()
+        if count != len(self._slots):
+            for slot in self._slots:
+                for rect, text in slot:
+                    canvas.delete(rect, text)
+            self._slots = [[(canvas.create_rectangle(0, 0, 0, 0, outline="#dee2e6"),
+                             canvas.create_text(0, 0, anchor='w'))
+                            for _ in range(self.num_columns)] for _ in range(count)]
+            self._slot_rows = [None] * count
+            force = True
+
+        for r in range(first, first + count):
+            index = r % count
+            if r >= len(self.data):
+                if self._slot_rows[index] is not None or force:
+                    for rect, text in self._slots[index]:
+                        canvas.itemconfigure(rect, state='hidden')
+                        canvas.itemconfigure(text, state='hidden')
+                    self._slot_rows[index] = None
+                continue
+            if force or self._slot_rows[index] != r:
+                self._slot_rows[index] = r
+                for c in range(self.num_columns):
+                    self._draw_cell(r, c)
 
-        # Destroy excess rows if reducing row count
-        while len(self.cells) > rows:
-            for cell in self.cells[-1]:
-                cell.destroy()
-            self.cells.pop()
+        top = canvas.canvasy(0)
+        for i in range(self.num_columns):
+            x0 = i * self.col_width
+            canvas.coords(self._header_items[2 * i], x0, top, x0 + self.col_width,
+                          top + self.header_height)
+            canvas.coords(self._header_items[2 * i + 1], x0 + self.col_width / 2,
+                          top + self.header_height / 2)
+        canvas.tag_raise(self._playhead)
+        canvas.tag_raise('header')
+
+    def _draw_cell(self, row: int, col: int):
+        if not self._slots:
+            return
+        index = row % len(self._slots)
+        if self._slot_rows[index] != row:
+            return
+        rect, text = self._slots[index][col]
+        x0 = col * self.col_width
+        y0 = self.header_height + row * self.row_height
+        value = self.data[row][col]
+        if len(value) > self.cell_width + 1:
+            value = value[:self.cell_width] + "\u2026"
+        fill = "#d0ebff" if self.current_cell == (row, col) else "white"
+        self.canvas.coords(rect, x0, y0, x0 + self.col_width, y0 + self.row_height)
+        self.canvas.itemconfigure(rect, fill=fill, state='normal')
+        self.canvas.coords(text, x0 + 3, y0 + self.row_height / 2)
+        self.canvas.itemconfigure(text, text=value, state='normal')
+
+    def show_playhead(self, row: Optional[int], follow: bool = True):
+        """Outline the row being heard, scrolling to keep it in view"""
+        if row == self.playhead_row:
+            return
+        self.playhead_row = row
+        if row is None or not 0 <= row < len(self.data):
+            self.canvas.itemconfigure(self._playhead, state='hidden')
+            return
+        y0 = self.header_height + row * self.row_height
+        self.canvas.coords(self._playhead, 1, y0 + 1, self.num_columns * self.col_width - 1,
+                           y0 + self.row_height - 1)
+        self.canvas.itemconfigure(self._playhead, state='normal')
+        self.canvas.tag_raise(self._playhead)
+        self.canvas.tag_raise('header')
+
+        if follow:
+            first, count = self._visible_range()
+            # Page when the playhead reaches the bottom of the view
+            if not first + 1 <= row < first + count - 3:
+                total_height = self.header_height + len(self.data) * self.row_height
+                self.yview('moveto', max(0.0, (y0 - self.header_height - self.row_height)
+                                         / total_height))
+
+    def _place_editor(self):
+        """Move the editor onto the focused cell"""
+        if self.current_cell is None or not self.data:
+            self.canvas.itemconfigure(self._editor_window, state='hidden')
+            return
+        row, col = self.current_cell
+        self.canvas.coords(self._editor_window, col * self.col_width,
+                           self.header_height + row * self.row_height)
+        self.canvas.itemconfigure(self._editor_window, state='normal')
+        self.editor.delete(0, tk.END)
+        self.editor.insert(0, self.data[row][col])
+
+    def _on_editor_change(self, event=None):
+        """Copy typing in the editor into the model"""
+        if self.current_cell is None or self.editing:
+            return
+        row, col = self.current_cell
+        value = self.editor.get()
+        old = self.data[row][col]
+        if value != old:
+            self.data[row][col] = value
+            self._draw_cell(row, col)
+            self._on_cell_edit(row, col, old)
+
+    def _on_click(self, event):
+        x = self.canvas.canvasx(event.x)
+        y = self.canvas.canvasy(event.y)
+        if y - self.canvas.canvasy(0) < self.header_height:
+            return
+        row = int((y - self.header_height) // self.row_height)
+        col = int(x // self.col_width)
+        self.focus_cell(row, col)
 
-        # Update existing or create new rows as needed
-        if len(self.cells) < rows:
-            for r in range(len(self.cells), rows):
-                row = []
-                for c in range(self.num_columns):
-                    cell = ttk.Entry(self.grid_frame, width=self.cell_width)
-                    cell.grid(row=r+1, column=c, padx=1, pady=1)
-
-                    # Set cell value based on existing data or defaults
-                    if existing and r < len(existing) and c < len(existing[r]):
-                        cell.insert(0, existing[r][c])
-                    elif r == 0:
-                        cell.insert(0, defaults[c])
-
-                    # Add bindings
-                    cell.bind('<FocusIn>', lambda e, r=r, c=c: self.cell_focused(r, c))
-                    cell.bind('<Return>', self.handle_return)
-                    cell.bind('<KeyPress>', self.handle_keypress)
-                    cell.bind('<Tab>', self.handle_tab)
-                    cell.bind('<Shift-Tab>', self.handle_shift_tab)
-
-                    row.append(cell)
-                self.cells.append(row)
-        else:
-            # Update existing rows with new values
-            for r in range(len(self.cells)):
-                for c in range(self.num_columns):
-                    if existing and r < len(existing) and c < len(existing[r]):
-                        self.cells[r][c].delete(0, tk.END)
-                        self.cells[r][c].insert(0, existing[r][c])
-                    elif r == 0:
-                        self.cells[r][c].delete(0, tk.END)
-                        self.cells[r][c].insert(0, defaults[c])
-
-        # Restore focus if needed
-        if was_focused:
-            self.current_row = min(self.current_row, len(self.cells)-1)
-            self.current_col = min(self.current_col, self.num_columns-1)
-            self.cells[self.current_row][self.current_col].focus_set()
-
-    def _create_cell(self, row: int, col: int) -> ttk.Entry:
-        cell = ttk.Entry(self.grid_frame, width=self.cell_width)
-        cell.grid(row=row+1, column=col, padx=1, pady=1)
-
-        cell.bind('<FocusIn>', lambda e, r=row, c=col: self.cell_focused(r, c))
-        cell.bind('<Return>', self.handle_return)
-        cell.bind('<KeyPress>', self.handle_keypress)
-        cell.bind('<Tab>', self.handle_tab)
-        cell.bind('<Shift-Tab>', self.handle_shift_tab)
-
-        return cell
+    def focus_cell(self, row: int, col: int):
+        """Give a cell keyboard focus"""
+        if not (0 <= row < len(self.data) and 0 <= col < self.num_columns):
+            return
+        self._on_editor_change()
+        previous = self.current_cell
+        self.current_cell = (row, col)
+        if previous is not None and previous[0] < len(self.data):
+            self._draw_cell(*previous)
+        self._place_editor()
+        self._draw_cell(row, col)
+        self.editor.focus_set()
+        self.cell_focused(row, col)
 
     def handle_keypress(self, event):
         """Handle key events in green mode"""
@@ -138,6 +357,7 @@ class Grid:
     def handle_return(self, event):
         """Handle Return key press"""
         if not self.editing:
+            self._on_editor_change()
             self.editing = True
             self.show_indicator()
             self.preview_text.focus_set()
@@ -160,33 +380,37 @@ class Grid:
 
     def cell_focused(self, row: int, col: int):
         """Handle cell focus events and exit edit mode"""
-        if 0 <= row < len(self.cells) and 0 <= col < self.num_columns:
+        if 0 <= row < len(self.data) and 0 <= col < self.num_columns:
             self.editing = False
             self.current_row = row
             self.current_col = col
-            self.show_cell_content(self.cells[row][col])
+            self.show_cell_content(row, col)
             self.show_indicator()
-            self.center_on_cell(row, col)  # Add this line
+            self.center_on_cell(row, col)
 
     def center_on_cell(self, row, col):
-        self.grid_frame.update_idletasks()
-        cell = self.cells[row][col]
-        
-        # Get cell position relative to canvas
-        cell_y = cell.winfo_y()
-        
-        # Get canvas viewport height
-        canvas_height = self.canvas.winfo_height()
-        
-        # Calculate position to center cell
-        center_position = (cell_y - (canvas_height/2)) / self.grid_frame.winfo_height()
-        
+        # Key repeat can move focus many times per frame; scroll once for
+        # the latest cell when Tk is idle
+        self._scroll_target = row
+        if self._scroll_after is None:
+            self._scroll_after = self.canvas.after_idle(self._apply_scroll)
+
+    def _apply_scroll(self):
+        self._scroll_after = None
+        row = self._scroll_target
+        if row is None:
+            return
+        total_height = self.header_height + len(self.data) * self.row_height
+        cell_y = self.header_height + row * self.row_height
+
         # Move canvas to center on cell
-        self.canvas.yview_moveto(max(0, min(1, center_position)))
+        center_position = (cell_y - (self._view_height / 2)) / total_height
+        self.yview('moveto', max(0, min(1, center_position)))
 
     def enter_edit_mode(self, event=None):
         """Enter edit mode (red) when preview text is clicked"""
         if not self.editing:
+            self._on_editor_change()
             self.editing = True
             self.show_indicator()
             self.preview_text.focus_set()
@@ -208,17 +432,18 @@ class Grid:
 
     def finish_editing(self, event=None):
         """Exit edit mode and update cell content"""
-        if self.editing and hasattr(self, 'current_cell'):
+        if self.editing and self.current_cell is not None:
             self.last_cursor_pos = self.preview_text.index(tk.INSERT)
 
-            new_value = self.preview_text.get()
-            self.current_cell.delete(0, tk.END)
-            self.current_cell.insert(0, new_value)
-            self._on_cell_edit(self.current_row, self.current_col)
+            row, col = self.current_cell
+            old = self.data[row][col]
+            self.set_value(row, col, self.preview_text.get())
+            if self.data[row][col] != old:
+                self._on_cell_edit(row, col, old)
             self.editing = False
             self.show_indicator()
-            self.cells[self.current_row][self.current_col].focus_set()
-            self.cells[self.current_row][self.current_col].icursor(
+            self.editor.focus_set()
+            self.editor.icursor(
                 int(self.last_cursor_pos) if hasattr(self, 'last_cursor_pos') else tk.END
             )
 
@@ -227,75 +452,64 @@ class Grid:
         if self.editing:
             return
 
-        new_row = max(0, min(self.current_row + row_delta, len(self.cells) - 1))
+        new_row = max(0, min(self.current_row + row_delta, len(self.data) - 1))
         new_col = max(0, min(self.current_col + col_delta, self.num_columns - 1))
 
         if new_row != self.current_row or new_col != self.current_col:
-            self.current_row = new_row
-            self.current_col = new_col
-            self.cells[new_row][new_col].focus_set()
-            self.cells[new_row][new_col].icursor(
+            self.focus_cell(new_row, new_col)
+            self.editor.icursor(
                 int(self.last_cursor_pos) if hasattr(self, 'last_cursor_pos') else tk.END
             )
-            self.show_cell_content(self.cells[new_row][new_col])
 
     def show_indicator(self):
         """Update indicator color based on edit mode"""
         self.indicator.configure(background="#ff6b6b" if self.editing else "#69db7c")
 
-    def show_cell_content(self, cell):
+    def show_cell_content(self, row: int, col: int):
         """Update preview box with cell content"""
-        self.current_cell = cell
+        self.current_cell = (row, col)
         if self.editing:
             return
-    
-        """Store current cursor position"""
+
+        value = self.data[row][col]
         cursor_pos = self.preview_text.index(tk.INSERT)
-    
+
         self.preview_text.delete(0, tk.END)
-        self.preview_text.insert(0, cell.get())
-    
-        """Restore cursor position if within bounds"""
-        if cursor_pos <= len(cell.get()):
-            self.preview_text.icursor(cursor_pos)
+        self.preview_text.insert(0, value)
 
+        # Restore cursor position if within bounds
+        if cursor_pos <= len(value):
+            self.preview_text.icursor(cursor_pos)
 
     def update_cell_from_preview(self):
         """Update the current cell content from the preview box while editing"""
-        if self.editing and hasattr(self, 'current_cell'):
-            # Store cursor position before update
-            cursor_pos = self.preview_text.index(tk.INSERT)
-            
-            new_value = self.preview_text.get()
-            self.current_cell.delete(0, tk.END)
-            self.current_cell.insert(0, new_value)
-            
-            # Restore cursor position
-            self.preview_text.icursor(cursor_pos)
-            
-            if hasattr(self.parent, 'on_grid_edit') and callable(self.parent.on_grid_edit):
-                self.parent.on_grid_edit()
-
-    def _on_cell_edit(self, row: int, col: int):
-        """Process cell edits and update preview"""
-        if not self.cells[row][col]:
+        if self.editing and self.current_cell is not None:
+            row, col = self.current_cell
+            old = self.data[row][col]
+            self.set_value(row, col, self.preview_text.get())
+            if self.data[row][col] != old:
+                self._on_cell_edit(row, col, old)
+
+    def _on_cell_edit(self, row: int, col: int, old: str):
+        """Process cell edits, update preview and report the change"""
+        if not (0 <= row < len(self.data)):
             return
-    
-        value = self.cells[row][col].get().strip()
-    
+
+        value = self.data[row][col].strip()
+
         var_match = re.match(r'^{(\w+)}$', value)
         if var_match:
             var_name = var_match.group(1)
             self.column_vars[col] = var_name
-    
+
         # Update preview if this is the current cell
-        if row == self.current_row and col == self.current_col:
+        if row == self.current_row and col == self.current_col and not self.editing:
             self.preview_text.delete(0, tk.END)
             self.preview_text.insert(0, value)
-    
-        # Always trigger autosave
-        if hasattr(self.parent, 'on_grid_edit') and callable(self.parent.on_grid_edit):
-            self.parent.on_grid_edit()
+
+        # Patch the stored pattern with just this cell
+        if hasattr(self.parent, 'on_cell_change') and callable(self.parent.on_cell_change):
+            self.parent.on_cell_change(row, col, old, self.data[row][col])
 
     def interpret_cell_value(self, value: str) -> str:
         """Convert cell value to its variable assignment form"""
@@ -350,47 +564,8 @@ class Grid:
 
     def get_values(self) -> List[List[str]]:
         """Get raw values for saving/loading"""
-        return [[cell.get() for cell in row] for row in self.cells]
+        return [row[:] for row in self.data]
 
     def get_playback_values(self) -> List[List[str]]:
         """Get values converted to playback format"""
-        result = []
-        for row in self.cells:
-            row_values = []
-            for col, cell in enumerate(row):
-                value = cell.get().strip()
-                if value:
-                    # Handle {var} notation
-                    var_match = re.match(r'^{(\w+)}$', value)
-                    if var_match:
-                        var_name = var_match.group(1)
-                        self.column_vars[col] = var_name
-                        row_values.append("")  # Skip this cell in playback
-                        continue
-    
-                    # Handle specific variables that need special treatment
-                    if col in self.column_vars:
-                        var_name = self.column_vars[col]
-    
-                        # Handle compound operators
-                        compound_match = re.match(r'^([+-/*])=(\d+.?\d*)$', value)
-                        if compound_match:
-                            op, num = compound_match.groups()
-                            row_values.append(f"{var_name} = {var_name} {op} {num}")
-                        else:
-                            # Handle speed variable specially
-                            if var_name == 'speed':
-                                try:
-                                    speed_val = float(value)
-                                    row_values.append(f"speed = {speed_val}")
-                                except ValueError:
-                                    row_values.append("")
-                            else:
-                                # Handle normal assignment
-                                row_values.append(f"{var_name} = {value}")
-                    else:
-                        row_values.append(value)  # Default case: use value as-is
-                else:
-                    row_values.append("")
-            result.append(row_values)
-        return result
\ No newline at end of file
+        return playback_values(self.get_values(), self.column_vars)
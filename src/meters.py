@@ -0,0 +1,135 @@
+import tkinter as tk
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Level shown for silence
+FLOOR_DB = -90.0
+
+
+class MeterReading:
+    """Levels of the audio being heard at one moment; never changed once published"""
+
+    __slots__ = ('peak_db', 'rms_db', 'spectrum_db', 'clipped')
+
+    def __init__(self, peak_db: float, rms_db: float, spectrum_db: np.ndarray, clipped: bool):
+        self.peak_db = peak_db
+        self.rms_db = rms_db
+        self.spectrum_db = spectrum_db
+        self.clipped = clipped
+
+
+class LevelMeter:
+    """Peak, RMS and spectrum of the most recently played samples.
+
+    ``update`` copies the last ``size`` samples from the tap of the
+    engine's ring buffer without taking its lock, so the audio callback
+    never waits for the UI thread. Levels are reported
+    relative to full scale before the playback ``gain``, which is what an
+    export without normalization would write, and ``clipped`` stays set
+    once such a peak reaches 0 dBFS until ``reset_clip``. Each update
+    publishes a new MeterReading in ``reading``, so readers on other
+    threads need no lock.
+    """
+
+    def __init__(self, sample_rate: int = 44100, size: int = 2048, bands: int = 32,
+                 gain: float = 0.5):
+        self.sample_rate = sample_rate
+        self.size = size
+        self.gain = gain
+        self._samples = np.zeros(size, dtype=np.float32)
+        self._window = np.hanning(size).astype(np.float32)
+        self._windowed = np.zeros(size, dtype=np.float32)
+        self._power = np.zeros(size // 2 + 1, dtype=np.float64)
+        # A full-scale sine reads 0 dB in its band
+        self._scale = 2.0 / self._window.sum()
+        # Log-spaced bands from 40 Hz up to Nyquist, as rfft bin indices
+        freqs = np.geomspace(40.0, sample_rate / 2, bands + 1)[:-1]
+        edges = np.unique(np.round(freqs * size / sample_rate).astype(int))
+        self.band_edges = edges[edges < len(self._power)]
+        self.band_freqs = self.band_edges * sample_rate / size
+        # Two spectrum arrays, so the published one is never written to
+        self._spectra = [np.full(len(self.band_edges), FLOOR_DB) for _ in range(2)]
+        self._next = 0
+        self.clipped = False
+        self.reading = MeterReading(FLOOR_DB, FLOOR_DB, self._spectra[1], False)
+
+    @staticmethod
+    def to_db(value: float) -> float:
+        return max(FLOOR_DB, 20 * np.log10(value)) if value > 0 else FLOOR_DB
+
+    def reset_clip(self):
+        self.clipped = False
+
+    def update(self, ring) -> MeterReading:
+        """Measure the last samples taken from ``ring`` and publish the result"""
+        samples = self._samples
+        n = ring.recent(samples)
+        samples[:len(samples) - n] = 0
+        gain = self.gain or 1.0
+
+        peak = float(np.abs(samples[len(samples) - n:]).max()) / gain if n else 0.0
+        rms = float(np.sqrt(np.dot(samples, samples) / len(samples))) / gain
+        if peak >= 1.0:
+            self.clipped = True
+
+        np.multiply(samples, self._window, out=self._windowed)
+        np.abs(np.fft.rfft(self._windowed), out=self._power)
+        self._power *= self._scale / gain
+        spectrum = self._spectra[self._next]
+        np.maximum.reduceat(self._power, self.band_edges, out=spectrum)
+        np.maximum(spectrum, 10 ** (FLOOR_DB / 20), out=spectrum)
+        np.log10(spectrum, out=spectrum)
+        spectrum *= 20
+        self._next ^= 1
+
+        self.reading = MeterReading(self.to_db(peak), self.to_db(rms), spectrum, self.clipped)
+        return self.reading
+
+
+class MeterView:
+    """Peak and RMS bars, spectrum bands and a clip light, drawn from a LevelMeter.
+
+    Click the view to clear the clip light.
+    """
+
+    def __init__(self, parent, meter: LevelMeter, width: int = 240, height: int = 60):
+        self.meter = meter
+        self.canvas = tk.Canvas(parent, width=width, height=height, background="black",
+                                highlightthickness=0)
+        self._width = width
+        self._height = height
+        self._peak = self.canvas.create_rectangle(0, 0, 0, 0, fill="orange", outline="")
+        self._rms = self.canvas.create_rectangle(0, 0, 0, 0, fill="green", outline="")
+        self._bands = [self.canvas.create_rectangle(0, 0, 0, 0, fill="steelblue", outline="")
+                       for _ in meter.band_edges]
+        self._clip = self.canvas.create_text(4, 2, text="CLIP", anchor=tk.NW, fill="red",
+                                             state='hidden')
+        self._drawn: Optional[MeterReading] = None
+        self.canvas.bind('<Button-1>', lambda e: self.meter.reset_clip())
+
+    def pack(self, **kwargs):
+        self.canvas.pack(**kwargs)
+
+    def _y(self, db: float) -> float:
+        return self._height * min(1.0, max(0.0, db / FLOOR_DB))
+
+    def draw(self, reading: Optional[MeterReading] = None):
+        reading = reading or self.meter.reading
+        if reading is self._drawn:
+            return
+        self._drawn = reading
+        canvas = self.canvas
+        bottom = self._height
+        canvas.coords(self._peak, 0, self._y(reading.peak_db), 8, bottom)
+        canvas.coords(self._rms, 10, self._y(reading.rms_db), 18, bottom)
+
+        left = 24
+        band_width = (self._width - left) / max(1, len(self._bands))
+        for index, (item, db) in enumerate(zip(self._bands, reading.spectrum_db)):
+            x = left + index * band_width
+            canvas.coords(item, x, self._y(db), x + band_width - 1, bottom)
+        canvas.itemconfigure(self._clip, state='normal' if reading.clipped else 'hidden')
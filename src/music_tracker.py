@@ -1,8 +1,8 @@
 import tkinter as tk
 from tkinter import ttk, messagebox, filedialog
 import json
+import queue
 import threading
-import numpy as np
 from typing import Optional
 import re
 import logging
@@ -18,23 +18,87 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-from .audio_engine import AudioEngine
+from .audio_engine import AudioEngine, BlockSizeController
+from .sinks import AudioSink
 from .formula_engine import FormulaEngine
 from .grid import Grid
+from .pattern_manager import Pattern
 from .pattern_ui import PatternUI
+from .renderer import Renderer, StateIndex
+from .playback import (LoopCache, LoopRegion, PlayTimeline, Player, Preroll, ProgramCompiler,
+                       QualityGovernor, RowStream)
+from .export import ExportJob
+from .meters import LevelMeter, MeterView
+from .song import SongSnapshot
+from .waveform import WaveformPyramid, WaveformView
 
 class MusicTracker:
-    def __init__(self, root: tk.Tk):
+    def __init__(self, root: tk.Tk, audio_sink: Optional[AudioSink] = None):
         self.root = root
         self.root.title("Music Tracker")
-        self.audio = AudioEngine()
-        self.formula = FormulaEngine()
+        self.audio = AudioEngine(sink=audio_sink)
         self.is_playing = False
         self._stop = threading.Event()
         self.last_t = 0
+        self.state_index: Optional[StateIndex] = None
+        self.loop_region: Optional[LoopRegion] = None
+        self.loop_cache = LoopCache()
+        # Formula and globals edits are compiled in the background and
+        # swapped into a playing stream at the next block
+        self.program_compiler = ProgramCompiler()
+        # Block size and look-ahead follow measured render cost, between
+        # 256-sample blocks and half a second of latency
+        self.adaptive_blocks = True
+        self.block_control = BlockSizeController(self.audio.sample_rate, self.audio.buffer_size)
+        # Steps live playback down through cheaper render tiers when it
+        # cannot keep up; exports always render at full quality
+        self.quality_governor = QualityGovernor()
+        # Row start positions on the audio clock, for the playhead
+        self.timeline = PlayTimeline()
+        # Min/max overview of everything queued since play was pressed
+        self.waveform = WaveformPyramid()
+        # Levels of what is being heard, before the playback gain
+        self.meter = LevelMeter(self.audio.sample_rate)
+        # Draft preview renders live playback at a fraction of the device
+        # rate and upsamples it; exports always use the full rate
+        self.preview = False
+        self.preview_divisor = 4
+        # 1, 2 or 4; render the formula above the output rate and decimate
+        self.oversample = 1
+        self._formula_edit_after: Optional[str] = None
+        # The start of the song is rendered ahead of the play button
+        self.preroll = Preroll(crossfade=self.audio.crossfade,
+                               fade_samples=self.audio.fade_samples)
+        self._preroll_after: Optional[str] = None
+        # The song as the render thread sees it; replaced, never modified,
+        # by the UI thread whenever something changes
+        self.song: Optional[SongSnapshot] = None
+        self._play_thread: Optional[threading.Thread] = None
+        # One of 'int16', 'int24' or 'float32'
+        self.export_sample_format = 'int16'
+        # Loudness normalization applied on export instead of a fixed 0.5 gain
+        self.export_normalize = True
+        self.export_peak_db = -1.0
+        self.export_rms_db: Optional[float] = None
+        self.export_job: Optional[ExportJob] = None
+        # Save render state at each play order boundary so interrupted
+        # exports can resume
+        self.export_checkpoints = True
+        # Keep the checkpoint and scratch render of a finished export, so
+        # exporting again after editing one pattern re-renders only that one
+        self.export_keep_checkpoint = True
+        # Log the export's peak memory per stage; tracemalloc slows rendering
+        self.export_track_memory = False
 
         self.setup_ui()
         self._setup_bindings()
+        self.publish_song()
+
+        try:
+            self.audio.start()
+        except Exception as e:
+            logger.error(f"Could not open audio output: {e}")
+        self.root.after_idle(self.start_preroll)
 
     def setup_ui(self):
         main_frame = ttk.Frame(self.root)
@@ -43,6 +107,7 @@ class MusicTracker:
         self._setup_top_frame(main_frame)
         self._setup_grid_frame(main_frame)
         self._setup_controls(main_frame)
+        self._setup_waveform(main_frame)
 
         # Initialize PatternUI
         self.pattern_ui = PatternUI(self.top_frame, self)
@@ -52,6 +117,12 @@ class MusicTracker:
         self.root.protocol("WM_DELETE_WINDOW", self.cleanup_and_close)
         self.root.bind('<F5>', lambda e: self.toggle_play())
         self.grid_frame.bind('<F5>', lambda e: self.toggle_play())
+        self.pattern_ui.order_listbox.bind('<<ListboxSelect>>', self.update_loop_region, add='+')
+        self.root.bind('<Shift-F5>', lambda e: self.toggle_play(from_cursor=True))
+        # Only where cells are edited; Text widgets keep their own undo
+        for widget in (self.canvas, self.grid.editor):
+            widget.bind('<Control-z>', self.pattern_ui.undo, add='+')
+        self.speed_entry.bind('<KeyRelease>', lambda e: self.publish_song(full=False))
 
     def _setup_top_frame(self, main_frame):
         self.top_frame = ttk.Frame(main_frame)
@@ -82,8 +153,30 @@ class MusicTracker:
         self.formula_text = tk.Text(formula_frame, height=3)
         self.formula_text.pack(fill=tk.X)
         self.formula_text.insert("1.0", "output = vibrato(saw,cents(x)*t,v,r,d)")
+        self.formula_text.bind('<KeyRelease>', self._on_formula_edit)
+
+        # Cell edits publish on every keystroke, so the texts are read only
+        # when Tk reports a change instead of on every publish
+        self._read_texts()
+        for text in (self.formula_text, self.globals_text):
+            text.edit_modified(False)
+            text.bind('<<Modified>>', self._on_text_modified)
+
+    def _read_texts(self):
+        self._formula_source = self.formula_text.get("1.0", tk.END)
+        self._globals_source = self.globals_text.get("1.0", tk.END)
+
+    def _on_text_modified(self, event):
+        if not event.widget.edit_modified():
+            return  # our own reset of the flag below
+        event.widget.edit_modified(False)
+        self._read_texts()
 
     def _setup_grid_frame(self, main_frame):
+        # Holds the cell preview; the cells themselves are drawn on the canvas
+        self.grid_frame = ttk.Frame(main_frame)
+        self.grid_frame.pack(fill=tk.X, padx=10)
+
         scroll_frame = ttk.Frame(main_frame)
         scroll_frame.pack(fill=tk.BOTH, expand=True, padx=10)
 
@@ -98,19 +191,16 @@ class MusicTracker:
         self.canvas = tk.Canvas(scroll_frame)
         self.canvas.pack(side=tk.LEFT, fill=tk.BOTH, expand=True)
 
-        # Configure scrollbars
-        v_scrollbar.configure(command=self.canvas.yview)
+        # Create Grid
+        self.grid = Grid(self.grid_frame, self.canvas)
+
+        # Configure scrollbars; vertical scrolling goes through the grid so
+        # it can draw the rows coming into view
+        v_scrollbar.configure(command=self.grid.yview)
         h_scrollbar.configure(command=self.canvas.xview)
         self.canvas.configure(yscrollcommand=v_scrollbar.set,
                             xscrollcommand=h_scrollbar.set)
 
-        # Create grid frame
-        self.grid_frame = ttk.Frame(self.canvas)
-        self.canvas.create_window((0, 0), window=self.grid_frame, anchor='nw')
-
-        # Create Grid
-        self.grid = Grid(self.grid_frame, self.canvas)
-
     def _setup_controls(self, main_frame):
         controls = ttk.Frame(main_frame)
         controls.pack(fill=tk.X, padx=10, pady=10, side=tk.BOTTOM)
@@ -133,6 +223,14 @@ class MusicTracker:
 
         self.play_button = ttk.Button(controls, text="Play", command=self.toggle_play)
         self.play_button.pack(side=tk.LEFT, padx=2)
+        ttk.Button(controls, text="Play From Cursor",
+                  command=lambda: self.toggle_play(from_cursor=True)).pack(side=tk.LEFT, padx=2)
+        self.loop_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Loop Selection", variable=self.loop_var,
+                        command=self.update_loop_region).pack(side=tk.LEFT, padx=2)
+        self.preview_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(controls, text="Draft Preview", variable=self.preview_var,
+                        command=self.toggle_preview).pack(side=tk.LEFT, padx=2)
 
         ttk.Button(controls, text="Export WAV",
                   command=self.export_wav).pack(side=tk.LEFT, padx=2)
@@ -143,12 +241,23 @@ class MusicTracker:
         ttk.Button(controls, text="New",
                   command=self.reset_all).pack(side=tk.LEFT, padx=2)
 
+        self.status_var = tk.StringVar(value="")
+        ttk.Label(controls, textvariable=self.status_var).pack(side=tk.RIGHT, padx=2)
+
+    def _setup_waveform(self, main_frame):
+        overview = ttk.Frame(main_frame)
+        overview.pack(fill=tk.X, padx=10, side=tk.BOTTOM)
+        self.meter_view = MeterView(overview, self.meter)
+        self.meter_view.pack(side=tk.RIGHT, padx=(5, 0))
+        self.waveform_view = WaveformView(overview, self.waveform)
+        self.waveform_view.pack(side=tk.LEFT, fill=tk.X, expand=True)
+
     def cleanup_and_close(self):
         self._stop.set()
         self.is_playing = False
-        if self.audio.stream:
-            self.audio.stream.stop()
-            self.audio.stream.close()
+        if self.export_job is not None:
+            self.export_job.cancel()
+        self.audio.close()
         self.root.destroy()
 
     def reset_all(self):
@@ -167,8 +276,7 @@ class MusicTracker:
         self.speed_entry.insert(0, "4")
         
         # Reset pattern manager
-        self.pattern_ui.pattern_manager.patterns.clear()
-        self.pattern_ui.pattern_manager.order_list.clear()
+        self.pattern_ui.pattern_manager.clear()
         
         # Reset pattern UI
         self.pattern_ui.order_listbox.delete(0, tk.END)
@@ -200,198 +308,292 @@ class MusicTracker:
                 self.globals_text.insert("1.0", text.get("1.0", tk.END))
             else:
                 self.globals_text = text
-            self.formula.update_globals(text.get("1.0", tk.END))
+            self._read_texts()
+            self.publish_song(full=False)
+            self.request_program_swap()
+            self.schedule_preroll()
             dialog.destroy()
 
         ttk.Button(dialog, text="Save & Close", command=save_and_close).pack(pady=10)
 
-    def generate_audio(self, samples_per_row=None):
-        logger.info("Starting audio generation")
-        buffer = np.array([], dtype=np.float32)
-        current_t = self.last_t
-        logger.debug(f"Starting from t={current_t}")
-
-        # Initialize persistent vars with defaults
-        persistent_vars_dict = {
-            't': 0,  # time
-            'r': 5,  # default rate for modulation effects
-            'd': 0.1,  # default depth for modulation effects
-            'f': 440,  # default frequency
-            's': 44100,  # sample rate
-        }
-        persistent_vars_dict.update(self.formula.globals)
+    def _on_formula_edit(self, event=None):
+        # Wait for a pause in typing before compiling
+        if self._formula_edit_after is not None:
+            self.root.after_cancel(self._formula_edit_after)
+        self._formula_edit_after = self.root.after(300, self._formula_edited)
+
+    def _formula_edited(self):
+        self._formula_edit_after = None
+        self.publish_song(full=False)
+        if self.is_playing:
+            self.request_program_swap()
+        else:
+            self.start_preroll()
+
+    def request_program_swap(self):
+        """Compile the current formula and globals for the playing stream"""
+        if not self.is_playing:
+            return
+        self.program_compiler.request(self.formula_text.get("1.0", tk.END),
+                                      self.globals_text.get("1.0", tk.END))
+
+    def publish_song(self, full: bool = True):
+        """Snapshot the song for the render thread; UI thread only.
+
+        A full capture compares every stored row against the previous
+        snapshot and re-reads the formula and globals texts; otherwise only
+        rows marked dirty since the last publish are copied, which is what
+        cell edits use, and the texts come from the last ``<<Modified>>``.
+        """
+        pattern_manager = self.pattern_ui.pattern_manager
+        edits = pattern_manager.take_dirty()
+        if full or self.song is None:
+            self._read_texts()
+        settings = dict(
+            formula_text=self._formula_source,
+            globals_text=self._globals_source,
+            speed=self._get_speed(),
+            playback_rate=self.playback_rate(),
+            oversample=self.oversample,
+        )
+        if full or self.song is None:
+            self.song = SongSnapshot.capture(pattern_manager, previous=self.song, **settings)
+        else:
+            changes = {name: value for name, value in settings.items()
+                       if getattr(self.song, name) != value}
+            self.song = self.song.with_rows(edits, **changes)
+
+    def schedule_preroll(self):
+        """Pre-render the start of the song once edits settle"""
+        if self._preroll_after is not None:
+            self.root.after_cancel(self._preroll_after)
+        self._preroll_after = self.root.after(300, self.start_preroll)
+
+    def start_preroll(self):
+        self._preroll_after = None
+        self.publish_song()
+        if self.is_playing:
+            return
+        self.preroll.start(self.create_renderer(sample_rate=self.song.playback_rate))
+
+    def _get_speed(self) -> float:
         try:
-            persistent_vars_dict['speed'] = float(self.speed_entry.get() or 4)
+            return float(self.speed_entry.get() or 4)
         except (ValueError, TypeError) as e:
             logger.error(f"Error converting speed: {e}")
-            persistent_vars_dict['speed'] = 4.0
-
-        # Update globals before generation
-        logger.info("Updating formula engine globals")
-        globals_text = self.globals_text.get("1.0", tk.END)
-        self.formula.update_globals(globals_text)
-        logger.debug(f"Formula engine globals: {list(self.formula.globals.keys())}")
-
-        # Store original function references
-        function_refs = {}
-        for name, value in self.formula.globals.items():
-            if callable(value):
-                function_refs[name] = value
-
-        for pattern_num in self.pattern_ui.pattern_manager.order_list:
-            if not self.is_playing and samples_per_row is None or self._stop.is_set():
-                logger.info("Playback stopped")
-                break
-
-            logger.info(f"Processing pattern {pattern_num}")
-            pattern = self.pattern_ui.pattern_manager.patterns[pattern_num]
-            playback_data = self.grid.get_playback_values()
-            logger.debug(f"Pattern data rows: {len(playback_data)}")
-
-            for row_idx, row in enumerate(playback_data):
-                logger.debug(f"Processing row {row_idx}")
-                # Start with previous row's variables
-                row_vars_dict = persistent_vars_dict.copy()
-                has_updates = False
-
-                # Process each cell in the row
-                for col_idx, cell_value in enumerate(row):
-                    if cell_value:
-                        try:
-                            logger.debug(f"Executing cell value: {cell_value}")
-                            # Execute the cell value as Python code to update variables
-                            exec(cell_value, self.formula.globals, row_vars_dict)
-                            has_updates = True
-                        except Exception as e:
-                            logger.error(f"Error processing cell: {e}. Cell value: {cell_value}")
-
-                # Calculate number of samples for this row
-                try:
-                    row_speed = float(row_vars_dict.get('speed', 4.0))
-                    row_samples = int(44100 / row_speed) if samples_per_row is None else samples_per_row
-                    logger.debug(f"Row speed: {row_speed}, samples: {row_samples}")
-                except (ValueError, TypeError) as e:
-                    logger.error(f"Error calculating row samples: {e}")
-                    row_speed = 4.0
-                    row_samples = int(44100 / row_speed) if samples_per_row is None else samples_per_row
-
-                try:
-                    # Create time array for this row
-                    t = np.linspace(current_t, current_t + row_samples - 1, row_samples, dtype=np.float32)
-                    logger.debug(f"Time array: {t.shape}, range: [{t[0]}, {t[-1]}]")
-
-                    # Create interpolation factors
-                    interp = np.linspace(0, 1, row_samples, dtype=np.float32)
-
-                    # Just use the raw values without interpolation
-                    interpolated_vars = row_vars_dict.copy()
-
-                    # Update t in both dictionaries
-                    interpolated_vars['t'] = t
-                    self.formula.globals['t'] = t
-
-                    # Restore function references
-                    for name, func in function_refs.items():
-                        interpolated_vars[name] = func
-                        self.formula.globals[name] = func
-
-                    # Execute formula with interpolated variables
-                    formula_text = self.formula_text.get("1.0", tk.END)
-                    local_vars = {**self.formula.globals, **interpolated_vars}
-                    logger.debug(f"Executing formula with variables: {list(local_vars.keys())}")
-                    logger.debug(f"Formula: {formula_text}")
-                    exec(formula_text, self.formula.globals, local_vars)
-
-                    if 'output' in local_vars:
-                        output = local_vars['output']
-                        logger.debug(f"Output type: {type(output)}, shape: {output.shape if isinstance(output, np.ndarray) else 'scalar'}")
-                        if isinstance(output, np.ndarray):
-                            buffer = np.append(buffer, output.astype(np.float32))
-                        else:
-                            buffer = np.append(buffer, np.full(row_samples, float(output), dtype=np.float32))
-                    else:
-                        logger.warning("No output variable found in formula execution")
-                        buffer = np.append(buffer, np.zeros(row_samples, dtype=np.float32))
-
-                except Exception as e:
-                    logger.error(f"Error generating audio: {e}", exc_info=True)
-                    buffer = np.append(buffer, np.zeros(row_samples, dtype=np.float32))
-
-                current_t += row_samples
-                persistent_vars_dict = row_vars_dict
-
-        self.last_t = current_t
-        logger.info(f"Audio generation complete. Buffer size: {len(buffer)}")
-        return buffer * 0.5  # Reduce amplitude to avoid clipping
-
-    def play_audio(self):
+            return 4.0
+
+    def playback_rate(self) -> int:
+        """Sample rate live playback renders at"""
+        if self.preview:
+            return self.audio.sample_rate // self.preview_divisor
+        return self.audio.sample_rate
+
+    def create_renderer(self, samples_per_row=None, formula=None,
+                        start_t=0, stop_event=None, sample_rate=None,
+                        song: Optional[SongSnapshot] = None, track_memory=False) -> Renderer:
+        """Build a renderer from a song snapshot, the last published one by default.
+
+        Safe to call from any thread; it reads no widgets. Without ``formula``
+        the renderer gets a new engine, so no other thread shares its globals
+        or phases; ``prepare`` runs the snapshot's globals in it.
+        """
+        song = song or self.song
+        return Renderer(
+            formula or FormulaEngine(),
+            song.pattern_lists(),
+            song.order,
+            song.formula_text,
+            song.globals_text,
+            speed=song.speed,
+            sample_rate=sample_rate or self.audio.sample_rate,
+            samples_per_row=samples_per_row,
+            start_t=start_t,
+            stop_event=stop_event,
+            track_memory=track_memory,
+            oversample=song.oversample,
+        )
+
+    def play_audio(self, position=None):
+        """Stream the song to the audio device, looping until stopped.
+
+        ``position`` is an optional (order_index, row) to start the first
+        pass from; later passes start from the top. While a loop region is
+        set, each pass replays the region's cached audio instead.
+
+        Runs on its own thread: the song comes from published snapshots and
+        anything touching widgets goes back to the UI thread via ``after``.
+        """
         logger.info("Starting audio playback")
+        # One engine for the whole session, so phases carry over between passes
+        formula = FormulaEngine()
         try:
             while not self._stop.is_set() and self.is_playing:
-                audio_data = self.generate_audio()
-                logger.debug(f"Generated audio data length: {len(audio_data)}")
-                if self.audio.stream is None:
-                    logger.info("Creating new audio stream")
-                    self.audio.stream = self.audio.create_stream()
-                    self.audio.stream.start()
-
-                for i in range(0, len(audio_data), self.audio.buffer_size):
-                    if self._stop.is_set() or not self.is_playing:
-                        logger.info("Playback stopped")
-                        break
-                    chunk = audio_data[i:i + self.audio.buffer_size]
-                    if len(chunk) < self.audio.buffer_size:
-                        chunk = np.pad(chunk, (0, self.audio.buffer_size - len(chunk)))
-                    logger.debug(f"Writing chunk {i//self.audio.buffer_size}, size: {len(chunk)}")
-                    self.audio.stream.write(chunk)
+                song = self.song
+
+                def make_renderer():
+                    return self.create_renderer(formula=formula, start_t=self.last_t,
+                                                stop_event=self._stop,
+                                                sample_rate=song.playback_rate, song=song)
+
+                self.audio.start()
+                region = self.loop_region
+                if region is not None:
+                    # Unchanged snapshot and region: replay the same buffer as is
+                    factor = max(1, self.audio.sample_rate // song.playback_rate)
+                    loop_audio, row_starts = self.loop_cache.played(song, region, make_renderer,
+                                                                    factor)
+                    if len(loop_audio):
+                        base = self.audio.ring.written
+                        for offset, order_index, row in row_starts:
+                            self.timeline.add(base + offset, order_index, row)
+                        self.waveform.append(loop_audio)
+                        self.audio.write(loop_audio, self._stop)
+                        continue
+
+                renderer = make_renderer()
+
+                # Rows are rendered a little ahead of the device; cell edits
+                # re-render the queued rows they touch before they are heard
+                def take_edits():
+                    nonlocal song
+                    latest = self.song
+                    if latest is song:
+                        return {}
+                    edits, song = latest.edits_since(song), latest
+                    return edits
+
+                rows = self.preroll.take(renderer) if position is None else None
+                if rows is None:
+                    renderer.prepare()
+                    start = None
+                    if position is not None:
+                        self.state_index = StateIndex().build(renderer)
+                        start = self.state_index.state_at(renderer, *position)
+                        if start is None:
+                            logger.info("Nothing to play after the cursor; playing from the top")
+                        position = None
+                    rows = RowStream(renderer, start, crossfade=self.audio.crossfade,
+                                     fade_samples=self.audio.fade_samples)
+                self.program_compiler.take()
+                player = Player(self.audio, self.block_control if self.adaptive_blocks else None,
+                                self.quality_governor, timeline=self.timeline,
+                                waveform=self.waveform)
+                player.play(rows, self._stop, take_edits, self.program_compiler.take)
+                self.last_t = rows.t
+                # A program swap replaces the engine along with the code
+                formula = rows.renderer.formula
         except Exception as e:
             logger.error(f"Error in audio playback: {e}", exc_info=True)
         finally:
             logger.info("Cleaning up playback")
-            self.cleanup_playback()
+            try:
+                self.root.after(0, self.cleanup_playback, threading.current_thread())
+            except (RuntimeError, tk.TclError):
+                # The window is already gone
+                pass
 
-    def highlight_current_row(self, pattern_num, row_num):
-        # Clear previous highlight
-        for row in self.grid.cells:
-            for cell in row:
-                cell.configure(background='')
-        
-        # Highlight current row
-        if 0 <= row_num < len(self.grid.cells):
-            for cell in self.grid.cells[row_num]:
-                cell.configure(background='#ff6b6b')
-    
-        # Highlight current pattern in order list
-        self.pattern_ui.order_listbox.selection_clear(0, tk.END)
-        for i, pat in enumerate(self.pattern_ui.pattern_manager.order_list):
-            if pat == pattern_num:
-                self.pattern_ui.order_listbox.selection_set(i)
-                self.pattern_ui.order_listbox.see(i)
-
-    def toggle_play(self):
+    def update_loop_region(self, *args):
+        """Loop the selected play order entries (or the current pattern) when looping is on"""
+        if not self.loop_var.get():
+            self.loop_region = None
+            return
+        order_list = self.pattern_ui.pattern_manager.order_list
+        selection = self.pattern_ui.order_listbox.curselection()
+        if selection:
+            self.loop_region = LoopRegion(min(selection), max(selection) + 1)
+        elif order_list:
+            self.loop_region = LoopRegion(self.cursor_position()[0])
+        else:
+            self.loop_region = None
+        logger.info(f"Loop region: {self.loop_region}")
+
+    def toggle_preview(self):
+        """Switch live playback between full rate and draft preview"""
+        self.preview = self.preview_var.get()
+        self.publish_song(full=False)
+        logger.info(f"Playback rate: {self.playback_rate()} Hz")
+        self.loop_cache.invalidate()
+        self.schedule_preroll()
+
+    def cursor_position(self):
+        """Play order position and row under the grid cursor"""
+        order_list = self.pattern_ui.pattern_manager.order_list
+        selection = self.pattern_ui.order_listbox.curselection()
+        if selection:
+            order_index = selection[0]
+        else:
+            try:
+                order_index = order_list.index(int(self.pattern_ui.current_pattern_number.get()))
+            except ValueError:
+                order_index = 0
+        return order_index, self.grid.current_row
+
+    def update_playhead(self):
+        """Move the playhead to the row being heard, at display rate"""
+        position = self.timeline.at(self.audio.clock()) if self.is_playing else None
+        row = None
+        if position is not None:
+            order_index, row_num = position
+            order_list = self.pattern_ui.pattern_manager.order_list
+            if order_index < len(order_list):
+                # Mark the playing entry without touching the loop selection
+                self.pattern_ui.order_listbox.activate(order_index)
+                try:
+                    if order_list[order_index] == int(self.pattern_ui.current_pattern_number.get()):
+                        row = row_num
+                except ValueError:
+                    pass
+        self.grid.show_playhead(row)
+        self.waveform_view.refresh()
+        self.meter.update(self.audio.ring)
+        self.meter_view.draw()
+        if self.is_playing:
+            self.root.after(16, self.update_playhead)
+
+    def toggle_play(self, from_cursor=False):
         logger.info(f"Toggle play called. Current state: {self.is_playing}")
-        self.formula.update_globals(self.globals_text.get("1.0", tk.END))
         if self.is_playing:
             self._stop.set()
             self.is_playing = False
+            self.audio.silence()
             self.play_button.configure(text="Play")
-            self.formula.reset_phases()
         else:
             self._stop.clear()
             self.is_playing = True
             self.play_button.configure(text="Stop")
-            self.formula.reset_phases()
-            threading.Thread(target=self.play_audio, daemon=True).start()
-
-    def cleanup_playback(self):
+            self.audio.stats.reset()
+            self.timeline.clear()
+            self.waveform.clear()
+            self.waveform_view.follow = True
+            self.meter.reset_clip()
+            self.publish_song()
+            position = self.cursor_position() if from_cursor else None
+            self._play_thread = threading.Thread(target=self.play_audio, args=(position,), daemon=True)
+            self._play_thread.start()
+            self._update_status()
+            self.update_playhead()
+
+    def _update_status(self):
+        """Show playback telemetry while playing"""
+        self.status_var.set(f"{self.audio.stats.summary()}  "
+                            f"Quality: {self.quality_governor.tier.name}")
+        if self.is_playing:
+            self.root.after(250, self._update_status)
+
+    def cleanup_playback(self, thread: Optional[threading.Thread] = None):
+        """Reset after the playback thread ends; runs on the UI thread"""
+        if thread is not None and thread is not self._play_thread:
+            # A newer playback has started since
+            return
+        self._play_thread = None
         self.is_playing = False
         self._stop.clear()
         self.play_button.configure(text="Play")
         self.last_t = 0
-        if self.audio.stream:
-            self.audio.stream.stop()
-            self.audio.stream.close()
-            self.audio.stream = None
+        # The stream stays open and plays silence until the next play
+        self.audio.silence()
+        self.schedule_preroll()
 
     def save(self):
         try:
@@ -399,9 +601,9 @@ class MusicTracker:
             if path:
                 # Extract variable names from first row
                 var_map = {}
-                first_row = self.grid.cells[0]
+                first_row = self.grid.get_values()[0] if self.grid.num_rows else []
                 for col, cell in enumerate(first_row):
-                    value = cell.get().strip()
+                    value = cell.strip()
                     var_match = re.match(r'^{(\w+)}$', value)
                     if var_match:
                         var_map[var_match.group(1)] = col
@@ -467,18 +669,13 @@ class MusicTracker:
                 for pattern_num, pattern in self.pattern_ui.pattern_manager.patterns.items():
                     pattern_data = pattern['data'] if isinstance(pattern, dict) else pattern
                     rows = {}
-                    for row_idx, row in enumerate(pattern_data):
-                        row_data = {}
-                        has_data = False
-                        for col_idx, value in enumerate(row):
-                            if value.strip() and not re.match(r'^{.*}$', value):
-                                has_data = True
-                                for var_name, col in var_map.items():
-                                    if col == col_idx:
-                                        row_data[var_name] = value
-                                        break
-                        if has_data:
-                            rows[str(row_idx)] = row_data
+                    for row_idx, col_idx, value in pattern_data.cells():
+                        if value.strip() and not re.match(r'^{.*}$', value):
+                            row_data = rows.setdefault(str(row_idx), {})
+                            for var_name, col in var_map.items():
+                                if col == col_idx:
+                                    row_data[var_name] = value
+                                    break
 
                     if rows:
                         patterns[str(pattern_num)] = {
@@ -561,19 +758,15 @@ class MusicTracker:
                 var_list = state['vars']
                 var_map = {var: idx for idx, var in enumerate(var_list)}
 
-                # Create empty grid with variable declarations
                 max_col = len(var_list)
                 rows = int(state['settings']['rows'])
-                grid_data = [['' for _ in range(max_col)] for _ in range(rows)]
 
-                # Fill in variable declarations in first row
-                for var, col in var_map.items():
-                    grid_data[0][col] = f"{{{var}}}"
-
-                # Convert patterns to grid format
+                # Convert patterns, starting each from the variable declarations
                 patterns = {}
                 for pattern_num, pattern in state['patterns'].items():
-                    pattern_data = [row[:] for row in grid_data]  # Deep copy
+                    pattern_data = Pattern(rows, max_col)
+                    for var, col in var_map.items():
+                        pattern_data.set(0, col, f"{{{var}}}")
                     for row_idx_str, row_data in pattern['rows'].items():
                         row_idx = int(row_idx_str)
                         for var_name, value in row_data.items():
@@ -581,9 +774,9 @@ class MusicTracker:
                                 col = var_map[var_name]
                                 # For variables that need assignment
                                 if var_name in ['pitch', 'freq', 'freq1', 'freq2', 'freq3', 'cutoff']:
-                                    pattern_data[row_idx][col] = f"{var_name} = {value}"
+                                    pattern_data.set(row_idx, col, f"{var_name} = {value}")
                                 else:
-                                    pattern_data[row_idx][col] = value
+                                    pattern_data.set(row_idx, col, value)
 
                     patterns[int(pattern_num)] = {
                         'name': pattern['name'],
@@ -591,8 +784,7 @@ class MusicTracker:
                     }
 
                 # Update pattern manager
-                self.pattern_ui.pattern_manager.patterns = patterns
-                self.pattern_ui.pattern_manager.order_list = [int(x) for x in state['order']]
+                self.pattern_ui.pattern_manager.replace(patterns, [int(x) for x in state['order']])
 
                 # Update order listbox
                 self.pattern_ui.order_listbox.delete(0, tk.END)
@@ -605,10 +797,9 @@ class MusicTracker:
                     first_pattern = int(state['order'][0])
                     self.pattern_ui.current_pattern_number.set(str(first_pattern))
                     if first_pattern in patterns:
-                        self.grid.update(rows, patterns[first_pattern]['data'])
+                        self.grid.update(rows, patterns[first_pattern]['data'].to_rows())
 
-                # Update globals
-                self.formula.update_globals(self.globals_text.get("1.0", tk.END))
+                self.start_preroll()
 
                 messagebox.showinfo("Load Successful", "Project loaded successfully")
         except Exception as e:
@@ -616,6 +807,9 @@ class MusicTracker:
             messagebox.showerror("Error", str(e))
 
     def export_wav(self):
+        if self.export_job is not None and self.export_job.running:
+            messagebox.showwarning("Export Running", "An export is already in progress")
+            return
         try:
             path = filedialog.asksaveasfilename(
                 defaultextension=".wav",
@@ -624,34 +818,94 @@ class MusicTracker:
             if not path:
                 return
 
-            self.formula.update_globals(self.globals_text.get("1.0", tk.END))
-
             order_list = self.pattern_ui.pattern_manager.order_list
             if not order_list:
                 messagebox.showerror("Error", "No patterns in play order to export")
                 return
 
-            audio_data = self.generate_audio(samples_per_row=5000)
-            self.audio.write_wav(audio_data, path)
-
-            messagebox.showinfo("Success", f"Audio exported to {path}")
+            # The export gets its own formula engine so playback can keep running
+            self.publish_song()
+            renderer = self.create_renderer(track_memory=self.export_track_memory)
+
+            self.export_job = ExportJob(
+                renderer,
+                path,
+                lambda p, **kwargs: self.audio.open_wav(
+                    p, sample_format=self.export_sample_format, **kwargs
+                ),
+                normalize=self.export_normalize,
+                target_peak_db=self.export_peak_db,
+                target_rms_db=self.export_rms_db,
+                checkpoints=self.export_checkpoints,
+                keep_checkpoint=self.export_keep_checkpoint,
+                sample_format=self.export_sample_format
+            )
+            checkpoint = self.export_job.load_checkpoint() if self.export_checkpoints else None
+            if checkpoint is not None:
+                question = ("An earlier export of this song to this file was found. Reuse it, "
+                            "re-rendering only the patterns edited since?" if checkpoint.complete
+                            else "An unfinished export to this file was found. Resume from the "
+                                 "last completed pattern?")
+                self.export_job.resume = messagebox.askyesno("Resume Export", question)
+            self._show_export_dialog(self.export_job)
+            self.export_job.start()
 
         except Exception as e:
             messagebox.showerror("Export Error", str(e))
 
+    def _show_export_dialog(self, job: ExportJob):
+        dialog = tk.Toplevel(self.root)
+        dialog.title("Exporting")
+        dialog.geometry("360x120")
+
+        status = ttk.Label(dialog, text="Preparing...")
+        status.pack(fill=tk.X, padx=10, pady=(10, 5))
+        progress = ttk.Progressbar(dialog, maximum=1.0)
+        progress.pack(fill=tk.X, padx=10)
+        ttk.Button(dialog, text="Cancel", command=job.cancel).pack(pady=10)
+        dialog.protocol("WM_DELETE_WINDOW", job.cancel)
+
+        def poll():
+            report = None
+            try:
+                while True:
+                    report = job.progress.get_nowait()
+                    if report.finished:
+                        break
+            except queue.Empty:
+                pass
+
+            if report is not None and report.finished:
+                dialog.destroy()
+                if report.state == 'done':
+                    messagebox.showinfo("Success", f"Audio exported to {job.path}")
+                elif report.state == 'error':
+                    messagebox.showerror("Export Error", report.error)
+                return
+
+            if report is not None:
+                if report.state == 'normalize':
+                    status.configure(text="Normalizing...")
+                    progress.configure(value=1.0)
+                else:
+                    eta = f"{report.eta:.0f}s left" if report.eta is not None else ""
+                    status.configure(text=f"Row {report.rows_done}/{report.total_rows}  "
+                                          f"{report.realtime_factor:.1f}x realtime  {eta}")
+                    progress.configure(value=report.fraction)
+            self.root.after(100, poll)
+
+        self.root.after(100, poll)
+
     def clear_state(self):
         # Clear patterns
-        self.pattern_ui.pattern_manager.patterns.clear()
-        self.pattern_ui.pattern_manager.order_list.clear()
+        self.pattern_ui.pattern_manager.clear()
         
         # Clear UI elements
         self.pattern_ui.order_listbox.delete(0, tk.END)
         self.pattern_ui.pattern_name_entry.delete(0, tk.END)
         
         # Clear grid
-        for row in self.grid.cells:
-            for cell in row:
-                cell.delete(0, tk.END)
+        self.grid.clear()
                 
         # Clear text fields
         self.formula_text.delete("1.0", tk.END)
@@ -674,12 +928,9 @@ class MusicTracker:
                 if pattern_num in self.pattern_ui.pattern_manager.patterns:
                     pattern = self.pattern_ui.pattern_manager.patterns[pattern_num]
                     if isinstance(pattern, dict):
-                        pattern['data'] = self.grid.get_values()
+                        pattern['data'] = Pattern.from_rows(self.grid.get_values())
             except ValueError:
                 pass
-
-            # Update scroll region
-            self.grid_frame.update_idletasks()
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+            self.publish_song()
         except Exception as e:
             messagebox.showerror("Error", str(e))
\ No newline at end of file
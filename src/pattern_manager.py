@@ -1,28 +1,260 @@
-from typing import Dict, List, Any
+import itertools
+import sys
+import threading
+from typing import Callable, Dict, Iterable, Iterator, List, Any, Optional, Set, Tuple
+
+import numpy as np
+
+# Every change to any Pattern takes the next stamp, so two equal stamps
+# always mean the same content
+_stamps = itertools.count(1)
+
+
+class Pattern:
+    """Cells of one pattern, storing only those that are not empty.
+
+    Filled cells are kept sorted by row, then column, in two index arrays
+    with their interned strings alongside, so memory and copying scale
+    with the number of filled cells rather than rows times columns.
+    Indexing and iterating give dense rows of ``num_columns`` strings, so
+    a Pattern reads like the list of rows it replaces.
+    """
+
+    __slots__ = ('num_rows', 'num_columns', 'version', '_rows', '_cols', '_values')
+
+    def __init__(self, num_rows: int = 64, num_columns: int = 12):
+        self.num_rows = num_rows
+        self.num_columns = num_columns
+        self._rows = np.zeros(0, dtype=np.int32)
+        self._cols = np.zeros(0, dtype=np.int32)
+        self._values: List[str] = []
+        self._touch()
+
+    def _touch(self):
+        self.version = next(_stamps)
+
+    @classmethod
+    def from_rows(cls, rows: Iterable[List[str]], num_columns: int = 0) -> 'Pattern':
+        rows_index, cols_index, values = [], [], []
+        num_rows = 0
+        for r, row in enumerate(rows):
+            num_rows = r + 1
+            num_columns = max(num_columns, len(row))
+            for c, value in enumerate(row):
+                if value:
+                    rows_index.append(r)
+                    cols_index.append(c)
+                    values.append(sys.intern(value))
+        pattern = cls(num_rows, num_columns)
+        pattern._rows = np.array(rows_index, dtype=np.int32)
+        pattern._cols = np.array(cols_index, dtype=np.int32)
+        pattern._values = values
+        return pattern
+
+    def copy(self) -> 'Pattern':
+        pattern = Pattern(self.num_rows, self.num_columns)
+        pattern._rows = self._rows.copy()
+        pattern._cols = self._cols.copy()
+        pattern._values = list(self._values)
+        pattern.version = self.version
+        return pattern
+
+    @property
+    def filled(self) -> int:
+        return len(self._values)
+
+    def __len__(self):
+        return self.num_rows
+
+    def _span(self, row: int) -> Tuple[int, int]:
+        return (int(np.searchsorted(self._rows, row, 'left')),
+                int(np.searchsorted(self._rows, row, 'right')))
+
+    def _find(self, row: int, col: int) -> Tuple[int, bool]:
+        lo, hi = self._span(row)
+        index = lo + int(np.searchsorted(self._cols[lo:hi], col))
+        return index, index < hi and self._cols[index] == col
+
+    def get(self, row: int, col: int) -> str:
+        index, found = self._find(row, col)
+        return self._values[index] if found else ""
+
+    def set(self, row: int, col: int, value: str):
+        """Store one cell, growing the pattern to reach it"""
+        self.num_rows = max(self.num_rows, row + 1)
+        self.num_columns = max(self.num_columns, col + 1)
+        index, found = self._find(row, col)
+        if found and value:
+            self._values[index] = sys.intern(value)
+        elif found:
+            self._rows = np.delete(self._rows, index)
+            self._cols = np.delete(self._cols, index)
+            del self._values[index]
+        elif value:
+            self._rows = np.insert(self._rows, index, row)
+            self._cols = np.insert(self._cols, index, col)
+            self._values.insert(index, sys.intern(value))
+        self._touch()
+
+    def row_cells(self, row: int) -> List[Tuple[int, str]]:
+        """(column, value) of the filled cells in ``row``"""
+        lo, hi = self._span(row)
+        return list(zip(self._cols[lo:hi].tolist(), self._values[lo:hi]))
+
+    def cells(self) -> Iterator[Tuple[int, int, str]]:
+        """(row, column, value) of every filled cell, in order"""
+        return zip(self._rows.tolist(), self._cols.tolist(), self._values)
+
+    def __getitem__(self, row: int) -> List[str]:
+        if row < 0:
+            row += self.num_rows
+        if not 0 <= row < self.num_rows:
+            raise IndexError(row)
+        values = [""] * self.num_columns
+        for col, value in self.row_cells(row):
+            values[col] = value
+        return values
+
+    def __setitem__(self, row: int, values: List[str]):
+        """Replace a whole row; a row past the end grows the pattern"""
+        lo, hi = self._span(row)
+        filled = [(c, sys.intern(v)) for c, v in enumerate(values) if v]
+        self._rows = np.concatenate([self._rows[:lo], np.full(len(filled), row, dtype=np.int32),
+                                     self._rows[hi:]])
+        self._cols = np.concatenate([self._cols[:lo], np.array([c for c, _ in filled], dtype=np.int32),
+                                     self._cols[hi:]])
+        self._values[lo:hi] = [v for _, v in filled]
+        self.num_rows = max(self.num_rows, row + 1)
+        self.num_columns = max(self.num_columns, len(values))
+        self._touch()
+
+    def append(self, values: List[str]):
+        self[self.num_rows] = values
+
+    def __iter__(self) -> Iterator[List[str]]:
+        bounds = np.searchsorted(self._rows, np.arange(self.num_rows + 1)).tolist()
+        cols = self._cols.tolist()
+        for row in range(self.num_rows):
+            values = [""] * self.num_columns
+            for index in range(bounds[row], bounds[row + 1]):
+                values[cols[index]] = self._values[index]
+            yield values
+
+    def to_rows(self) -> List[List[str]]:
+        return list(self)
+
+
+class CellChange:
+    """One cell edit in a stored pattern"""
+
+    __slots__ = ('pattern', 'row', 'col', 'old', 'new')
+
+    def __init__(self, pattern: int, row: int, col: int, old: str, new: str):
+        self.pattern = pattern
+        self.row = row
+        self.col = col
+        self.old = old
+        self.new = new
+
+    def inverse(self) -> 'CellChange':
+        return CellChange(self.pattern, self.row, self.col, self.new, self.old)
+
+    def __repr__(self):
+        return f"CellChange({self.pattern}, {self.row}, {self.col}, {self.old!r} -> {self.new!r})"
+
 
 class PatternManager:
-    def __init__(self, max_patterns=100):
+    def __init__(self, max_patterns=100, max_undo=500):
         self.max_patterns = max_patterns
         self.patterns: Dict[int, Dict[str, Any]] = {}
         self.order_list: List[int] = []
+        # Rows edited since playback last picked up changes, by pattern number
+        self.dirty_rows: Dict[int, Set[int]] = {}
+        self._dirty_lock = threading.Lock()
+        # Called with every CellChange applied, including undos
+        self.listeners: List[Callable[[CellChange], None]] = []
+        self.undo_stack: List[CellChange] = []
+        self.max_undo = max_undo
 
         self._initialize_patterns()
 
     def _initialize_patterns(self):
-        blank_row = [""] * 12
-
         # Initialize Pattern 1 with defaults
         self.patterns[1] = {
             'name': 'Initial Pattern',
-            'data': [
-                ["x = 0", "v = 0.25", "f = 440"] + [""] * 9,
-                *[blank_row.copy() for _ in range(63)]
-            ]
+            'data': Pattern.from_rows([["x = 0", "v = 0.25", "f = 440"] + [""] * 9,
+                                       *[[] for _ in range(63)]])
         }
 
         # Initialize patterns 2-12 as blank
         for i in range(2, 13):
             self.patterns[i] = {
                 'name': f'Pattern {i}',
-                'data': [blank_row.copy() for _ in range(64)]
-            }
\ No newline at end of file
+                'data': Pattern(64, 12)
+            }
+
+    def replace(self, patterns: Dict[int, Dict[str, Any]], order_list: List[int]):
+        """Switch to another song's patterns, dropping the old song's undo history and edits"""
+        self.patterns = patterns
+        self.order_list = list(order_list)
+        self.undo_stack.clear()
+        with self._dirty_lock:
+            self.dirty_rows = {}
+
+    def clear(self):
+        self.replace({}, [])
+
+    def apply_change(self, change: CellChange, record: bool = True) -> bool:
+        """Patch one cell of a stored pattern; False if the pattern is not stored"""
+        pattern = self.patterns.get(change.pattern)
+        if not isinstance(pattern, dict):
+            return False
+        pattern['data'].set(change.row, change.col, change.new)
+
+        if record:
+            last = self.undo_stack[-1] if self.undo_stack else None
+            if last is not None and (last.pattern, last.row, last.col) == \
+                    (change.pattern, change.row, change.col):
+                # Typing into one cell undoes as a single step
+                last.new = change.new
+            else:
+                self.undo_stack.append(CellChange(change.pattern, change.row, change.col,
+                                                  change.old, change.new))
+                del self.undo_stack[:-self.max_undo]
+
+        self.mark_dirty(change.pattern, change.row)
+        for listener in self.listeners:
+            listener(change)
+        return True
+
+    def undo(self) -> Optional[CellChange]:
+        """Revert the last recorded change and return the change that did it.
+
+        Changes to cells that no longer hold the value they were set to
+        are dropped rather than reverted.
+        """
+        while self.undo_stack:
+            change = self.undo_stack.pop().inverse()
+            pattern = self.patterns.get(change.pattern)
+            if not isinstance(pattern, dict) or pattern['data'].get(change.row, change.col) != change.old:
+                continue
+            if change.old != change.new and self.apply_change(change, record=False):
+                return change
+        return None
+
+    def mark_dirty(self, pattern_num: int, row: int):
+        with self._dirty_lock:
+            self.dirty_rows.setdefault(pattern_num, set()).add(row)
+
+    def take_dirty(self) -> Dict[int, Dict[int, List[str]]]:
+        """Return and clear the edited rows as {pattern: {row: cell values}}"""
+        with self._dirty_lock:
+            dirty, self.dirty_rows = self.dirty_rows, {}
+        edits = {}
+        for pattern_num, rows in dirty.items():
+            pattern = self.patterns.get(pattern_num)
+            if pattern is None:
+                continue
+            data = pattern['data']
+            edits[pattern_num] = {row: list(data[row]) for row in rows if row < len(data)}
+        return edits
@@ -1,6 +1,6 @@
 import tkinter as tk
 from tkinter import ttk, messagebox
-from .pattern_manager import PatternManager
+from .pattern_manager import CellChange, Pattern, PatternManager
 
 class PatternUI:
     def __init__(self, parent, tracker):
@@ -47,7 +47,8 @@ class PatternUI:
 
         ttk.Label(order_frame, text="Play Order:").pack(side=tk.LEFT)
 
-        self.order_listbox = tk.Listbox(order_frame, height=3, width=20)
+        self.order_listbox = tk.Listbox(order_frame, height=3, width=20,
+                                        selectmode=tk.EXTENDED, exportselection=False)
         self.order_listbox.pack(side=tk.LEFT, padx=5, expand=True, fill=tk.X)
         self.order_listbox.bind('<Double-1>', self._load_selected_pattern)
 
@@ -95,28 +96,13 @@ class PatternUI:
             self.pattern_name_entry.delete(0, tk.END)
             self.pattern_name_entry.insert(0, pattern_name)
 
-            if hasattr(self, '_previous_pattern'):
-                try:
-                    old_pattern_num = int(self._previous_pattern)
-                    if old_pattern_num in self.pattern_manager.patterns:
-                        self.pattern_manager.patterns[old_pattern_num]['data'] = self.tracker.grid.get_values()
-                except ValueError:
-                    pass
-
+            # Edits already reached the stored pattern cell by cell, so the
+            # outgoing grid needs no copying back; only differing cells change
             self.tracker.rows_entry.delete(0, tk.END)
             self.tracker.rows_entry.insert(0, str(len(pattern_data)))
+            self.tracker.grid.load(pattern_data)
 
-            for row_idx, row_data in enumerate(pattern_data):
-                if row_idx < len(self.tracker.grid.cells):
-                    for col_idx, cell_value in enumerate(row_data):
-                        if col_idx < len(self.tracker.grid.cells[row_idx]):
-                            cell = self.tracker.grid.cells[row_idx][col_idx]
-                            cell.delete(0, tk.END)
-                            cell.insert(0, cell_value)
-
-            self.tracker.grid.parent.on_grid_edit = self._auto_save_pattern
-            self._previous_pattern = str(pattern_num)
-            self.tracker.update_grid()
+            self.tracker.grid.parent.on_cell_change = self._on_cell_change
 
         except ValueError:
             pass
@@ -132,10 +118,11 @@ class PatternUI:
 
             self.pattern_manager.patterns[pattern_num] = {
                 'name': pattern_name,
-                'data': self.tracker.grid.get_values()
+                'data': Pattern.from_rows(self.tracker.grid.get_values())
             }
 
-            self.tracker.grid.parent.on_grid_edit = self._auto_save_pattern
+            self.tracker.grid.parent.on_cell_change = self._on_cell_change
+            self.tracker.publish_song()
             messagebox.showinfo("Pattern Saved", f"Pattern {pattern_num} saved successfully")
 
         except ValueError:
@@ -166,6 +153,7 @@ class PatternUI:
 
                 self.pattern_manager.order_list.append(pattern_num)
                 self.order_listbox.insert(tk.END, self._format_pattern_display(pattern_num))
+                self.tracker.publish_song()
 
                 select_window.destroy()
             except IndexError:
@@ -186,20 +174,30 @@ class PatternUI:
             command=select_window.destroy
         ).pack(side=tk.LEFT)
 
-    def _auto_save_pattern(self):
-        """Automatically save changes to current pattern"""
+    def _on_cell_change(self, row: int, col: int, old: str, new: str):
+        """Save one edited cell into the current pattern"""
         try:
             pattern_num = int(self.current_pattern_number.get())
-            if pattern_num in self.pattern_manager.patterns:
-                current_data = self.tracker.grid.get_values()
-                pattern = self.pattern_manager.patterns[pattern_num]
-                if isinstance(pattern, dict) and len(pattern['data']) > len(current_data):
-                    preserved_data = pattern['data'][len(current_data):]
-                    current_data.extend(preserved_data)
-
-                self.pattern_manager.patterns[pattern_num]['data'] = current_data
+        except ValueError:
+            return
+        self.pattern_manager.apply_change(CellChange(pattern_num, row, col, old, new))
+        self.tracker.publish_song(full=False)
+        self.tracker.schedule_preroll()
+
+    def undo(self, event=None):
+        """Revert the last cell edit"""
+        change = self.pattern_manager.undo()
+        if change is None:
+            return
+        try:
+            if change.pattern == int(self.current_pattern_number.get()):
+                grid = self.tracker.grid
+                if change.row < grid.num_rows and change.col < grid.num_columns:
+                    grid.set_value(change.row, change.col, change.new)
         except ValueError:
             pass
+        self.tracker.publish_song(full=False)
+        self.tracker.schedule_preroll()
 
     def _load_selected_pattern(self, event):
         """Load the selected pattern from play order"""
@@ -221,5 +219,6 @@ class PatternUI:
             index = self.order_listbox.curselection()[0]
             self.order_listbox.delete(index)
             del self.pattern_manager.order_list[index]
+            self.tracker.publish_song()
         except IndexError:
             messagebox.showwarning("No Selection", "Select a pattern to remove")
\ No newline at end of file
@@ -0,0 +1,767 @@
+import bisect
+import hashlib
+import json
+import logging
+import re
+import threading
+import time
+from collections import deque
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from .renderer import (QUALITY_TIERS, FormulaProgram, Renderer, RenderQuality, RenderState,
+                       StateIndex, compile_program, playback_values)
+
+logger = logging.getLogger(__name__)
+
+HEADER_CELL = re.compile(r'^{(\w+)}$')
+
+
+class LoopRegion:
+    """A span of the play order to loop.
+
+    Covers order entries ``start_order`` up to, but not including,
+    ``end_order``. ``start_row`` and ``end_row`` narrow the first and last
+    entries, so a single entry with a row range loops part of one pattern.
+    """
+
+    def __init__(self, start_order: int, end_order: Optional[int] = None,
+                 start_row: int = 0, end_row: Optional[int] = None):
+        self.start_order = start_order
+        self.end_order = start_order + 1 if end_order is None else end_order
+        self.start_row = start_row
+        self.end_row = end_row
+
+    def contains(self, order_index: int, row: int) -> bool:
+        if not self.start_order <= order_index < self.end_order:
+            return False
+        if order_index == self.start_order and row < self.start_row:
+            return False
+        if order_index == self.end_order - 1 and self.end_row is not None and row >= self.end_row:
+            return False
+        return True
+
+    def __repr__(self):
+        return (f"LoopRegion({self.start_order}:{self.start_row} - "
+                f"{self.end_order - 1}:{'end' if self.end_row is None else self.end_row})")
+
+
+def _digest(*parts) -> str:
+    h = hashlib.sha1()
+    for part in parts:
+        h.update(repr(part).encode())
+        h.update(b'\0')
+    return h.hexdigest()
+
+
+class LoopCache:
+    """Rendered audio for a loop region, re-rendered only when it changes.
+
+    Two content hashes decide whether the cached audio is still valid. The
+    first covers everything up to the end of the region and is cheap to
+    compute. Only when it changes is a control pass run to find the state
+    the region starts from; if that state and the region's own patterns
+    are unchanged, the edit was elsewhere and the audio is kept.
+
+    ``row_starts`` holds (sample, order_index, row) for each row of the
+    cached audio, for placing the playhead while it loops.
+    """
+
+    def __init__(self, gain: float = 0.5):
+        self.gain = gain
+        self.audio: Optional[np.ndarray] = None
+        self.row_starts: List[Tuple[int, int, int]] = []
+        self._song_key: Optional[str] = None
+        self._region_key: Optional[str] = None
+        # What ``played`` last returned, and for which song, region and factor
+        self._played: Optional[Tuple[np.ndarray, List[Tuple[int, int, int]]]] = None
+        self._played_song = None
+        self._played_key = None
+        self._played_source: Optional[np.ndarray] = None
+
+    def invalidate(self):
+        self.audio = None
+        self.row_starts = []
+        self._song_key = None
+        self._region_key = None
+        self._played = None
+        self._played_song = None
+        self._played_key = None
+        self._played_source = None
+
+    def _patterns(self, renderer: Renderer, order: List[int]):
+        return [(num, renderer.patterns.get(num)) for num in order]
+
+    def _settings(self, renderer: Renderer):
+        return (renderer.formula_text, renderer.globals_text, renderer.sample_rate,
+                renderer.samples_per_row, renderer.speed, renderer.oversample, self.gain)
+
+    def audio_for(self, renderer: Renderer, region: LoopRegion) -> np.ndarray:
+        """Audio for ``region``, rendering it only if needed"""
+        order = renderer.order_list
+        if region.start_order >= len(order):
+            return np.zeros(0, dtype=np.float32)
+        song_key = _digest(self._settings(renderer), repr(region),
+                           self._patterns(renderer, order[:region.end_order]))
+        if song_key == self._song_key and self.audio is not None:
+            return self.audio
+
+        renderer.prepare()
+        index = StateIndex().build(renderer, end_order=region.end_order)
+        start = index.state_at(renderer, region.start_order, region.start_row)
+        if start is None:
+            logger.info(f"Loop region {region} has no rows to play")
+            self.invalidate()
+            return np.zeros(0, dtype=np.float32)
+        region_key = _digest(self._settings(renderer), repr(region),
+                             self._patterns(renderer, order[region.start_order:region.end_order]),
+                             json.dumps(start.to_dict(), sort_keys=True))
+        self._song_key = song_key
+        if region_key == self._region_key and self.audio is not None:
+            logger.info("Edit is outside the loop region; keeping cached audio")
+            return self.audio
+
+        logger.info(f"Rendering loop region {region}")
+        blocks = []
+        row_starts = []
+        offset = 0
+        for order_index, row, block in renderer.iter_rows(start, end_order=region.end_order):
+            if not region.contains(order_index, row):
+                break
+            blocks.append(block)
+            row_starts.append((offset, order_index, row))
+            offset += len(block)
+        audio = np.concatenate(blocks) if blocks else np.zeros(0, dtype=np.float32)
+        if self.gain != 1.0:
+            audio *= self.gain
+        self.audio = audio
+        self.row_starts = row_starts
+        self._region_key = region_key
+        return audio
+
+    def played(self, song, region: LoopRegion, make_renderer: Callable[[], Renderer],
+               factor: int = 1) -> Tuple[np.ndarray, List[Tuple[int, int, int]]]:
+        """The region's audio upsampled by ``factor``, and where its rows start in it.
+
+        ``song`` is whatever gets replaced rather than modified when the
+        song changes, such as a SongSnapshot. While it, the region and the
+        factor stay the same, the same buffer comes back without building a
+        renderer or hashing the song.
+        """
+        key = (repr(region), factor)
+        if self._played is not None and song is self._played_song and key == self._played_key:
+            return self._played
+        audio = self.audio_for(make_renderer(), region)
+        if self._played is None or audio is not self._played_source or key != self._played_key:
+            if factor > 1 and len(audio):
+                played = Upsampler(factor).process(audio)
+            else:
+                played = audio
+            row_starts = [(offset * factor, order_index, row)
+                          for offset, order_index, row in self.row_starts] if len(audio) else []
+            self._played = (played, row_starts)
+            self._played_source = audio
+        self._played_song = song
+        self._played_key = key
+        return self._played
+
+
+def _same_vars(a: Dict[str, object], b: Dict[str, object]) -> bool:
+    """Whether two variable dicts would render the same, without comparing arrays elementwise"""
+    if a.keys() != b.keys():
+        return False
+    for name, value in a.items():
+        other = b[name]
+        if value is other:
+            continue
+        if isinstance(value, np.ndarray) or isinstance(other, np.ndarray):
+            return False
+        try:
+            if value != other:
+                return False
+        except Exception:
+            return False
+    return True
+
+
+class PendingRow:
+    """A rendered row waiting to be played, with the state needed to redo it"""
+
+    __slots__ = ('order_index', 'row', 'pattern_num', 'vars_before', 'columns_before', 't',
+                 'vars_after', 'audio')
+
+    def __init__(self, order_index, row, pattern_num, vars_before, columns_before, t,
+                 vars_after, audio):
+        self.order_index = order_index
+        self.row = row
+        self.pattern_num = pattern_num
+        self.vars_before = vars_before
+        self.columns_before = columns_before
+        self.t = t
+        self.vars_after = vars_after
+        self.audio = audio
+
+
+class RowStream:
+    """Render rows a little ahead of the playhead and keep them editable.
+
+    Rows are rendered until ``lookahead`` samples are queued. When cells
+    change, ``apply_edits`` re-renders the queued rows they affect, and
+    keeps going downstream until a row ends in the same state as before.
+    The row under the playhead is re-rendered too and its unplayed part is
+    crossfaded into the new audio, so an edit is heard within one block.
+    """
+
+    def __init__(self, renderer: Renderer, start: Optional[RenderState] = None,
+                 lookahead: int = 22050, crossfade: Optional[Callable] = None,
+                 fade_samples: int = 500):
+        self.renderer = renderer
+        self.lookahead = lookahead
+        self.crossfade = crossfade
+        self.fade_samples = fade_samples
+        self.pending: Deque[PendingRow] = deque()
+        self.offset = 0  # samples of the head row already played
+
+        self.order_index = 0
+        self.row = 0
+        self.vars = renderer.initial_vars()
+        self.columns: Dict[int, object] = {}
+        self.t = renderer.start_t
+        if start is not None:
+            self.order_index = start.order_index
+            self.row = start.row
+            self.vars.update(start.vars)
+            self.columns.update(start.column_vars)
+            # Headers above the start row already played but still apply
+            data = renderer.patterns.get(renderer.order_list[start.order_index], [])
+            playback_values(data[:start.row], self.columns)
+            self.t = start.t
+            renderer.formula.phases.clear()
+            renderer.formula.phases.update(start.phases)
+        self.finished = False
+        # (offset, order_index, row) for rows starting in the last read
+        self.last_row_starts: List[Tuple[int, int, int]] = []
+
+    @property
+    def queued(self) -> int:
+        return sum(len(p.audio) for p in self.pending) - self.offset
+
+    @property
+    def position(self) -> Optional[Tuple[int, int]]:
+        """(order_index, row) under the playhead"""
+        if not self.pending:
+            return None
+        return self.pending[0].order_index, self.pending[0].row
+
+    def _render_next(self) -> Optional[PendingRow]:
+        renderer = self.renderer
+        order_list = renderer.order_list
+        while self.order_index < len(order_list):
+            data = renderer.patterns.get(order_list[self.order_index])
+            if data is not None and self.row < len(data):
+                break
+            self.order_index += 1
+            self.row = 0
+        else:
+            return None
+
+        pattern_num = order_list[self.order_index]
+        columns_before = dict(self.columns)
+        row_values = playback_values([renderer.patterns[pattern_num][self.row]], self.columns)[0]
+        vars_after = renderer.advance_row(self.vars, row_values)
+        num_samples = renderer.row_samples(vars_after)
+        audio = renderer.render_row(vars_after, self.t, num_samples)
+        pending = PendingRow(self.order_index, self.row, pattern_num, self.vars, columns_before,
+                             self.t, vars_after, audio)
+        self.vars = vars_after
+        self.t += num_samples
+        self.row += 1
+        return pending
+
+    def fill(self):
+        """Render rows until the look-ahead is covered"""
+        while not self.finished and self.queued < self.lookahead:
+            pending = self._render_next()
+            if pending is None:
+                self.finished = True
+                break
+            self.pending.append(pending)
+
+    def read(self, num_samples: int) -> np.ndarray:
+        """Take up to ``num_samples`` from the head of the queue"""
+        self.fill()
+        out = []
+        needed = num_samples
+        self.last_row_starts = []
+        while needed and self.pending:
+            head = self.pending[0]
+            if self.offset == 0:
+                self.last_row_starts.append((num_samples - needed, head.order_index, head.row))
+            chunk = head.audio[self.offset:self.offset + needed]
+            out.append(chunk)
+            needed -= len(chunk)
+            self.offset += len(chunk)
+            if self.offset >= len(head.audio):
+                self.pending.popleft()
+                self.offset = 0
+        return np.concatenate(out) if out else np.zeros(0, dtype=np.float32)
+
+    def _rewind(self, index: int):
+        """Drop queued rows from ``index`` on and continue rendering from there"""
+        first = self.pending[index]
+        while len(self.pending) > index:
+            self.pending.pop()
+        self.order_index = first.order_index
+        self.row = first.row
+        self.vars = first.vars_before
+        self.columns = dict(first.columns_before)
+        self.t = first.t
+        self.finished = False
+
+    def apply_edits(self, edits: Dict[int, Dict[int, Optional[List[str]]]]) -> int:
+        """Update pattern rows and re-render the queued rows they affect.
+
+        ``edits`` maps pattern number to {row: new cell values}, with
+        ``None`` for a row that was removed. Changing a ``{var}`` header
+        re-renders every queued row after it, since column declarations
+        carry over to later patterns. Returns the number of rows that were
+        re-rendered.
+        """
+        patterns = self.renderer.patterns
+        headers: Dict[int, int] = {}  # pattern number -> first edited header row
+        for pattern_num, rows in edits.items():
+            data = patterns.setdefault(pattern_num, [])
+            for row in sorted(rows):
+                values = rows[row]
+                old = data[row] if row < len(data) else []
+                if _declares(old) or (values is not None and _declares(values)):
+                    headers.setdefault(pattern_num, row)
+            removed = [row for row, values in rows.items() if values is None]
+            for row, values in rows.items():
+                if values is None:
+                    continue
+                while len(data) <= row:
+                    data.append([""] * len(values))
+                data[row] = list(values)
+            if removed:
+                del data[min(removed):]
+
+        dirty_rows = [i for i, p in enumerate(self.pending) if p.row in edits.get(p.pattern_num, ())]
+        if headers:
+            dirty_rows += self._after_headers(headers)
+        if not dirty_rows:
+            return 0
+        first = min(dirty_rows)
+        # A pattern repeated in the order can be queued again further on
+        last_dirty = max(dirty_rows) - first
+
+        old_rows = list(self.pending)[first:]
+        head_offset = self.offset if first == 0 else 0
+        self._rewind(first)
+        if headers:
+            self.columns = self._columns_at(self.order_index, self.row)
+
+        rerendered = 0
+        for old in old_rows:
+            new = self._render_next()
+            if new is None:
+                break
+            rerendered += 1
+            if rerendered == 1 and head_offset:
+                new.audio = self._splice(old.audio[head_offset:], new.audio[head_offset:])
+                new.audio = np.concatenate([old.audio[:head_offset], new.audio])
+            self.pending.append(new)
+            dirty = rerendered - 1 <= last_dirty
+            if not dirty and len(new.audio) == len(old.audio) and _same_vars(new.vars_after, old.vars_after):
+                # Everything after this row renders exactly as before
+                self.pending.extend(old_rows[rerendered:])
+                last = self.pending[-1]
+                self.order_index = last.order_index
+                self.row = last.row + 1
+                self.vars = last.vars_after
+                self.columns = self._columns_after(last)
+                self.t = last.t + len(last.audio)
+                break
+        logger.info(f"Re-rendered {rerendered} queued rows after an edit")
+        return rerendered
+
+    def swap_program(self, program: FormulaProgram):
+        """Switch to a new formula and globals at the current playhead.
+
+        Queued rows are re-rendered with ``program`` and the unplayed part
+        of the row under the playhead is crossfaded from the old output.
+        """
+        old_globals = self.renderer.formula.globals
+        self.renderer.use_program(program)
+        if not self.pending:
+            self.vars = self.renderer.rebase_vars(self.vars, old_globals)
+            return
+        old = self.pending[0]
+        head_offset = self.offset
+        self._rewind(0)
+        self.vars = self.renderer.rebase_vars(self.vars, old_globals)
+        self.fill()
+        if not self.pending:
+            return
+        new = self.pending[0]
+        new.audio = np.concatenate([old.audio[:head_offset],
+                                    self._splice(old.audio[head_offset:], new.audio[head_offset:])])
+        logger.info("Swapped in new formula during playback")
+
+    def _after_headers(self, headers: Dict[int, int]) -> List[int]:
+        """Indexes of queued rows whose columns depend on the given header rows"""
+        positions = [(order_index, headers[num])
+                     for order_index, num in enumerate(self.renderer.order_list) if num in headers]
+        if not positions:
+            return []
+        earliest = min(positions)
+        for i, pending in enumerate(self.pending):
+            if (pending.order_index, pending.row) > earliest:
+                return list(range(i, len(self.pending)))
+        return []
+
+    def _columns_at(self, order_index: int, row: int) -> Dict[int, object]:
+        """Column declarations in force at a row, derived from the top of the order"""
+        patterns = self.renderer.patterns
+        columns: Dict[int, object] = {}
+        for pattern_num in self.renderer.order_list[:order_index]:
+            playback_values(patterns.get(pattern_num, []), columns)
+        data = patterns.get(self.renderer.order_list[order_index], [])
+        playback_values(data[:row], columns)
+        return columns
+
+    def _columns_after(self, pending: PendingRow) -> Dict[int, object]:
+        columns = dict(pending.columns_before)
+        playback_values([self.renderer.patterns[pending.pattern_num][pending.row]], columns)
+        return columns
+
+    def _splice(self, old: np.ndarray, new: np.ndarray) -> np.ndarray:
+        """Fade from the old audio into the new at the playhead"""
+        fade_len = min(len(old), len(new), self.fade_samples)
+        if self.crossfade is None or fade_len == 0:
+            return new
+        faded = self.crossfade(old[:fade_len], new[:fade_len])
+        return np.concatenate([faded, new[fade_len:]])
+
+
+def _declares(row: List[str]) -> bool:
+    """Whether a row holds a ``{var}`` column header"""
+    return any(HEADER_CELL.match(value.strip()) for value in row)
+
+
+def song_key(renderer: Renderer) -> str:
+    """Content hash of everything that affects what ``renderer`` plays"""
+    return _digest(renderer.formula_text, renderer.globals_text, renderer.sample_rate,
+                   renderer.samples_per_row, renderer.speed, renderer.start_t, renderer.oversample,
+                   renderer.order_list, sorted(renderer.patterns.items()))
+
+
+class Preroll:
+    """The first rows of the song, rendered in the background before play.
+
+    ``start`` is called after a load or an edit with a renderer built from
+    a copy of the song. When play is pressed, ``take`` hands over the
+    rendered stream if the song has not changed since, so the first block
+    can go to the device straight away.
+    """
+
+    def __init__(self, lookahead: int = 22050, crossfade: Optional[Callable] = None,
+                 fade_samples: int = 500):
+        self.lookahead = lookahead
+        self.crossfade = crossfade
+        self.fade_samples = fade_samples
+        self._key: Optional[str] = None
+        self._stream: Optional[RowStream] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self, renderer: Renderer):
+        with self._lock:
+            self._generation += 1
+            self._stream = None
+            self._key = None
+            generation = self._generation
+        self._thread = threading.Thread(target=self._render, args=(generation, renderer),
+                                        daemon=True)
+        self._thread.start()
+
+    def _render(self, generation: int, renderer: Renderer):
+        try:
+            key = song_key(renderer)
+            renderer.prepare()
+            stream = RowStream(renderer, lookahead=self.lookahead, crossfade=self.crossfade,
+                               fade_samples=self.fade_samples)
+            stream.fill()
+        except Exception as e:
+            logger.error(f"Error pre-rendering playback: {e}", exc_info=True)
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._key = key
+                self._stream = stream
+
+    def take(self, renderer: Renderer) -> Optional[RowStream]:
+        """The pre-rendered stream if it matches ``renderer``'s song"""
+        key = song_key(renderer)
+        with self._lock:
+            if self._stream is None or key != self._key:
+                return None
+            stream, self._stream, self._key = self._stream, None, None
+        logger.info("Starting playback from pre-rendered audio")
+        return stream
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class QualityGovernor:
+    """Trade render quality for keeping up during live playback.
+
+    Steps down one tier on an underrun, or when the average load (render
+    time over block duration) across ``window`` blocks exceeds
+    ``degrade_load``. Steps back up once the load the next tier up would
+    have, estimated from the tiers' relative cost, is under
+    ``recover_load``. Tiers that would sound the same at the renderer's
+    ``oversample`` factor are stepped over together, so every step
+    changes what is rendered. Exports never use this and always render
+    in full.
+    """
+
+    def __init__(self, tiers: Optional[List[RenderQuality]] = None,
+                 degrade_load: float = 0.8, recover_load: float = 0.4, window: int = 16):
+        self.tiers = tiers or QUALITY_TIERS
+        self.degrade_load = degrade_load
+        self.recover_load = recover_load
+        self.window = window
+        # The renderer's oversampling factor; Player keeps it current
+        self.oversample = 1
+        self.level = 0
+        self._blocks = 0
+        self._underruns = 0
+
+    @property
+    def tier(self) -> RenderQuality:
+        return self.tiers[self.level]
+
+    def _next(self, direction: int) -> Optional[int]:
+        """Level of the nearest tier that renders differently, or None"""
+        tiers = self.tiers
+        level = self.level
+        while 0 <= level + direction < len(tiers) and tiers[level + direction].renders_like(
+                self.tier, self.oversample):
+            level += direction
+        level += direction
+        if not 0 <= level < len(tiers):
+            return None
+        # Land past any equivalent tiers, so the next step changes something too
+        while 0 <= level + direction < len(tiers) and tiers[level + direction].renders_like(
+                tiers[level], self.oversample):
+            level += direction
+        return level
+
+    def _step(self, level: Optional[int]) -> bool:
+        self._blocks = 0
+        if level is None:
+            return False
+        if level == self.level:
+            return False
+        self.level = level
+        logger.info(f"Playback quality: {self.tier.name}")
+        return True
+
+    def update(self, stats) -> bool:
+        """Call after each block with the engine's PlaybackStats; True on a change"""
+        self._blocks += 1
+        underran = stats.underruns > self._underruns
+        self._underruns = stats.underruns
+        if underran:
+            return self._step(self._next(1))
+        if self._blocks < self.window:
+            return False
+        render_time = sum(list(stats.render_times)[-self.window:])
+        deadline = sum(list(stats.deadlines)[-self.window:])
+        load = render_time / deadline if deadline else 0.0
+        if load > self.degrade_load:
+            return self._step(self._next(1))
+        up = self._next(-1)
+        if up is not None and (load * self.tiers[up].cost(self.oversample)
+                               / self.tier.cost(self.oversample)) < self.recover_load:
+            return self._step(up)
+        self._blocks = 0
+        return False
+
+
+class ProgramCompiler:
+    """Compile formula and globals edits off the audio thread.
+
+    ``request`` starts a compile in the background; the playback loop
+    calls ``take`` at each block boundary and swaps in whatever is ready.
+    A compile that fails is dropped and its error kept in ``error``, so
+    the previous program keeps playing. Only the latest request counts.
+    """
+
+    def __init__(self):
+        self.error: Optional[str] = None
+        self._ready: Optional[FormulaProgram] = None
+        self._generation = 0
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+
+    def request(self, formula_text: str, globals_text: str):
+        with self._lock:
+            self._generation += 1
+            generation = self._generation
+        self._thread = threading.Thread(target=self._compile,
+                                        args=(generation, formula_text, globals_text),
+                                        daemon=True)
+        self._thread.start()
+
+    def _compile(self, generation: int, formula_text: str, globals_text: str):
+        try:
+            program = compile_program(formula_text, globals_text)
+        except Exception as e:
+            logger.warning(f"Formula edit not applied: {e}")
+            with self._lock:
+                if generation == self._generation:
+                    self.error = str(e)
+            return
+        with self._lock:
+            if generation == self._generation:
+                self._ready = program
+                self.error = None
+
+    def take(self) -> Optional[FormulaProgram]:
+        """The newest compiled program not yet taken, if any"""
+        with self._lock:
+            program, self._ready = self._ready, None
+        return program
+
+    def join(self, timeout: Optional[float] = None):
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+
+class PlayTimeline:
+    """Where each row starts on the engine's sample clock.
+
+    The producer adds a marker as each row is queued; the UI asks which
+    row is under ``AudioEngine.clock()`` to place the playhead.
+    """
+
+    def __init__(self):
+        self._frames: List[int] = []
+        self._positions: List[Tuple[int, int]] = []
+        self._lock = threading.Lock()
+
+    def add(self, frame: int, order_index: int, row: int):
+        with self._lock:
+            self._frames.append(frame)
+            self._positions.append((order_index, row))
+
+    def at(self, frame: int) -> Optional[Tuple[int, int]]:
+        """(order_index, row) playing at ``frame``, if any"""
+        with self._lock:
+            index = bisect.bisect_right(self._frames, frame) - 1
+            if index < 0:
+                return None
+            # Rows that have been played will not be asked for again
+            if index > 1024:
+                del self._frames[:index]
+                del self._positions[:index]
+                index = 0
+            return self._positions[index]
+
+    def clear(self):
+        with self._lock:
+            self._frames.clear()
+            self._positions.clear()
+
+
+class Upsampler:
+    """Linear interpolation up by an integer factor, continuous across blocks.
+
+    Cheap enough for draft previews rendered at a fraction of the device
+    rate; each output block ends exactly on the input block's last sample.
+    """
+
+    def __init__(self, factor: int):
+        self.factor = factor
+        self._ramp = np.arange(1, factor + 1, dtype=np.float32) / factor
+        self._last: Optional[np.float32] = None
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        if self.factor == 1 or not len(block):
+            return block
+        previous = block[0] if self._last is None else self._last
+        points = np.concatenate([[previous], block]).astype(np.float32)
+        self._last = points[-1]
+        steps = np.diff(points)
+        return (points[:-1, None] + steps[:, None] * self._ramp[None, :]).ravel()
+
+
+class Player:
+    """Feed a RowStream into an AudioEngine, whatever sink it plays to.
+
+    Each block it applies pending cell edits and formula swaps, renders,
+    records timing in the engine's stats and lets the block size and
+    quality controllers react before queueing the audio. Queued audio is
+    also appended to ``waveform``, a WaveformPyramid, when one is given.
+    """
+
+    def __init__(self, engine, block_control=None, governor: Optional[QualityGovernor] = None,
+                 gain: float = 0.5, timeline: Optional[PlayTimeline] = None, waveform=None):
+        self.engine = engine
+        self.block_control = block_control
+        self.governor = governor
+        self.gain = gain
+        self.timeline = timeline
+        self.waveform = waveform
+
+    def play(self, rows: RowStream, stop_event: threading.Event,
+             take_edits: Optional[Callable[[], Dict[int, Dict[int, List[str]]]]] = None,
+             take_program: Optional[Callable[[], Optional[FormulaProgram]]] = None):
+        """Play ``rows`` until they run out or ``stop_event`` is set"""
+        engine = self.engine
+        block_size = engine.buffer_size
+        if self.block_control is not None:
+            block_size = self.block_control.block_size
+            engine.set_lookahead(self.block_control.lookahead)
+        # Draft previews render at a fraction of the device rate
+        factor = max(1, engine.sample_rate // rows.renderer.sample_rate)
+        upsampler = Upsampler(factor)
+        if self.governor is not None:
+            self.governor.oversample = rows.renderer.oversample
+            rows.renderer.quality = self.governor.tier
+        engine.start()
+
+        while not stop_event.is_set():
+            if take_edits is not None:
+                edits = take_edits()
+                if edits:
+                    rows.apply_edits(edits)
+            if take_program is not None:
+                program = take_program()
+                if program is not None:
+                    rows.swap_program(program)
+            started = time.perf_counter()
+            block = upsampler.process(rows.read(max(1, block_size // factor)))
+            if not len(block):
+                break
+            engine.stats.record_render(time.perf_counter() - started, len(block))
+            if self.block_control is not None and self.block_control.update(engine.stats):
+                # Takes effect from the next block; the audio itself is continuous
+                block_size = self.block_control.block_size
+                engine.set_lookahead(self.block_control.lookahead)
+            if self.governor is not None and self.governor.update(engine.stats):
+                rows.renderer.quality = self.governor.tier
+            if self.timeline is not None:
+                base = engine.ring.written
+                for offset, order_index, row in rows.last_row_starts:
+                    self.timeline.add(base + offset * factor, order_index, row)
+            block = block * self.gain
+            if self.waveform is not None:
+                self.waveform.append(block)
+            engine.write(block, stop_event)
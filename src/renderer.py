@@ -0,0 +1,589 @@
+import re
+import threading
+import tracemalloc
+import logging
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from .formula_engine import FormulaEngine
+from .resample import PolyphaseDecimator
+
+logger = logging.getLogger(__name__)
+
+# Variables every row starts from before globals and cells are applied
+DEFAULT_VARS = {
+    't': 0,  # time
+    'r': 5,  # default rate for modulation effects
+    'd': 0.1,  # default depth for modulation effects
+    'f': 440,  # default frequency
+    's': 44100,  # sample rate, replaced by the rate being rendered
+}
+
+
+def playback_values(rows: List[List[str]], column_vars: Dict[int, object]) -> List[List[str]]:
+    """Convert raw cell values to executable playback statements.
+
+    ``column_vars`` maps column index to the variable declared by a
+    ``{name}`` header and is updated in place, so declarations carry over
+    from one pattern to the next.
+    """
+    result = []
+    for row in rows:
+        row_values = []
+        for col, value in enumerate(row):
+            value = value.strip()
+            if not value:
+                row_values.append("")
+                continue
+
+            # Handle {var} notation
+            var_match = re.match(r'^{(\w+)}$', value)
+            if var_match:
+                column_vars[col] = var_match.group(1)
+                row_values.append("")  # Skip this cell in playback
+                continue
+
+            if col in column_vars:
+                var_name = column_vars[col]
+
+                # Handle compound operators
+                compound_match = re.match(r'^([+-/*])=(\d+.?\d*)$', value)
+                if compound_match:
+                    op, num = compound_match.groups()
+                    row_values.append(f"{var_name} = {var_name} {op} {num}")
+                elif var_name == 'speed':
+                    # Handle speed variable specially
+                    try:
+                        row_values.append(f"speed = {float(value)}")
+                    except ValueError:
+                        row_values.append("")
+                else:
+                    row_values.append(f"{var_name} = {value}")
+            else:
+                row_values.append(value)  # Default case: use value as-is
+        result.append(row_values)
+    return result
+
+
+def _json_safe(value):
+    """Return a JSON-compatible copy of value, or raise TypeError"""
+    if value is None or isinstance(value, (bool, int, float, str)):
+        return value
+    if isinstance(value, np.generic):
+        return value.item()
+    if isinstance(value, (list, tuple)):
+        return [_json_safe(item) for item in value]
+    raise TypeError(f"Cannot serialize {type(value).__name__}")
+
+
+class RenderState:
+    """Everything needed to continue a render from the start of a row.
+
+    ``vars`` are the variables before the row's cells run and
+    ``column_vars`` the column declarations at the start of its pattern.
+    """
+
+    def __init__(self, order_index: int = 0, vars_dict: Optional[Dict[str, object]] = None,
+                 column_vars: Optional[Dict[int, object]] = None, t: int = 0,
+                 phases: Optional[Dict[str, float]] = None, row: int = 0):
+        self.order_index = order_index
+        self.row = row
+        self.vars = dict(vars_dict or {})
+        self.column_vars = dict(column_vars or {})
+        self.t = t
+        self.phases = dict(phases or {})
+
+    def to_dict(self) -> Dict[str, object]:
+        # Functions, modules and arrays come back from the globals on restore
+        variables = {}
+        for name, value in self.vars.items():
+            try:
+                variables[name] = _json_safe(value)
+            except TypeError:
+                pass
+        return {
+            'order_index': self.order_index,
+            'row': self.row,
+            'vars': variables,
+            'column_vars': {str(col): name for col, name in self.column_vars.items()},
+            't': int(self.t),
+            'phases': {name: float(phase) for name, phase in self.phases.items()},
+        }
+
+    @classmethod
+    def from_dict(cls, data: Dict[str, object]) -> 'RenderState':
+        return cls(
+            order_index=data['order_index'],
+            vars_dict=data['vars'],
+            column_vars={int(col): name for col, name in data['column_vars'].items()},
+            t=data['t'],
+            phases=data['phases'],
+            row=data.get('row', 0),
+        )
+
+
+class MemoryTracker:
+    """Record peak traced memory per render stage using tracemalloc.
+
+    Stages are meant to run one after another; nesting them resets the
+    outer stage's peak.
+    """
+
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.peaks: Dict[str, int] = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.enabled:
+            yield
+            return
+
+        started_here = not tracemalloc.is_tracing()
+        if started_here:
+            tracemalloc.start()
+        baseline, _ = tracemalloc.get_traced_memory()
+        tracemalloc.reset_peak()
+        try:
+            yield
+        finally:
+            _, peak = tracemalloc.get_traced_memory()
+            self.peaks[name] = max(self.peaks.get(name, 0), peak - baseline)
+            if started_here:
+                tracemalloc.stop()
+
+    @property
+    def peak(self) -> int:
+        return max(self.peaks.values(), default=0)
+
+    def report(self) -> str:
+        return ", ".join(f"{name}: {peak / 1e6:.1f} MB" for name, peak in self.peaks.items())
+
+
+class FormulaProgram:
+    """Executed globals and a compiled formula, ready to swap into a renderer"""
+
+    def __init__(self, formula, formula_text: str, globals_text: str, code,
+                 function_refs: Dict[str, object]):
+        self.formula = formula
+        self.formula_text = formula_text
+        self.globals_text = globals_text
+        self.code = code
+        self.function_refs = function_refs
+
+
+def compile_program(formula_text: str, globals_text: str) -> FormulaProgram:
+    """Run the globals in a fresh engine and compile the formula.
+
+    Unlike ``Renderer.prepare`` errors are raised rather than logged, so a
+    broken edit can be rejected while the current program keeps playing.
+    Touches no shared state and is safe to call from any thread.
+    """
+    formula = FormulaEngine()
+    exec(globals_text, formula.globals)
+    code = compile(formula_text, '<formula>', 'exec')
+    function_refs = {name: value for name, value in formula.globals.items() if callable(value)}
+    return FormulaProgram(formula, formula_text, globals_text, code, function_refs)
+
+
+class RenderQuality:
+    """A live playback quality tier.
+
+    ``stride`` evaluates the formula on every n-th sample and interpolates
+    the rest; ``cull_below`` skips rows whose scalar volume ``v`` is below
+    the threshold and renders silence for them. ``oversample``, when set,
+    caps the renderer's oversampling factor.
+    """
+
+    def __init__(self, name: str, stride: int = 1, cull_below: float = 0.0,
+                 oversample: Optional[int] = None):
+        self.name = name
+        self.stride = stride
+        self.cull_below = cull_below
+        self.oversample = oversample
+
+    def factor(self, oversample: int) -> int:
+        """Oversampling factor used by a renderer set to ``oversample``"""
+        if self.stride > 1:
+            return 1
+        if self.oversample is None:
+            return oversample
+        return min(oversample, self.oversample)
+
+    def cost(self, oversample: int = 1) -> float:
+        """Rough render cost relative to a plain full quality render"""
+        return self.factor(oversample) / self.stride
+
+    def renders_like(self, other: 'RenderQuality', oversample: int = 1) -> bool:
+        """True if both tiers produce the same audio at this oversampling factor"""
+        return (self.stride == other.stride and self.cull_below == other.cull_below
+                and self.factor(oversample) == other.factor(oversample))
+
+    def __repr__(self):
+        return f"RenderQuality({self.name!r})"
+
+
+# Tiers live playback steps down through under deadline pressure;
+# oversampling goes first, being the most costly and least audible
+QUALITY_TIERS = [
+    RenderQuality('full'),
+    RenderQuality('no-oversample', oversample=1),
+    RenderQuality('cull', cull_below=1e-3, oversample=1),
+    RenderQuality('half-rate', stride=2, cull_below=1e-3, oversample=1),
+    RenderQuality('quarter-rate', stride=4, cull_below=1e-3, oversample=1),
+]
+
+
+class Renderer:
+    """Render the play order to audio without touching any UI state"""
+
+    def __init__(self, formula, patterns: Dict[int, List[List[str]]], order_list: List[int],
+                 formula_text: str, globals_text: str, speed: float = 4.0,
+                 sample_rate: int = 44100, samples_per_row: Optional[int] = None,
+                 start_t: int = 0, stop_event: Optional[threading.Event] = None,
+                 track_memory: bool = False, oversample: int = 1):
+        self.formula = formula
+        self.patterns = patterns
+        self.order_list = list(order_list)
+        self.formula_text = formula_text
+        self.globals_text = globals_text
+        self.speed = speed
+        self.sample_rate = sample_rate
+        self.samples_per_row = samples_per_row
+        self.start_t = start_t
+        self.t = start_t
+        self.stop_event = stop_event
+        self.memory = MemoryTracker(enabled=track_memory)
+        self._code = None
+        self._function_refs: Dict[str, object] = {}
+        # Only live playback lowers this; offline renders stay at full quality
+        self.quality = QUALITY_TIERS[0]
+        # Evaluate the formula at this multiple of the sample rate and
+        # decimate, against aliasing from high notes and FM
+        self.oversample = oversample
+        self._decimator: Optional[PolyphaseDecimator] = None
+        self._decimator_t: Optional[int] = None
+
+    def prepare(self):
+        """Execute the globals and compile the formula once per render"""
+        self.formula.update_globals(self.globals_text)
+        # Waveform helpers divide by ``s``, so it must be the rate we render at
+        self.formula.globals['s'] = self.sample_rate
+        self._function_refs = {
+            name: value for name, value in self.formula.globals.items() if callable(value)
+        }
+        try:
+            self._code = compile(self.formula_text, '<formula>', 'exec')
+        except SyntaxError as e:
+            logger.error(f"Error compiling formula: {e}")
+            self._code = None
+
+    def use_program(self, program: FormulaProgram):
+        """Render from now on with ``program``, keeping oscillator phases"""
+        program.formula.phases = self.formula.phases
+        program.formula.globals['s'] = self.sample_rate
+        self.formula = program.formula
+        self.formula_text = program.formula_text
+        self.globals_text = program.globals_text
+        self._code = program.code
+        self._function_refs = program.function_refs
+
+    def rebase_vars(self, vars_dict: Dict[str, object],
+                    old_globals: Dict[str, object]) -> Dict[str, object]:
+        """Carry running variables over to the current globals after a program swap.
+
+        Values still seeded from ``old_globals`` take the new globals'
+        values; anything a row has assigned since is kept.
+        """
+        rebased = dict(vars_dict)
+        for name, value in self.formula.globals.items():
+            if name.startswith('__') or callable(value):
+                continue
+            if name not in rebased or (name in old_globals and rebased[name] is old_globals[name]):
+                rebased[name] = value
+        rebased['s'] = self.sample_rate
+        return rebased
+
+    def initial_vars(self) -> Dict[str, object]:
+        vars_dict = dict(DEFAULT_VARS)
+        vars_dict.update(self.formula.globals)
+        vars_dict['s'] = self.sample_rate
+        vars_dict['speed'] = self.speed
+        return vars_dict
+
+    def row_samples(self, vars_dict: Dict[str, object]) -> int:
+        """Number of samples a row lasts given its variables"""
+        if self.samples_per_row is not None:
+            return self.samples_per_row
+        try:
+            return int(self.sample_rate / float(vars_dict.get('speed', 4.0)))
+        except (ValueError, TypeError, ZeroDivisionError) as e:
+            logger.error(f"Error calculating row samples: {e}")
+            return int(self.sample_rate / 4.0)
+
+    def advance_row(self, vars_dict: Dict[str, object], row: List[str]) -> Dict[str, object]:
+        """Apply one row's cells to a copy of the running variables"""
+        row_vars = vars_dict.copy()
+        for cell_value in row:
+            if cell_value:
+                try:
+                    exec(cell_value, self.formula.globals, row_vars)
+                except Exception as e:
+                    logger.error(f"Error processing cell: {e}. Cell value: {cell_value}")
+        return row_vars
+
+    def _stopped(self) -> bool:
+        return self.stop_event is not None and self.stop_event.is_set()
+
+    def control_rows(self, start: Optional[RenderState] = None, end_order: Optional[int] = None,
+                     on_pattern=None) -> Iterator[Tuple[int, int, Dict[str, object], int]]:
+        """Yield (order_index, row, vars, samples) without evaluating the formula.
+
+        Rendering begins at ``start`` (or the top of the song) and stops
+        before ``end_order``. ``on_pattern(order_index, row, vars,
+        column_vars)`` is called as each order entry begins.
+        """
+        vars_dict = self.initial_vars()
+        column_vars: Dict[int, object] = {}
+        first_order = first_row = 0
+        if start is not None:
+            vars_dict.update(start.vars)
+            column_vars.update(start.column_vars)
+            first_order = start.order_index
+            first_row = start.row
+        last_order = len(self.order_list) if end_order is None else min(end_order, len(self.order_list))
+
+        for order_index in range(first_order, last_order):
+            if self._stopped():
+                logger.info("Render stopped")
+                return
+            skip = first_row if order_index == first_order else 0
+            if on_pattern is not None:
+                on_pattern(order_index, skip, vars_dict, column_vars)
+            pattern_num = self.order_list[order_index]
+            data = self.patterns.get(pattern_num)
+            if data is None:
+                logger.warning(f"Pattern {pattern_num} in play order does not exist")
+                continue
+            rows = playback_values(data, column_vars)
+            for row_idx in range(skip, len(rows)):
+                vars_dict = self.advance_row(vars_dict, rows[row_idx])
+                yield order_index, row_idx, vars_dict, self.row_samples(vars_dict)
+
+    def render_row(self, vars_dict: Dict[str, object], start_t: int, num_samples: int) -> np.ndarray:
+        """Evaluate the formula for one row at the current quality"""
+        if self._code is None:
+            return np.zeros(num_samples, dtype=np.float32)
+        quality = self.quality
+        if quality.cull_below:
+            volume = vars_dict.get('v')
+            if isinstance(volume, (int, float)) and abs(volume) < quality.cull_below:
+                return np.zeros(num_samples, dtype=np.float32)
+        oversample = quality.factor(self.oversample)
+        if oversample > 1:
+            return self._render_oversampled(vars_dict, start_t, num_samples, oversample)
+        t = np.linspace(start_t, start_t + num_samples - 1, num_samples, dtype=np.float32)
+        if quality.stride == 1 or num_samples <= quality.stride:
+            return self._evaluate(vars_dict, t)
+        # Evaluate every ``stride``-th sample (and the last) and interpolate
+        index = np.arange(0, num_samples, quality.stride)
+        if index[-1] != num_samples - 1:
+            index = np.append(index, num_samples - 1)
+        coarse = self._evaluate(vars_dict, t[index])
+        return np.interp(np.arange(num_samples), index, coarse).astype(np.float32)
+
+    def _render_oversampled(self, vars_dict: Dict[str, object], start_t: int,
+                            num_samples: int, factor: int) -> np.ndarray:
+        """Evaluate at ``factor`` times the rate and decimate.
+
+        ``t`` stays in output samples and steps by fractions. The filter
+        state runs on from the previous row when rows are rendered in
+        order; after a jump it is primed from this row's own formula. The
+        formula is evaluated ahead by the filter delay so that output
+        samples line up with a plain render.
+        """
+        decimator = self._decimator
+        if decimator is None or decimator.factor != factor:
+            decimator = self._decimator = PolyphaseDecimator(factor)
+            self._decimator_t = None
+        first = start_t * factor + decimator.delay
+        if self._decimator_t != start_t:
+            primer = np.arange(first - len(decimator.taps) + 1, first) / factor
+            decimator.reset(self._evaluate(vars_dict, primer))
+        t = np.arange(first, first + num_samples * factor) / factor
+        output = decimator.process(self._evaluate(vars_dict, t))
+        self._decimator_t = start_t + num_samples
+        return output
+
+    def _evaluate(self, vars_dict: Dict[str, object], t: np.ndarray) -> np.ndarray:
+        num_samples = len(t)
+        try:
+            self.formula.globals['t'] = t
+            for name, func in self._function_refs.items():
+                self.formula.globals[name] = func
+
+            local_vars = {**self.formula.globals, **vars_dict}
+            local_vars['t'] = t
+            local_vars.update(self._function_refs)
+            exec(self._code, self.formula.globals, local_vars)
+
+            if 'output' not in local_vars:
+                logger.warning("No output variable found in formula execution")
+                return np.zeros(num_samples, dtype=np.float32)
+            output = np.asarray(local_vars['output'], dtype=np.float32).ravel()
+            if output.size == 1:
+                return np.full(num_samples, output[0], dtype=np.float32)
+            if output.size != num_samples:
+                output = np.resize(output, num_samples)
+            return output
+        except Exception as e:
+            logger.error(f"Error generating audio: {e}", exc_info=True)
+            return np.zeros(num_samples, dtype=np.float32)
+
+    def state(self, order_index: int, vars_dict: Dict[str, object],
+              column_vars: Dict[int, object], row: int = 0) -> RenderState:
+        return RenderState(order_index, vars_dict, column_vars, self.t, self.formula.phases, row)
+
+    def iter_rows(self, start: Optional[RenderState] = None, end_order: Optional[int] = None,
+                  on_pattern=None) -> Iterator[Tuple[int, int, np.ndarray]]:
+        """Yield (order_index, row, samples) for each rendered row.
+
+        ``on_pattern`` receives the RenderState at the start of each order
+        entry, before any of its rows are rendered. When ``start`` is in
+        the middle of an entry, the first call is for that row instead.
+        """
+        self.t = self.start_t
+        if start is not None:
+            self.t = start.t
+            self.formula.phases.clear()
+            self.formula.phases.update(start.phases)
+
+        def pattern_started(order_index, row, vars_dict, column_vars):
+            on_pattern(self.state(order_index, vars_dict, column_vars, row))
+
+        rows = self.control_rows(start, end_order, pattern_started if on_pattern else None)
+        for order_index, row_idx, vars_dict, num_samples in rows:
+            block = self.render_row(vars_dict, self.t, num_samples)
+            self.t += num_samples
+            yield order_index, row_idx, block
+
+    def total_samples(self) -> int:
+        return sum(num_samples for *_, num_samples in self.control_rows())
+
+    def render(self, gain: float = 1.0) -> np.ndarray:
+        """Render the whole play order into a single buffer in RAM.
+
+        Long songs should be streamed with ``render_to`` or an ExportJob,
+        which hold one row at a time.
+        """
+        logger.info("Starting audio generation")
+        self.prepare()
+        with self.memory.stage('control'):
+            total = self.total_samples()
+
+        with self.memory.stage('allocate'):
+            buffer = np.zeros(total, dtype=np.float32)
+
+        pos = 0
+        with self.memory.stage('render'):
+            for _, _, block in self.iter_rows():
+                n = min(len(block), total - pos)
+                buffer[pos:pos + n] = block[:n]
+                pos += n
+
+        with self.memory.stage('gain'):
+            if gain != 1.0:
+                buffer *= gain
+
+        if pos < len(buffer):
+            buffer = buffer[:pos]
+        logger.info(f"Audio generation complete. Buffer size: {len(buffer)}")
+        if self.memory.enabled:
+            logger.info(f"Render peak memory by stage: {self.memory.report()}")
+        return buffer
+
+    def render_to(self, writer, gain: float = 1.0) -> int:
+        """Stream rendered rows into ``writer`` as they are produced.
+
+        Only one row is held in memory at a time. Returns the number of
+        samples written.
+        """
+        logger.info("Starting streaming render")
+        self.prepare()
+        written = 0
+        with self.memory.stage('render'):
+            for _, _, block in self.iter_rows():
+                if gain != 1.0:
+                    block *= gain
+                writer.write(block)
+                written += len(block)
+        logger.info(f"Streaming render complete. Samples written: {written}")
+        if self.memory.enabled:
+            logger.info(f"Render peak memory by stage: {self.memory.report()}")
+        return written
+
+
+class StateIndex:
+    """Row states sampled by a control-only pass, for seeking.
+
+    A snapshot is kept at the start of every play order entry and every
+    ``interval`` rows within it. Only cells are executed to build it, so
+    it costs a small fraction of a render. Oscillator phases set from the
+    formula are not known without rendering and start from zero.
+    """
+
+    def __init__(self, interval: int = 16):
+        self.interval = max(1, interval)
+        self.snapshots: Dict[Tuple[int, int], RenderState] = {}
+
+    def build(self, renderer: Renderer, end_order: Optional[int] = None) -> 'StateIndex':
+        """Index ``renderer``'s song up to ``end_order``; the renderer must be prepared"""
+        self.snapshots.clear()
+        pattern_columns: Dict[int, Dict[int, object]] = {}
+
+        def pattern_started(order_index, row, vars_dict, column_vars):
+            pattern_columns[order_index] = dict(column_vars)
+
+        vars_before = renderer.initial_vars()
+        t = 0
+        rows = renderer.control_rows(end_order=end_order, on_pattern=pattern_started)
+        for order_index, row, vars_dict, num_samples in rows:
+            if row % self.interval == 0:
+                self.snapshots[(order_index, row)] = RenderState(
+                    order_index, vars_before, pattern_columns[order_index], t, row=row
+                )
+            vars_before = vars_dict
+            t += num_samples
+        logger.info(f"Built state index with {len(self.snapshots)} snapshots")
+        return self
+
+    def state_at(self, renderer: Renderer, order_index: int, row: int = 0) -> Optional[RenderState]:
+        """State at the start of ``row`` of the given play order entry.
+
+        A row past the end of the entry's pattern is clamped to its last
+        row. An entry with no rows (an empty or missing pattern) falls
+        forward to the next indexed entry; None if there is none.
+        """
+        if (order_index, 0) not in self.snapshots:
+            later = [index for index, first in self.snapshots if index > order_index and first == 0]
+            if not later:
+                return None
+            return self.snapshots[(min(later), 0)]
+        data = renderer.patterns.get(renderer.order_list[order_index]) or []
+        row = max(0, min(row, len(data) - 1))
+        nearest = row - row % self.interval
+        snapshot = self.snapshots[(order_index, nearest)]
+        if nearest == row:
+            return snapshot
+
+        # Replay the few rows between the snapshot and the target
+        vars_dict = snapshot.vars
+        t = snapshot.t
+        for _, current, row_vars, num_samples in renderer.control_rows(snapshot, order_index + 1):
+            if current == row:
+                break
+            vars_dict = row_vars
+            t += num_samples
+        return RenderState(order_index, vars_dict, snapshot.column_vars, t, row=row)
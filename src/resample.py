@@ -0,0 +1,60 @@
+import logging
+from functools import lru_cache
+from typing import Optional
+
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+logger = logging.getLogger(__name__)
+
+
+@lru_cache(maxsize=None)
+def decimation_filter(factor: int, taps_per_phase: int = 16) -> np.ndarray:
+    """Linear-phase low-pass for decimating by ``factor``, computed once per factor.
+
+    Odd length, so the group delay is a whole number of input samples.
+    The cutoff sits a little below the output Nyquist frequency.
+    """
+    length = factor * taps_per_phase + 1
+    n = np.arange(length) - (length - 1) / 2
+    cutoff = 0.9 / factor
+    h = np.sinc(n * cutoff) * np.kaiser(length, 8.0)
+    h /= h.sum()
+    h.setflags(write=False)
+    return h
+
+
+class PolyphaseDecimator:
+    """Low-pass and keep every ``factor``-th sample, block by block.
+
+    Only the kept outputs are computed, each as a dot product over a
+    sliding window, and the last ``len(filter) - 1`` inputs are carried
+    to the next block, so splitting the input into blocks of any size
+    gives the same output as processing it in one go.
+    """
+
+    def __init__(self, factor: int, taps_per_phase: int = 16):
+        self.factor = factor
+        self.taps = decimation_filter(factor, taps_per_phase)[::-1].copy()
+        self.delay = (len(self.taps) - 1) // 2
+        self.reset()
+
+    def reset(self, history: Optional[np.ndarray] = None):
+        """Start over, optionally with the inputs that came just before"""
+        self._history = np.zeros(len(self.taps) - 1, dtype=np.float64)
+        if history is not None and len(history):
+            history = np.asarray(history, dtype=np.float64)[-len(self._history):]
+            self._history[len(self._history) - len(history):] = history
+        self._phase = 0  # inputs to skip before the next kept output
+
+    def process(self, block: np.ndarray) -> np.ndarray:
+        block = np.asarray(block, dtype=np.float64)
+        if not len(block):
+            return np.zeros(0, dtype=np.float32)
+        extended = np.concatenate([self._history, block])
+        windows = sliding_window_view(extended, len(self.taps))[self._phase::self.factor]
+        out = windows @ self.taps
+        consumed = self._phase + len(out) * self.factor
+        self._phase = consumed - len(block)
+        self._history = extended[len(block):]
+        return out.astype(np.float32)
@@ -0,0 +1,169 @@
+import sys
+import threading
+import time
+import logging
+from typing import Optional
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class AudioSink:
+    """Where an AudioEngine sends its output.
+
+    A sink pulls audio from the engine once opened. Realtime sinks run the
+    engine's callback at the device rate and get silence when nothing is
+    queued; unthrottled sinks take audio as fast as
+    the producer renders it, which makes them useful for benchmarking.
+    """
+
+    # Samples between leaving the engine and being heard
+    latency = 0
+
+    def open(self, engine):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class SoundDeviceSink(AudioSink):
+    """The system audio device, through a callback ``sounddevice`` stream"""
+
+    def __init__(self):
+        self.stream = None
+
+    @property
+    def latency(self) -> int:
+        if self.stream is None:
+            return 0
+        return int(self.stream.latency * self.stream.samplerate)
+
+    def open(self, engine):
+        # Imported here so the rest of the engine works without PortAudio
+        import sounddevice as sd
+        # Let the host pick the callback size; latency is set by how far
+        # ahead the producer fills the ring buffer
+        self.stream = sd.OutputStream(
+            samplerate=engine.sample_rate,
+            channels=1,
+            dtype=np.float32,
+            blocksize=0,
+            latency='low',
+            callback=engine._callback
+        )
+        self.stream.start()
+
+    def close(self):
+        if self.stream is not None:
+            self.stream.stop()
+            self.stream.close()
+            self.stream = None
+
+
+class ThreadedSink(AudioSink):
+    """Base for sinks that pull from the engine on their own thread.
+
+    With ``realtime`` the thread pulls ``block_size`` frames per block
+    duration by the wall clock, like a device would. Otherwise it takes
+    whatever the producer has queued as soon as it is there.
+    """
+
+    def __init__(self, realtime: bool = False, block_size: int = 512):
+        self.realtime = realtime
+        self.block_size = block_size
+        self.frames = 0
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def emit(self, block: np.ndarray):
+        raise NotImplementedError
+
+    def open(self, engine):
+        self._closed.clear()
+        self._thread = threading.Thread(target=self._run, args=(engine,), daemon=True)
+        self._thread.start()
+
+    def _run(self, engine):
+        out = np.zeros((self.block_size, 1), dtype=np.float32)
+        period = self.block_size / engine.sample_rate
+        deadline = time.perf_counter()
+        try:
+            while not self._closed.is_set():
+                if self.realtime:
+                    engine._callback(out, self.block_size, None, None)
+                    self.emit(out[:, 0])
+                    self.frames += self.block_size
+                    deadline += period
+                    self._closed.wait(max(0.0, deadline - time.perf_counter()))
+                else:
+                    n = engine.ring.read_wait(out[:, 0], timeout=0.05)
+                    if n:
+                        self.emit(out[:n, 0])
+                        self.frames += n
+            # Unthrottled sinks keep everything that was queued before closing
+            while not self.realtime:
+                n = engine.ring.read_into(out[:, 0])
+                if not n:
+                    break
+                self.emit(out[:n, 0])
+                self.frames += n
+        except Exception as e:
+            logger.error(f"Audio sink stopped: {e}", exc_info=True)
+
+    def close(self):
+        self._closed.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+
+class NullSink(ThreadedSink):
+    """Discard audio, at wall-clock rate or as fast as it is rendered"""
+
+    def __init__(self, realtime: bool = True, block_size: int = 512):
+        super().__init__(realtime, block_size)
+
+    def emit(self, block: np.ndarray):
+        pass
+
+
+class WavFileSink(ThreadedSink):
+    """Record everything played to a WAV file"""
+
+    def __init__(self, filename: str, sample_format: str = 'float32', realtime: bool = False,
+                 block_size: int = 512):
+        super().__init__(realtime, block_size)
+        self.filename = filename
+        self.sample_format = sample_format
+        self.writer = None
+
+    def open(self, engine):
+        self.writer = engine.open_wav(self.filename, sample_format=self.sample_format)
+        super().open(engine)
+
+    def emit(self, block: np.ndarray):
+        self.writer.write(block)
+
+    def close(self):
+        super().close()
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+class PipeSink(ThreadedSink):
+    """Raw native-endian float32 mono PCM on a binary stream, stdout by default.
+
+    For example ``ffmpeg -f f32le -ar 44100 -ac 1 -i - out.flac``.
+    """
+
+    def __init__(self, stream=None, realtime: bool = False, block_size: int = 512):
+        super().__init__(realtime, block_size)
+        self.stream = stream
+
+    def emit(self, block: np.ndarray):
+        stream = self.stream if self.stream is not None else sys.stdout.buffer
+        stream.write(np.ascontiguousarray(block, dtype=np.float32).tobytes())
+        stream.flush()
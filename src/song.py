@@ -0,0 +1,203 @@
+from types import MappingProxyType
+from typing import Dict, Iterable, Iterator, List, Mapping, Optional, Tuple
+
+Row = Tuple[str, ...]
+
+
+class PatternRows:
+    """Immutable rows of one pattern, kept in chunks of ``CHUNK`` rows.
+
+    ``replace`` shares every chunk it does not touch, so changing one row
+    copies that row's chunk and the chunk tuple instead of the whole
+    pattern. Indexing and iterating give the row tuples themselves.
+    """
+
+    __slots__ = ('chunks', '_len')
+    CHUNK = 32
+
+    def __init__(self, rows: Iterable[Row] = ()):
+        rows = tuple(rows)
+        self.chunks = tuple(rows[i:i + self.CHUNK] for i in range(0, len(rows), self.CHUNK))
+        self._len = len(rows)
+
+    @classmethod
+    def _from_chunks(cls, chunks: Tuple[Row, ...], length: int) -> 'PatternRows':
+        rows = cls.__new__(cls)
+        rows.chunks = chunks
+        rows._len = length
+        return rows
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, index: int) -> Row:
+        if index < 0:
+            index += self._len
+        if not 0 <= index < self._len:
+            raise IndexError(index)
+        return self.chunks[index // self.CHUNK][index % self.CHUNK]
+
+    def get(self, index: int, default: Row = ()) -> Row:
+        return self[index] if 0 <= index < self._len else default
+
+    def __iter__(self) -> Iterator[Row]:
+        for chunk in self.chunks:
+            yield from chunk
+
+    def __eq__(self, other):
+        if not isinstance(other, PatternRows):
+            other = PatternRows(other)
+        return self._len == other._len and self.chunks == other.chunks
+
+    def __repr__(self):
+        return f"PatternRows({tuple(self)!r})"
+
+    def replace(self, rows: Mapping[int, Row]) -> 'PatternRows':
+        """A copy with the given rows replaced, growing with empty rows to reach them"""
+        size = self.CHUNK
+        length = max(self._len, max(rows, default=-1) + 1)
+        count = -(-length // size)
+        chunks = list(self.chunks) + [()] * (count - len(self.chunks))
+        edited: Dict[int, Dict[int, Row]] = {}
+        for index, row in rows.items():
+            edited.setdefault(index // size, {})[index % size] = row
+        if length > self._len:
+            # The old last chunk and any new ones change length
+            for chunk_index in range(max(0, len(self.chunks) - 1), count):
+                edited.setdefault(chunk_index, {})
+        for chunk_index, changes in edited.items():
+            chunk = list(chunks[chunk_index])
+            chunk.extend([()] * (min(size, length - chunk_index * size) - len(chunk)))
+            for offset, row in changes.items():
+                chunk[offset] = row
+            chunks[chunk_index] = tuple(chunk)
+        return PatternRows._from_chunks(tuple(chunks), length)
+
+
+class SongSnapshot:
+    """Everything playback needs from the song, frozen at one moment.
+
+    The UI thread builds a new snapshot whenever the song changes and
+    publishes it by assignment; the render thread only ever reads
+    snapshots, never widgets or the live PatternManager. Each pattern is
+    a PatternRows whose rows and chunks are shared between successive
+    snapshots when unchanged, so finding what an edit touched is an
+    identity check per chunk and row. Empty rows are stored as ``()``.
+    ``versions`` holds each stored Pattern's version when it was captured,
+    so unchanged patterns are not copied again.
+    """
+
+    __slots__ = ('patterns', 'order', 'formula_text', 'globals_text', 'speed',
+                 'playback_rate', 'oversample', 'versions')
+
+    def __init__(self, patterns: Mapping[int, Iterable[Row]], order: Tuple[int, ...],
+                 formula_text: str, globals_text: str, speed: float = 4.0,
+                 playback_rate: int = 44100, oversample: int = 1,
+                 versions: Optional[Mapping[int, int]] = None):
+        patterns = {num: rows if isinstance(rows, PatternRows) else PatternRows(rows)
+                    for num, rows in patterns.items()}
+        self._set(patterns=MappingProxyType(patterns), order=tuple(order),
+                  formula_text=formula_text, globals_text=globals_text, speed=speed,
+                  playback_rate=playback_rate, oversample=oversample,
+                  versions=MappingProxyType(dict(versions or {})))
+
+    def _set(self, **fields):
+        for name, value in fields.items():
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError("SongSnapshot is immutable")
+
+    @classmethod
+    def capture(cls, pattern_manager, formula_text: str, globals_text: str, speed: float = 4.0,
+                playback_rate: int = 44100, oversample: int = 1,
+                previous: Optional['SongSnapshot'] = None) -> 'SongSnapshot':
+        """Copy the stored patterns, reusing ``previous``'s rows where they are equal"""
+        patterns = {}
+        versions = {}
+        for num, pattern in pattern_manager.patterns.items():
+            data = pattern['data'] if isinstance(pattern, dict) else pattern
+            old = previous.patterns.get(num) if previous is not None else None
+            version = getattr(data, 'version', None)
+            if version is not None:
+                versions[num] = version
+                if old is not None and previous.versions.get(num) == version:
+                    patterns[num] = old
+                    continue
+            old = old if old is not None else PatternRows()
+            rows = []
+            for index, row in enumerate(data):
+                row = tuple(row) if any(row) else ()
+                if index < len(old) and old[index] == row:
+                    row = old[index]
+                rows.append(row)
+            new = PatternRows(rows)
+            unchanged = len(new) == len(old) and all(
+                a is b for chunk, old_chunk in zip(new.chunks, old.chunks)
+                for a, b in zip(chunk, old_chunk))
+            patterns[num] = old if unchanged else new
+        return cls(patterns, pattern_manager.order_list, formula_text, globals_text, speed,
+                   playback_rate, oversample, versions)
+
+    def with_rows(self, edits: Dict[int, Dict[int, List[str]]], **changes) -> 'SongSnapshot':
+        """A copy with some rows replaced, as returned by PatternManager.take_dirty.
+
+        Other fields can be changed at the same time, as with ``replace``.
+        Only the chunks holding edited rows are copied.
+        """
+        if not edits:
+            return self.replace(**changes) if changes else self
+        patterns = dict(self.patterns)
+        for num, rows in edits.items():
+            old = patterns.get(num) or PatternRows()
+            patterns[num] = old.replace({row: tuple(values) if any(values) else ()
+                                         for row, values in rows.items()})
+        versions = self.versions
+        if any(num in versions for num in edits):
+            # Stamps no longer describe these patterns; the next capture rebuilds them
+            versions = MappingProxyType({num: v for num, v in versions.items() if num not in edits})
+        song = SongSnapshot.__new__(SongSnapshot)
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes, patterns=MappingProxyType(patterns), versions=versions)
+        song._set(**fields)
+        return song
+
+    def replace(self, **changes) -> 'SongSnapshot':
+        fields = {name: getattr(self, name) for name in self.__slots__}
+        fields.update(changes)
+        return SongSnapshot(**fields)
+
+    def pattern_lists(self) -> Dict[int, List[List[str]]]:
+        """Mutable copy of the patterns in the play order, for a Renderer to own"""
+        return {num: [list(row) for row in self.patterns[num]]
+                for num in sorted(set(self.order)) if num in self.patterns}
+
+    def edits_since(self, older: 'SongSnapshot') -> Dict[int, Dict[int, Optional[List[str]]]]:
+        """Rows that differ from ``older``, in the form RowStream.apply_edits takes.
+
+        Rows the song no longer has, because their pattern was shortened or
+        removed, are reported as ``None``.
+        """
+        edits = {}
+        size = PatternRows.CHUNK
+        for num, rows in self.patterns.items():
+            old = older.patterns.get(num)
+            if rows is old:
+                continue
+            old_chunks = old.chunks if old is not None else ()
+            changed = {}
+            for chunk_index, chunk in enumerate(rows.chunks):
+                old_chunk = old_chunks[chunk_index] if chunk_index < len(old_chunks) else ()
+                if chunk is old_chunk:
+                    continue
+                for offset, row in enumerate(chunk):
+                    if offset >= len(old_chunk) or row is not old_chunk[offset]:
+                        changed[chunk_index * size + offset] = list(row)
+            if old is not None:
+                changed.update(dict.fromkeys(range(len(rows), len(old))))
+            if changed:
+                edits[num] = changed
+        for num, old in older.patterns.items():
+            if num not in self.patterns and len(old):
+                edits[num] = dict.fromkeys(range(len(old)))
+        return edits
@@ -0,0 +1,183 @@
+import tkinter as tk
+import threading
+import logging
+from typing import List, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class WaveformPyramid:
+    """Min/max summaries of a growing signal at several zoom levels.
+
+    Level 0 keeps the minimum and maximum of every ``base`` samples and
+    each level above summarizes ``factor`` buckets of the one below.
+    Audio is appended as it is rendered and only the new buckets are
+    computed, so drawing any span of the signal touches a few buckets per
+    pixel instead of the samples themselves.
+    """
+
+    def __init__(self, base: int = 64, factor: int = 4, levels: int = 8):
+        self.base = base
+        self.factor = factor
+        self.bucket_sizes = [base * factor ** level for level in range(levels)]
+        self._lock = threading.Lock()
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._mins: List[np.ndarray] = [np.zeros(0, dtype=np.float32) for _ in self.bucket_sizes]
+            self._maxs: List[np.ndarray] = [np.zeros(0, dtype=np.float32) for _ in self.bucket_sizes]
+            self._counts = [0] * len(self.bucket_sizes)
+            # Samples not yet making up a whole level 0 bucket
+            self._pending = np.zeros(0, dtype=np.float32)
+            self.samples = 0
+
+    def __len__(self):
+        return self.samples
+
+    def append(self, block: np.ndarray):
+        block = np.asarray(block, dtype=np.float32)
+        with self._lock:
+            self.samples += len(block)
+            data = np.concatenate([self._pending, block]) if len(self._pending) else block
+            whole = len(data) // self.base * self.base
+            self._pending = data[whole:].copy()
+            if not whole:
+                return
+            chunks = data[:whole].reshape(-1, self.base)
+            self._extend(0, chunks.min(axis=1), chunks.max(axis=1))
+            for level in range(1, len(self.bucket_sizes)):
+                done = self._counts[level] * self.factor
+                n = (self._counts[level - 1] - done) // self.factor
+                if not n:
+                    break
+                end = done + n * self.factor
+                self._extend(level,
+                             self._mins[level - 1][done:end].reshape(-1, self.factor).min(axis=1),
+                             self._maxs[level - 1][done:end].reshape(-1, self.factor).max(axis=1))
+
+    def _extend(self, level: int, mins: np.ndarray, maxs: np.ndarray):
+        count = self._counts[level]
+        needed = count + len(mins)
+        if needed > len(self._mins[level]):
+            capacity = max(needed, 2 * len(self._mins[level]), 256)
+            for arrays in (self._mins, self._maxs):
+                grown = np.zeros(capacity, dtype=np.float32)
+                grown[:count] = arrays[level][:count]
+                arrays[level] = grown
+        self._mins[level][count:needed] = mins
+        self._maxs[level][count:needed] = maxs
+        self._counts[level] = needed
+
+    def level_for(self, samples_per_pixel: float) -> int:
+        """Coarsest level with at least one bucket per pixel"""
+        level = 0
+        for index, size in enumerate(self.bucket_sizes):
+            if size <= samples_per_pixel:
+                level = index
+        return level
+
+    def envelope(self, start: int, stop: int, width: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """(first sample, min, max) of up to ``width`` columns covering [start, stop)"""
+        width = max(1, int(width))
+        with self._lock:
+            level = self.level_for((stop - start) / width)
+            size = self.bucket_sizes[level]
+            count = self._counts[level]
+            first = min(max(0, int(start)) // size, count)
+            last = min(-(-int(stop) // size), count)
+            mins = self._mins[level][first:last]
+            maxs = self._maxs[level][first:last]
+            if last - first > width:
+                edges = np.arange(width) * (last - first) // width
+                positions = (first + edges) * size
+                return positions, np.minimum.reduceat(mins, edges), np.maximum.reduceat(maxs, edges)
+            return np.arange(first, last) * size, mins.copy(), maxs.copy()
+
+
+class WaveformView:
+    """Overview of the rendered audio, drawn from a WaveformPyramid.
+
+    The wheel scrolls and Ctrl+wheel zooms around the pointer. While
+    following, the view keeps the newest audio at its right edge.
+    """
+
+    def __init__(self, parent, pyramid: WaveformPyramid, height: int = 60):
+        self.pyramid = pyramid
+        self.canvas = tk.Canvas(parent, height=height, background="white", highlightthickness=0)
+        self.samples_per_pixel = 1024.0
+        self.start = 0.0
+        self.follow = True
+        self._width = 1
+        self._height = height
+        self._drawn = None
+        self._shape = self.canvas.create_polygon(0, 0, 0, 0, 0, 0, fill="steelblue",
+                                                 outline="steelblue", state='hidden')
+        self._axis = self.canvas.create_line(0, height / 2, 0, height / 2, fill="lightgray")
+
+        self.canvas.bind('<Configure>', self._on_configure)
+        self.canvas.bind('<MouseWheel>', lambda e: self.scroll(-e.delta / 120))
+        self.canvas.bind('<Button-4>', lambda e: self.scroll(-1))
+        self.canvas.bind('<Button-5>', lambda e: self.scroll(1))
+        self.canvas.bind('<Control-MouseWheel>', lambda e: self.zoom(0.5 if e.delta > 0 else 2.0, e.x))
+        self.canvas.bind('<Control-Button-4>', lambda e: self.zoom(0.5, e.x))
+        self.canvas.bind('<Control-Button-5>', lambda e: self.zoom(2.0, e.x))
+
+    def pack(self, **kwargs):
+        self.canvas.pack(**kwargs)
+
+    def _on_configure(self, event):
+        self._width = max(1, event.width)
+        self._height = max(1, event.height)
+        self.canvas.coords(self._axis, 0, self._height / 2, self._width, self._height / 2)
+        self.refresh()
+
+    def _max_start(self) -> float:
+        return max(0.0, len(self.pyramid) - self._width * self.samples_per_pixel)
+
+    def scroll(self, steps: float):
+        """Move by an eighth of the view per step; reaching the end follows again"""
+        self.start = min(max(0.0, self.start + steps * self._width * self.samples_per_pixel / 8),
+                         self._max_start())
+        self.follow = self.start >= self._max_start()
+        self.draw()
+
+    def zoom(self, scale: float, x: int = 0):
+        """Scale samples per pixel, keeping the sample under ``x`` in place"""
+        anchor = self.start + x * self.samples_per_pixel
+        self.samples_per_pixel = min(max(1.0, self.samples_per_pixel * scale), 1 << 20)
+        self.start = min(max(0.0, anchor - x * self.samples_per_pixel), self._max_start())
+        self.draw()
+
+    def refresh(self):
+        """Pick up newly appended audio; cheap when nothing changed"""
+        if self.follow:
+            self.start = self._max_start()
+        self.draw()
+
+    def draw(self):
+        key = (self.start, self.samples_per_pixel, len(self.pyramid), self._width, self._height)
+        if key == self._drawn:
+            return
+        self._drawn = key
+        stop = self.start + self._width * self.samples_per_pixel
+        positions, mins, maxs = self.pyramid.envelope(int(self.start), int(stop) + 1, self._width)
+        if len(positions) < 2:
+            self.canvas.itemconfigure(self._shape, state='hidden')
+            return
+
+        xs = (positions - self.start) / self.samples_per_pixel
+        middle = self._height / 2
+        scale = middle - 1
+        top = middle - np.clip(maxs, -1, 1) * scale
+        # Keep silent stretches visible as a line
+        bottom = np.maximum(middle - np.clip(mins, -1, 1) * scale, top + 1)
+        points = np.empty((2 * len(xs), 2))
+        points[:len(xs), 0] = xs
+        points[:len(xs), 1] = top
+        points[len(xs):, 0] = xs[::-1]
+        points[len(xs):, 1] = bottom[::-1]
+        self.canvas.coords(self._shape, *points.ravel().tolist())
+        self.canvas.itemconfigure(self._shape, state='normal')
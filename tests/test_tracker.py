@@ -1,16 +1,31 @@
 import pytest
 import numpy as np
+import io
 import json
 import tempfile
 import os
 from unittest.mock import MagicMock, patch
 import unittest
 import time
+import threading
 import wave
+import struct
 from pathlib import Path
 
-from src.audio_engine import AudioEngine
+from src.audio_engine import AudioEngine, BlockSizeController, PlaybackStats, RingBuffer, WavWriter
 from src.formula_engine import FormulaEngine
+from src.pattern_manager import CellChange, Pattern, PatternManager
+from src.renderer import (QUALITY_TIERS, RenderQuality, Renderer, StateIndex, compile_program,
+                          playback_values)
+from src.playback import (LoopCache, LoopRegion, PlayTimeline, Player, Preroll, ProgramCompiler,
+                          QualityGovernor, RowStream, Upsampler)
+from src.resample import PolyphaseDecimator
+from src.sinks import NullSink, PipeSink, WavFileSink
+from src.waveform import WaveformPyramid
+from src.meters import FLOOR_DB, LevelMeter
+from src.song import PatternRows, SongSnapshot
+from src.export import (ExportCheckpoint, ExportJob, LookaheadLimiter, ScratchRender, db_to_gain,
+                        song_hashes)
 
 class TestAudioEngine:
     @pytest.fixture
@@ -43,6 +58,156 @@ class TestAudioEngine:
         assert stream.channels == 1
         assert stream.dtype == 'float32'
 
+    def test_callback_plays_silence_when_idle(self, audio_engine):
+        outdata = np.ones((256, 1), dtype=np.float32)
+        audio_engine._callback(outdata, 256, None, None)
+        assert np.all(outdata == 0)
+
+        audio_engine.ring.write(np.full(100, 0.5, dtype=np.float32))
+        audio_engine._callback(outdata, 256, None, None)
+        assert np.all(outdata[:100, 0] == 0.5)
+        assert np.all(outdata[100:, 0] == 0)
+
+    def test_underruns_counted_only_while_playing(self, audio_engine):
+        outdata = np.zeros((256, 1), dtype=np.float32)
+        audio_engine._callback(outdata, 256, None, None)
+        assert audio_engine.stats.underruns == 0
+
+        audio_engine.active = True
+        audio_engine.ring.write(np.zeros(300, dtype=np.float32))
+        audio_engine._callback(outdata, 256, None, None)
+        assert audio_engine.stats.underruns == 0
+        assert audio_engine.stats.queue_depth == 44
+        audio_engine._callback(outdata, 256, None, None)
+        assert audio_engine.stats.underruns == 1
+
+        audio_engine.silence()
+        audio_engine._callback(outdata, 256, None, None)
+        assert audio_engine.stats.underruns == 1
+
+    def test_lookahead_limits_queue(self, audio_engine):
+        audio_engine.set_lookahead(4096)
+        stop = threading.Event()
+        stop.set()
+        assert audio_engine.ring.write(np.zeros(10000, dtype=np.float32), stop) == 4096
+        audio_engine.set_lookahead(10 ** 9)
+        assert audio_engine.lookahead == audio_engine.ring.capacity
+
+    def test_recent_returns_last_samples_taken(self):
+        ring = RingBuffer(8)
+        out = np.zeros(4, dtype=np.float32)
+        assert ring.recent(out) == 0
+
+        ring.write(np.arange(6, dtype=np.float32))
+        ring.read_into(np.zeros(5, dtype=np.float32))
+        ring.write(np.arange(6, 10, dtype=np.float32))
+        # Samples queued since do not overwrite the ones taken
+        assert ring.recent(out) == 4
+        assert list(out) == [1, 2, 3, 4]
+
+        ring.read_into(np.zeros(5, dtype=np.float32))
+        assert ring.recent(out) == 4
+        assert list(out) == [6, 7, 8, 9]
+        ring.clear()
+        assert ring.recent(out) == 0
+
+    def test_recent_does_not_wait_for_the_lock(self):
+        ring = RingBuffer(8)
+        ring.write(np.arange(4, dtype=np.float32))
+        ring.read_into(np.zeros(4, dtype=np.float32))
+        out = np.zeros(4, dtype=np.float32)
+        counts = []
+        reader = threading.Thread(target=lambda: counts.append(ring.recent(out)))
+        with ring._cond:
+            reader.start()
+            reader.join(1)
+            assert not reader.is_alive()
+        assert counts == [4]
+        assert list(out) == [0, 1, 2, 3]
+
+
+class TestBlockSizeController:
+    def run_blocks(self, control, stats, count, seconds):
+        changed = False
+        for _ in range(count):
+            stats.record_render(seconds, control.block_size)
+            changed = control.update(stats) or changed
+        return changed
+
+    def test_light_load_shrinks_blocks(self):
+        stats = PlaybackStats(sample_rate=1000)
+        control = BlockSizeController(sample_rate=1000, block_size=64, min_block=16,
+                                      max_latency=1.0, window=4)
+        assert self.run_blocks(control, stats, 4, 0.001)
+        assert control.block_size == 32
+        assert control.lookahead == 128
+        self.run_blocks(control, stats, 20, 0.001)
+        assert control.block_size == 16
+
+    def test_heavy_load_and_underruns_grow_blocks(self):
+        stats = PlaybackStats(sample_rate=1000)
+        control = BlockSizeController(sample_rate=1000, block_size=64, min_block=16,
+                                      max_latency=0.3, window=4)
+        self.run_blocks(control, stats, 4, 0.06)
+        assert control.block_size == 128
+
+        stats.underruns += 1
+        assert control.update(stats)
+        # Capped so that look-ahead stays within the latency bound
+        assert control.block_size == 150
+        assert control.lookahead == 300
+
+
+class TestPlaybackStats:
+    def test_render_times_against_deadline(self):
+        stats = PlaybackStats(sample_rate=1000)
+        stats.record_render(0.05, 100)
+        stats.record_render(0.15, 100)
+        snapshot = stats.snapshot()
+        assert snapshot['blocks'] == 2
+        assert snapshot['late_blocks'] == 1
+        assert snapshot['deadline_ms'] == pytest.approx(100)
+        assert snapshot['render_ms'] == pytest.approx(100)
+        assert snapshot['load'] == pytest.approx(1.0)
+        assert "Underruns: 0" in stats.summary()
+
+
+class TestRingBuffer:
+    def test_wraps_around(self):
+        ring = RingBuffer(10)
+        out = np.zeros(6, dtype=np.float32)
+        ring.write(np.arange(8, dtype=np.float32))
+        assert ring.read_into(out) == 6
+        ring.write(np.arange(8, 16, dtype=np.float32))
+        assert len(ring) == 10
+
+        out = np.zeros(12, dtype=np.float32)
+        assert ring.read_into(out) == 10
+        assert np.array_equal(out[:10], np.arange(6, 16))
+
+    def test_write_waits_for_room(self):
+        ring = RingBuffer(4)
+        done = threading.Event()
+
+        def produce():
+            ring.write(np.arange(8, dtype=np.float32))
+            done.set()
+
+        threading.Thread(target=produce, daemon=True).start()
+        out = np.zeros(4, dtype=np.float32)
+        received = []
+        while len(received) < 8:
+            n = ring.read_into(out)
+            received.extend(out[:n])
+        assert done.wait(5)
+        assert received == list(range(8))
+
+    def test_write_gives_up_on_stop(self):
+        ring = RingBuffer(4)
+        stop = threading.Event()
+        stop.set()
+        assert ring.write(np.zeros(10, dtype=np.float32), stop) == 4
+
 class TestFormulaEngine:
     @pytest.fixture
     def formula_engine(self):
@@ -411,5 +576,1127 @@ class TestSaveLoadJSON:
         # Verify data is unchanged through save/load cycle
         assert loaded_data == test_data
 
+class TestWavWriter:
+    def test_streamed_int16_matches_whole_write(self, tmp_path):
+        data = np.sin(np.linspace(0, 8 * np.pi, 10000)).astype(np.float32) * 0.8
+        path = tmp_path / "streamed.wav"
+        with WavWriter(str(path), 44100) as writer:
+            for i in range(0, len(data), 777):
+                writer.write(data[i:i + 777])
+
+        with wave.open(str(path), 'rb') as wav:
+            assert wav.getnframes() == len(data)
+            assert wav.getsampwidth() == 2
+            actual = np.frombuffer(wav.readframes(len(data)), dtype=np.int16)
+        assert np.array_equal(actual, np.round(data * 32767).astype(np.int16))
+
+    def test_int24_stereo(self, tmp_path):
+        data = np.array([[0.5, -0.5], [1.5, -1.0], [0.0, 0.25]], dtype=np.float32)
+        path = tmp_path / "stereo24.wav"
+        with WavWriter(str(path), 48000, channels=2, sample_format='int24') as writer:
+            writer.write(data)
+
+        with wave.open(str(path), 'rb') as wav:
+            assert wav.getnchannels() == 2
+            assert wav.getsampwidth() == 3
+            assert wav.getframerate() == 48000
+            raw = np.frombuffer(wav.readframes(3), dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(raw), 4), dtype=np.uint8)
+        padded[:, :3] = raw
+        padded[:, 3] = np.where(raw[:, 2] & 0x80, 0xff, 0)
+        actual = padded.view('<i4').ravel()
+        assert list(actual) == [4194304, -4194304, 8388607, -8388607, 0, 2097152]
+
+    def test_float32_header_is_patched(self, tmp_path):
+        data = np.linspace(-1, 1, 101, dtype=np.float32)
+        path = tmp_path / "float.wav"
+        with WavWriter(str(path), 44100, sample_format='float32') as writer:
+            writer.write(data[:50])
+            writer.write(data[50:])
+
+        raw = path.read_bytes()
+        assert raw[:4] == b'RIFF' and raw[8:12] == b'WAVE'
+        assert struct.unpack('<I', raw[4:8])[0] == len(raw) - 8
+        assert struct.unpack('<H', raw[20:22])[0] == 3  # IEEE float
+        fact = raw.index(b'fact')
+        assert struct.unpack('<I', raw[fact + 8:fact + 12])[0] == len(data)
+        data_pos = raw.index(b'data')
+        assert struct.unpack('<I', raw[data_pos + 4:data_pos + 8])[0] == len(data) * 4
+        actual = np.frombuffer(raw[data_pos + 8:data_pos + 8 + len(data) * 4], dtype='<f4')
+        assert np.array_equal(actual, data)
+
+class TestExportNormalization:
+    class Collector:
+        def __init__(self):
+            self.blocks = []
+
+        def write(self, block):
+            self.blocks.append(np.array(block))
+
+        @property
+        def samples(self):
+            return np.concatenate(self.blocks)
+
+    @pytest.fixture
+    def scratch(self, tmp_path):
+        scratch = ScratchRender(scratch_dir=str(tmp_path), block_size=1000)
+        signal = (np.sin(np.arange(20000) * 0.05) * 0.25).astype(np.float32)
+        signal[12345] = 2.0
+        for i in range(0, len(signal), 3000):
+            scratch.write(signal[i:i + 3000])
+        yield scratch, signal
+        scratch.discard()
+
+    def test_measure(self, scratch):
+        scratch, signal = scratch
+        stats = scratch.measure()
+        assert stats.peak == pytest.approx(2.0)
+        assert stats.true_peak >= stats.peak
+        assert stats.rms == pytest.approx(np.sqrt(np.mean(signal.astype(np.float64) ** 2)), rel=1e-5)
+        assert stats.samples == len(signal)
+
+    def test_peak_normalization_without_limiter(self, scratch):
+        scratch, signal = scratch
+        out = self.Collector()
+        gain = scratch.export(out, target_peak_db=-1.0, limit=False)
+
+        assert len(out.samples) == len(signal)
+        assert np.abs(out.samples).max() <= db_to_gain(-1.0) + 1e-6
+        assert np.allclose(out.samples, signal * gain, atol=1e-6)
+
+    def test_rms_target_is_limited(self, scratch):
+        scratch, signal = scratch
+        out = self.Collector()
+        gain = scratch.export(out, target_peak_db=-1.0, target_rms_db=-12.0)
+
+        assert len(out.samples) == len(signal)
+        assert np.abs(out.samples).max() <= db_to_gain(-1.0) + 1e-6
+        # Away from the spike the signal only has the normalization gain
+        assert np.allclose(out.samples[:12000], signal[:12000] * gain, atol=1e-6)
+
+    def test_limiter_across_blocks(self):
+        limiter = LookaheadLimiter(ceiling=0.5, lookahead=16)
+        signal = np.zeros(100, dtype=np.float32)
+        signal[40] = 1.0
+        out = np.concatenate([limiter.process(signal[:37]), limiter.process(signal[37:]), limiter.flush()])
+
+        assert np.abs(out).max() <= 0.5 + 1e-6
+        assert out[40 + 16] == pytest.approx(0.5)
+
+class TestExportJob:
+    def make_job(self, tmp_path, **kwargs):
+        patterns = {1: [["{x}", "{speed}"], ["0.5", "8"]] + [["", ""]] * 6}
+        renderer = Renderer(
+            FormulaEngine(), patterns, [1, 1],
+            "output = np.sin(t * 0.01) * x",
+            "import numpy as np\nx = 0\n"
+        )
+        path = str(tmp_path / "export.wav")
+        return ExportJob(renderer, path, lambda p: WavWriter(p, 44100), **kwargs), path
+
+    def drain(self, job):
+        reports = []
+        while not job.progress.empty():
+            reports.append(job.progress.get_nowait())
+        return reports
+
+    def test_export_uses_row_speed(self, tmp_path):
+        job, path = self.make_job(tmp_path, report_interval=0)
+        job.start()
+        job.join(10)
+        reports = self.drain(job)
+
+        assert reports[-1].state == 'done'
+        renders = [r for r in reports if r.state == 'render']
+        assert renders[-1].rows_done == renders[-1].total_rows == 16
+        assert renders[-1].realtime_factor > 0
+        with wave.open(path, 'rb') as wav:
+            # First row at the default 4 rows/sec, the rest at 8
+            assert wav.getnframes() == 11025 + 15 * 5512
+            frames = np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+        assert np.abs(frames).max() == pytest.approx(db_to_gain(-1.0) * 32767, abs=2)
+
+    def test_export_tracks_memory_per_stage(self, tmp_path):
+        job, path = self.make_job(tmp_path)
+        job.renderer.memory.enabled = True
+        job.start()
+        job.join(10)
+
+        assert self.drain(job)[-1].state == 'done'
+        assert set(job.renderer.memory.peaks) == {'render', 'normalize'}
+        assert job.renderer.memory.peak > 0
+
+    def read_frames(self, path):
+        with wave.open(path, 'rb') as wav:
+            return np.frombuffer(wav.readframes(wav.getnframes()), dtype=np.int16)
+
+    def make_checkpointed_job(self, tmp_path, name, fail_after=None, sample_format='int16',
+                              edits=None, order=(1, 2, 1, 2), **kwargs):
+        patterns = {
+            1: [["{x}", "{speed}"], ["0.5", "8"], ["x * 1.5", ""]],
+            2: [["x / 2", "4"], ["", ""]],
+            3: [["x / 2", "4"], ["", ""]],
+        }
+        patterns.update(edits or {})
+        renderer = Renderer(
+            FormulaEngine(), patterns, list(order),
+            "output = np.sin(t * 0.01) * x",
+            "import numpy as np\nx = 0\n"
+        )
+
+        class FailingWriter(WavWriter):
+            def write(self, block):
+                if fail_after is not None and self.frames_written >= fail_after:
+                    raise MemoryError("simulated failure")
+                super().write(block)
+
+        path = str(tmp_path / name)
+        return ExportJob(renderer, path,
+                         lambda p, **kw: FailingWriter(p, 44100, sample_format=sample_format, **kw),
+                         checkpoints=True, sample_format=sample_format, **kwargs), path
+
+    @pytest.mark.parametrize("normalize", [False, True])
+    def test_resume_after_failure_matches_full_export(self, tmp_path, normalize):
+        full, full_path = self.make_checkpointed_job(tmp_path, "full.wav", normalize=normalize)
+        full.run()
+
+        failed, path = self.make_checkpointed_job(tmp_path, "resumed.wav", fail_after=40000,
+                                                  normalize=normalize)
+        failed.run()
+        assert self.drain(failed)[-1].state == 'error'
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(path))
+        # Normalized exports fail while writing the WAV, after the render is done
+        assert checkpoint is not None and checkpoint.complete == normalize
+
+        resumed, _ = self.make_checkpointed_job(tmp_path, "resumed.wav", resume=True,
+                                                normalize=normalize)
+        resumed.run()
+        assert self.drain(resumed)[-1].state == 'done'
+        assert np.array_equal(self.read_frames(path), self.read_frames(full_path))
+        assert not os.path.exists(ExportCheckpoint.path_for(path))
+        assert not os.path.exists(ExportCheckpoint.scratch_path_for(path))
+
+    def test_resume_after_format_change_starts_over(self, tmp_path):
+        full, full_path = self.make_checkpointed_job(tmp_path, "full.wav", normalize=False)
+        full.run()
+
+        failed, path = self.make_checkpointed_job(tmp_path, "resumed.wav", fail_after=40000,
+                                                  normalize=False, sample_format='float32')
+        failed.run()
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(path))
+        assert checkpoint.sample_format == 'float32' and checkpoint.channels == 1
+        assert not checkpoint.matches(failed.renderer.order_list, 44100, False, 'int16')
+
+        resumed, _ = self.make_checkpointed_job(tmp_path, "resumed.wav", resume=True,
+                                                normalize=False)
+        resumed.run()
+        assert self.drain(resumed)[-1].state == 'done'
+        assert np.array_equal(self.read_frames(path), self.read_frames(full_path))
+
+    def test_resume_after_edit_restarts_at_edited_pattern(self, tmp_path):
+        edited = {1: [["{x}", "{speed}"], ["0.25", "8"], ["x * 1.5", ""]]}
+        full, full_path = self.make_checkpointed_job(tmp_path, "full.wav", normalize=False,
+                                                     edits=edited)
+        full.run()
+
+        failed, path = self.make_checkpointed_job(tmp_path, "resumed.wav", fail_after=40000,
+                                                  normalize=False)
+        failed.run()
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(path))
+        assert checkpoint.latest() > 0
+
+        resumed, _ = self.make_checkpointed_job(tmp_path, "resumed.wav", resume=True,
+                                                normalize=False, edits=edited)
+        assert resumed.load_checkpoint().changed(song_hashes(resumed.renderer)[1]) == [0]
+        resumed.run()
+        assert self.drain(resumed)[-1].state == 'done'
+        assert np.array_equal(self.read_frames(path), self.read_frames(full_path))
+
+    def test_formula_edit_does_not_resume(self, tmp_path):
+        failed, path = self.make_checkpointed_job(tmp_path, "song.wav", fail_after=40000,
+                                                  normalize=False)
+        failed.run()
+        resumed, _ = self.make_checkpointed_job(tmp_path, "song.wav", resume=True,
+                                                normalize=False)
+        assert resumed.load_checkpoint() is not None
+        resumed.renderer.formula_text = "output = np.sin(t * 0.02) * x"
+        assert resumed.load_checkpoint() is None
+
+    def test_finished_export_patches_single_edit(self, tmp_path):
+        # Same end state as before, different audio
+        edited = {3: [["x / 3", "4"], ["x * 1.5", ""]]}
+        full, full_path = self.make_checkpointed_job(tmp_path, "full.wav", normalize=False,
+                                                     order=(1, 2, 1, 3), edits=edited)
+        full.run()
+
+        job, path = self.make_checkpointed_job(tmp_path, "song.wav", normalize=False,
+                                               order=(1, 2, 1, 3), keep_checkpoint=True)
+        job.run()
+        before = self.read_frames(path)
+        patched, _ = self.make_checkpointed_job(tmp_path, "song.wav", resume=True, normalize=False,
+                                                order=(1, 2, 1, 3), edits=edited,
+                                                keep_checkpoint=True)
+        patched.run()
+        reports = self.drain(patched)
+
+        assert reports[-1].state == 'done'
+        assert not [r for r in reports if r.state == 'render']
+        after = self.read_frames(path)
+        assert not np.array_equal(after, before)
+        assert np.array_equal(after, self.read_frames(full_path))
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(path))
+        assert checkpoint.changed(song_hashes(patched.renderer)[1]) == []
+
+    def test_rerender_single_pattern(self, tmp_path):
+        job, path = self.make_checkpointed_job(tmp_path, "song.wav", normalize=False,
+                                               keep_checkpoint=True)
+        job.run()
+        before = self.read_frames(path)
+        checkpoint = ExportCheckpoint.load(ExportCheckpoint.path_for(path))
+        start, end = checkpoint.frames(1), checkpoint.frames(2)
+
+        # Fix the formula and re-render only the second order entry
+        job.renderer.formula_text = "output = np.sin(t * 0.02) * x"
+        assert job.rerender(1)
+        after = self.read_frames(path)
+
+        assert len(after) == len(before)
+        assert np.array_equal(after[:start], before[:start])
+        assert np.array_equal(after[end:], before[end:])
+        assert not np.array_equal(after[start:end], before[start:end])
+
+    def test_cancel_removes_partial_file(self, tmp_path):
+        job, path = self.make_job(tmp_path, normalize=False)
+        job.cancel()
+        job.run()
+
+        assert self.drain(job)[-1].state == 'cancelled'
+        assert not os.path.exists(path)
+
+class TestLoopCache:
+    def make_renderer(self, patterns, order):
+        return Renderer(
+            FormulaEngine(), patterns, order,
+            "output = np.sin(t * 0.01) * x",
+            "import numpy as np\nx = 0\n",
+            samples_per_row=100
+        )
+
+    @pytest.fixture
+    def patterns(self):
+        return {
+            1: [["{x}", "{y}"], ["0.5", "1"], ["", ""]],
+            2: [["x + 0.1", ""], ["", "y + 1"], ["", ""], ["x / 2", ""]],
+            3: [["0.9", ""], ["", ""]],
+        }
+
+    def full_render(self, patterns, order):
+        renderer = self.make_renderer(patterns, order)
+        renderer.prepare()
+        return np.concatenate([block for _, _, block in renderer.iter_rows()])
+
+    def test_region_matches_full_render(self, patterns):
+        order = [1, 2, 3]
+        full = self.full_render(patterns, order)
+        cache = LoopCache(gain=1.0)
+
+        audio = cache.audio_for(self.make_renderer(patterns, order), LoopRegion(1, 2))
+        assert np.array_equal(audio, full[300:700])
+
+        rows = cache.audio_for(self.make_renderer(patterns, order), LoopRegion(1, start_row=1, end_row=3))
+        assert np.array_equal(rows, full[400:600])
+
+    def test_cache_invalidation(self, patterns):
+        order = [1, 2, 3]
+        cache = LoopCache()
+        region = LoopRegion(1)
+        first = cache.audio_for(self.make_renderer(patterns, order), region)
+        assert cache.audio_for(self.make_renderer(patterns, order), region) is first
+
+        # An edit after the region or one that leaves its start state alone keeps the audio
+        patterns[3][1][0] = "0.1"
+        assert cache.audio_for(self.make_renderer(patterns, order), region) is first
+        patterns[1][2][1] = "1"
+        assert cache.audio_for(self.make_renderer(patterns, order), region) is first
+
+        # Changing the state the region starts from re-renders it
+        patterns[1][2][0] = "0.7"
+        second = cache.audio_for(self.make_renderer(patterns, order), region)
+        assert second is not first
+        assert not np.array_equal(second, first)
+
+    def test_played_buffer_reused_until_song_changes(self, patterns):
+        order = [1, 2, 3]
+        cache = LoopCache(gain=1.0)
+        region = LoopRegion(1)
+        built = []
+
+        def make_renderer():
+            built.append(True)
+            return self.make_renderer(patterns, order)
+
+        song = object()
+        audio, row_starts = cache.played(song, region, make_renderer, factor=2)
+        assert len(audio) == 800
+        assert row_starts == [(0, 1, 0), (200, 1, 1), (400, 1, 2), (600, 1, 3)]
+        assert cache.played(song, region, make_renderer, factor=2)[0] is audio
+        assert len(built) == 1
+
+        # A new snapshot of an unchanged song is hashed again but not re-upsampled
+        assert cache.played(object(), region, make_renderer, factor=2)[0] is audio
+        assert len(built) == 2
+        assert len(cache.played(object(), region, make_renderer, factor=1)[0]) == 400
+
+class TestRowStream:
+    def make_renderer(self, patterns, order=(1, 2)):
+        renderer = Renderer(
+            FormulaEngine(), patterns, list(order),
+            "output = np.sin(t * 0.01) * x",
+            "import numpy as np\nx = 0\n",
+            samples_per_row=100
+        )
+        renderer.prepare()
+        return renderer
+
+    def patterns(self):
+        return {
+            1: [["{x}"], ["0.5"], [""], [""], ["x + 0.1"]],
+            2: [[""], ["x * 2"], [""]],
+        }
+
+    def full_render(self, patterns, order=(1, 2)):
+        renderer = self.make_renderer(patterns, order)
+        return np.concatenate([block for _, _, block in renderer.iter_rows()])
+
+    def read_all(self, rows, size=64):
+        out = []
+        while True:
+            block = rows.read(size)
+            if not len(block):
+                return np.concatenate(out)
+            out.append(block)
+
+    def test_stream_matches_render(self):
+        rows = RowStream(self.make_renderer(self.patterns()), lookahead=250)
+        assert np.array_equal(self.read_all(rows), self.full_render(self.patterns()))
+
+    def test_edit_ahead_of_playhead(self):
+        rows = RowStream(self.make_renderer(self.patterns()), lookahead=10000)
+        played = rows.read(150)
+        assert rows.position == (0, 1)
+
+        rerendered = rows.apply_edits({1: {2: ["0.25"]}})
+        # Row 2 and 3 change; row 4 adds to x, so it ends differently too
+        assert rerendered >= 2
+
+        edited = self.patterns()
+        edited[1][2] = ["0.25"]
+        expected = self.full_render(edited)
+        actual = np.concatenate([played, self.read_all(rows)])
+        assert np.array_equal(actual, expected)
+
+    def test_edit_stops_when_state_matches(self):
+        patterns = self.patterns()
+        patterns[1][3] = ["0.5"]
+        rows = RowStream(self.make_renderer(patterns), lookahead=10000)
+        rows.read(50)
+        # Row 2 changes but row 3 resets x, so later rows are kept as they were
+        assert rows.apply_edits({1: {2: ["0.9"]}}) == 2
+
+    def test_edit_reaches_repeats_of_the_pattern(self):
+        patterns = {1: [["{x}"], ["0.5"], ["0.2"], ["0.3"]]}
+        rows = RowStream(self.make_renderer(patterns, order=(1, 1)), lookahead=10000)
+        played = rows.read(50)
+        # Row 2 resets x, but the second pass through pattern 1 is still stale
+        rows.apply_edits({1: {1: ["0.9"]}})
+
+        edited = {1: [["{x}"], ["0.9"], ["0.2"], ["0.3"]]}
+        actual = np.concatenate([played, self.read_all(rows)])
+        assert np.array_equal(actual, self.full_render(edited, order=(1, 1)))
+
+    def test_header_edit_after_it_played(self):
+        patterns = {1: [["{x}", ""], ["0.5", "0.3"], [""] * 2, ["0.1", "0.7"]], 2: [[""] * 2] * 2}
+        old = self.full_render(patterns)
+        rows = RowStream(self.make_renderer(patterns), lookahead=10000)
+        played = rows.read(150)
+        # Row 0 has played; the columns of every queued row after it change
+        rows.apply_edits({1: {0: ["", "{x}"]}})
+
+        edited = {1: [["", "{x}"]] + patterns[1][1:], 2: patterns[2]}
+        assert np.array_equal(played, old[:150])
+        assert np.array_equal(self.read_all(rows), self.full_render(edited)[150:])
+
+    def test_removed_rows_are_dropped(self):
+        rows = RowStream(self.make_renderer(self.patterns()), lookahead=10000)
+        played = rows.read(150)
+        rows.apply_edits({1: {3: None, 4: None}})
+
+        edited = self.patterns()
+        del edited[1][3:]
+        actual = np.concatenate([played, self.read_all(rows)])
+        assert np.array_equal(actual, self.full_render(edited))
+
+    def test_start_below_header_uses_its_columns(self):
+        patterns = {1: [["{x}"], ["0.5"], [""], [""], ["0.25"], [""]]}
+        renderer = self.make_renderer(patterns, order=(1,))
+        start = StateIndex(interval=2).build(renderer).state_at(renderer, 0, 3)
+        rows = RowStream(renderer, start)
+        assert np.array_equal(self.read_all(rows), self.full_render(patterns, order=(1,))[300:])
+
+    def test_edit_under_playhead_crossfades(self):
+        rows = RowStream(self.make_renderer(self.patterns()), lookahead=10000, fade_samples=20,
+                         crossfade=AudioEngine(fade_samples=20).crossfade)
+        played = rows.read(130)
+        rows.apply_edits({1: {1: ["0.8"]}})
+        rest = self.read_all(rows)
+
+        edited = self.patterns()
+        edited[1][1] = ["0.8"]
+        expected = self.full_render(edited)
+        assert np.array_equal(rest[20:], expected[150:])
+        old = self.full_render(self.patterns())
+        assert np.array_equal(played, old[:130])
+        assert np.all(np.minimum(old[130:150], expected[130:150]) - 1e-6 <= rest[:20])
+        assert np.all(rest[:20] <= np.maximum(old[130:150], expected[130:150]) + 1e-6)
+
+    def test_swap_program_at_playhead(self):
+        rows = RowStream(self.make_renderer(self.patterns()), lookahead=10000, fade_samples=20,
+                         crossfade=AudioEngine(fade_samples=20).crossfade)
+        played = rows.read(130)
+        rows.swap_program(compile_program("output = np.cos(t * 0.02) * x",
+                                          "import numpy as np\nx = 0\n"))
+        rest = self.read_all(rows)
+
+        renderer = self.make_renderer(self.patterns())
+        renderer.formula_text = "output = np.cos(t * 0.02) * x"
+        renderer.prepare()
+        expected = np.concatenate([block for _, _, block in renderer.iter_rows()])
+        assert np.array_equal(played, self.full_render(self.patterns())[:130])
+        assert np.array_equal(rest[20:], expected[150:])
+
+    def test_swap_program_picks_up_changed_globals(self):
+        def renderer(globals_text):
+            renderer = Renderer(FormulaEngine(), self.patterns(), [1, 2],
+                                "output = np.ones(len(t)) * LEVEL * x", globals_text,
+                                samples_per_row=100)
+            renderer.prepare()
+            return renderer
+
+        rows = RowStream(renderer("import numpy as np\nLEVEL = 0.1\nx = 0\n"), lookahead=10000,
+                         fade_samples=20, crossfade=AudioEngine(fade_samples=20).crossfade)
+        rows.read(130)
+        new_globals = "import numpy as np\nLEVEL = 0.9\nx = 0\n"
+        rows.swap_program(compile_program("output = np.ones(len(t)) * LEVEL * x", new_globals))
+        rest = self.read_all(rows)
+
+        # x set by the rows is kept; LEVEL comes from the new globals
+        expected = np.concatenate([block for _, _, block in renderer(new_globals).iter_rows()])
+        assert np.allclose(rest[20:], expected[150:])
+        assert rest[20] == pytest.approx(0.45)
+
+    def test_preroll_matches_unchanged_song(self):
+        preroll = Preroll(lookahead=250)
+        preroll.start(self.make_renderer(self.patterns()))
+        preroll.join(5)
+
+        edited = self.patterns()
+        edited[1][1] = ["0.3"]
+        assert preroll.take(self.make_renderer(edited)) is None
+
+        rows = preroll.take(self.make_renderer(self.patterns()))
+        assert rows is not None and rows.queued >= 250
+        assert np.array_equal(self.read_all(rows), self.full_render(self.patterns()))
+        assert preroll.take(self.make_renderer(self.patterns())) is None
+
+    def test_compile_error_keeps_old_program(self):
+        compiler = ProgramCompiler()
+        compiler.request("output = (", "x = 0\n")
+        compiler.join(5)
+        assert compiler.take() is None
+        assert compiler.error
+
+        compiler.request("output = x", "x = 0\n")
+        compiler.join(5)
+        program = compiler.take()
+        assert program is not None and compiler.error is None
+        assert compiler.take() is None
+
+class TestRenderQuality:
+    def make_renderer(self):
+        renderer = Renderer(FormulaEngine(), {}, [], "output = np.sin(t * 0.01) * v",
+                            "import numpy as np\nv = 1\n")
+        renderer.prepare()
+        return renderer
+
+    def test_reduced_rate_interpolates(self):
+        renderer = self.make_renderer()
+        full = renderer.render_row({'v': 1}, 0, 1001)
+        renderer.quality = next(q for q in QUALITY_TIERS if q.name == 'quarter-rate')
+        coarse = renderer.render_row({'v': 1}, 0, 1001)
+        assert len(coarse) == 1001
+        assert np.array_equal(coarse[::4], full[::4])
+        assert coarse[-1] == full[-1]
+        assert np.max(np.abs(coarse - full)) < 1e-3
+
+    def test_quiet_rows_culled(self):
+        renderer = self.make_renderer()
+        renderer.quality = next(q for q in QUALITY_TIERS if q.name == 'cull')
+        assert not np.any(renderer.render_row({'v': 0.0001}, 0, 100))
+        assert np.any(renderer.render_row({'v': 0.5}, 0, 100))
+
+    def test_governor_steps_down_and_recovers(self):
+        stats = PlaybackStats(sample_rate=1000)
+        governor = QualityGovernor(window=4)
+        governor.oversample = 4
+
+        stats.underruns += 1
+        stats.record_render(0.01, 100)
+        assert governor.update(stats)
+        assert governor.tier.name == 'no-oversample'
+
+        for _ in range(4):
+            stats.record_render(0.09, 100)
+            governor.update(stats)
+        assert governor.tier.name == 'cull'
+
+        for _ in range(4):
+            stats.record_render(0.01, 100)
+            governor.update(stats)
+        assert governor.tier.name == 'no-oversample'
+
+    def test_oversampling_is_dropped_first(self):
+        names = [tier.name for tier in QUALITY_TIERS]
+        assert names == ['full', 'no-oversample', 'cull', 'half-rate', 'quarter-rate']
+        assert all(tier.oversample == 1 for tier in QUALITY_TIERS[1:])
+        costs = [tier.cost(4) for tier in QUALITY_TIERS]
+        assert costs == sorted(costs, reverse=True)
+
+        renderer = self.make_renderer()
+        plain = renderer.render_row({'v': 1}, 0, 500)
+        renderer.oversample = 4
+        assert not np.array_equal(renderer.render_row({'v': 1}, 0, 500), plain)
+        renderer.quality = QUALITY_TIERS[1]
+        assert np.array_equal(renderer.render_row({'v': 1}, 0, 500), plain)
+
+    def test_tier_caps_oversampling_factor(self):
+        twice = self.make_renderer()
+        twice.oversample = 2
+        expected = twice.render_row({'v': 1}, 0, 500)
+        renderer = self.make_renderer()
+        renderer.oversample = 4
+        renderer.quality = RenderQuality('capped', oversample=2)
+        assert np.array_equal(renderer.render_row({'v': 1}, 0, 500), expected)
+
+    def test_governor_skips_tiers_that_change_nothing(self):
+        stats = PlaybackStats(sample_rate=1000)
+        governor = QualityGovernor(window=4)
+
+        stats.underruns += 1
+        stats.record_render(0.01, 100)
+        assert governor.update(stats)
+        assert governor.tier.name == 'cull'
+
+        for _ in range(4):
+            stats.record_render(0.01, 100)
+            governor.update(stats)
+        assert governor.tier.name == 'full'
+
+
+class TestAudioSinks:
+    def make_rows(self):
+        renderer = Renderer(
+            FormulaEngine(), {1: [["{x}"], ["0.5"], ["0.25"]]}, [1],
+            "output = np.sin(t * 0.01) * x", "import numpy as np\nx = 0\n",
+            samples_per_row=1000
+        )
+        renderer.prepare()
+        expected = np.concatenate([block for _, _, block in renderer.iter_rows()]) * 0.5
+        return RowStream(renderer, lookahead=2000), expected
+
+    def play(self, sink):
+        engine = AudioEngine(buffer_size=256, sink=sink)
+        rows, expected = self.make_rows()
+        Player(engine).play(rows, threading.Event())
+        engine.close()
+        return expected
+
+    def test_wav_file_sink_records_playback(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, 'capture.wav')
+            expected = self.play(WavFileSink(path))
+            with open(path, 'rb') as f:
+                data = f.read()
+            audio = np.frombuffer(data[data.index(b'data') + 8:], dtype='<f4')
+            assert np.allclose(audio, expected, atol=1e-6)
+
+    def test_pipe_sink_writes_raw_float32(self):
+        stream = io.BytesIO()
+        expected = self.play(PipeSink(stream))
+        assert np.allclose(np.frombuffer(stream.getvalue(), dtype=np.float32), expected, atol=1e-6)
+
+    def test_timeline_follows_sample_clock(self):
+        sink = NullSink(realtime=False)
+        engine = AudioEngine(buffer_size=256, sink=sink)
+        timeline = PlayTimeline()
+        rows, expected = self.make_rows()
+        Player(engine, timeline=timeline).play(rows, threading.Event())
+        engine.close()
+
+        assert engine.clock() == len(expected)
+        assert timeline.at(0) == (0, 0)
+        assert timeline.at(999) == (0, 0)
+        assert timeline.at(1000) == (0, 1)
+        assert timeline.at(2999) == (0, 2)
+
+    def test_null_sink_consumes_at_wall_clock(self):
+        sink = NullSink(realtime=True, block_size=441)
+        engine = AudioEngine(sample_rate=44100, sink=sink)
+        engine.start()
+        time.sleep(0.2)
+        engine.close()
+        # Roughly 100 blocks per second, and silence counts as nothing queued
+        assert 441 * 5 <= sink.frames <= 441 * 40
+        assert engine.stats.underruns == 0
+
+    def test_player_feeds_waveform(self):
+        engine = AudioEngine(buffer_size=256, sink=NullSink(realtime=False))
+        waveform = WaveformPyramid(base=16)
+        rows, expected = self.make_rows()
+        Player(engine, waveform=waveform).play(rows, threading.Event())
+        engine.close()
+
+        assert len(waveform) == len(expected)
+        _, mins, maxs = waveform.envelope(0, len(expected), 1)
+        assert np.isclose(mins.min(), expected.min()) and np.isclose(maxs.max(), expected.max())
+
+
+class TestWaveformPyramid:
+    def brute(self, signal, start, stop, positions):
+        edges = list(positions) + [stop]
+        return (np.array([signal[a:b].min() for a, b in zip(edges, edges[1:])]),
+                np.array([signal[a:b].max() for a, b in zip(edges, edges[1:])]))
+
+    def test_streamed_blocks_match_one_append(self):
+        signal = np.random.default_rng(1).uniform(-1, 1, 50000).astype(np.float32)
+        whole = WaveformPyramid(base=8)
+        whole.append(signal)
+        streamed = WaveformPyramid(base=8)
+        for block in np.array_split(signal, 37):
+            streamed.append(block)
+
+        assert len(streamed) == len(signal)
+        for start, stop, width in [(0, 50000, 100), (1234, 5678, 300), (0, 400, 1000)]:
+            for a, b in zip(whole.envelope(start, stop, width), streamed.envelope(start, stop, width)):
+                assert np.array_equal(a, b)
+
+    def test_envelope_matches_samples(self):
+        signal = np.random.default_rng(2).uniform(-1, 1, 1 << 16).astype(np.float32)
+        pyramid = WaveformPyramid(base=16, factor=4)
+        pyramid.append(signal)
+
+        positions, mins, maxs = pyramid.envelope(0, len(signal), 200)
+        assert len(positions) == 200
+        assert pyramid.level_for(len(signal) / 200) == 2
+        expected_mins, expected_maxs = self.brute(signal, 0, len(signal), positions)
+        assert np.array_equal(mins, expected_mins)
+        assert np.array_equal(maxs, expected_maxs)
+
+    def test_zoomed_in_returns_finest_buckets(self):
+        pyramid = WaveformPyramid(base=16)
+        pyramid.append(np.arange(160, dtype=np.float32))
+        positions, mins, maxs = pyramid.envelope(32, 80, 500)
+        assert list(positions) == [32, 48, 64]
+        assert list(mins) == [32, 48, 64]
+        assert list(maxs) == [47, 63, 79]
+
+    def test_clear(self):
+        pyramid = WaveformPyramid()
+        pyramid.append(np.ones(1000))
+        pyramid.clear()
+        assert len(pyramid) == 0
+        assert not len(pyramid.envelope(0, 1000, 10)[0])
+
+
+class TestLevelMeter:
+    def play(self, signal, sample_rate=44100):
+        ring = RingBuffer(sample_rate)
+        ring.write(signal.astype(np.float32))
+        ring.read_into(np.zeros(len(signal), dtype=np.float32))
+        return ring
+
+    def test_sine_levels_before_gain(self):
+        sample_rate = 44100
+        t = np.arange(4096) / sample_rate
+        meter = LevelMeter(sample_rate, gain=0.5)
+        reading = meter.update(self.play(0.25 * np.sin(2 * np.pi * 1000 * t)))
+
+        # 0.25 after a 0.5 gain is half scale
+        assert reading.peak_db == pytest.approx(-6.02, abs=0.1)
+        assert reading.rms_db == pytest.approx(-9.03, abs=0.2)
+        loudest = meter.band_freqs[np.argmax(reading.spectrum_db)]
+        assert 700 < loudest <= 1000
+        assert reading.spectrum_db.max() == pytest.approx(-6.02, abs=1.5)
+        assert not reading.clipped
+
+    def test_clip_is_held_until_reset(self):
+        meter = LevelMeter(gain=0.5)
+        assert meter.update(self.play(np.full(3000, 0.5))).clipped
+        assert meter.update(self.play(np.zeros(3000))).clipped
+        meter.reset_clip()
+        assert not meter.update(self.play(np.zeros(3000))).clipped
+
+    def test_silence_and_published_readings_are_stable(self):
+        meter = LevelMeter()
+        first = meter.update(RingBuffer(4096))
+        assert first.peak_db == FLOOR_DB and first.rms_db == FLOOR_DB
+        assert np.all(first.spectrum_db == FLOOR_DB)
+        kept = first.spectrum_db.copy()
+        second = meter.update(self.play(np.ones(2048) * 0.1))
+        assert second.spectrum_db is not first.spectrum_db
+        assert np.array_equal(first.spectrum_db, kept)
+
+
+class TestPreviewRate:
+    GLOBALS = ("import numpy as np\ns = 44100\nf = 440\n"
+               "def sine(p, v):\n    return np.sin((p * f / s) * np.pi) * v\n")
+
+    def render(self, sample_rate):
+        renderer = Renderer(FormulaEngine(), {1: [[""], [""]]}, [1], "output = sine(t, 1)",
+                            self.GLOBALS, speed=5.0, sample_rate=sample_rate)
+        renderer.prepare()
+        return np.concatenate([block for _, _, block in renderer.iter_rows()])
+
+    def test_sample_rate_comes_from_renderer(self):
+        full = self.render(44100)
+        draft = self.render(11025)
+        assert len(draft) * 4 == len(full)
+        assert np.allclose(draft, full[::4], atol=1e-4)
+
+    def test_upsampler_is_continuous_across_blocks(self):
+        signal = np.sin(np.arange(1000) * 0.05).astype(np.float32)
+        whole = Upsampler(4).process(signal)
+        upsampler = Upsampler(4)
+        pieces = np.concatenate([upsampler.process(signal[i:i + 77]) for i in range(0, 1000, 77)])
+        assert len(whole) == 4000
+        assert np.allclose(pieces, whole)
+        assert np.allclose(whole[3::4], signal)
+        assert np.allclose(whole[4:8], np.linspace(signal[0], signal[1], 5)[1:])
+
+
+class TestOversampling:
+    def render(self, formula, oversample):
+        renderer = Renderer(FormulaEngine(), {1: [[""], [""], [""]]}, [1], formula,
+                            "import numpy as np\n", samples_per_row=1000, oversample=oversample)
+        renderer.prepare()
+        return np.concatenate([block for _, _, block in renderer.iter_rows()])
+
+    def test_decimator_blocks_match_one_pass(self):
+        signal = np.random.default_rng(1).standard_normal(5000)
+        whole = PolyphaseDecimator(4).process(signal)
+        decimator = PolyphaseDecimator(4)
+        pieces = np.concatenate([decimator.process(signal[i:i + 333])
+                                 for i in range(0, len(signal), 333)])
+        assert len(whole) == 1250
+        assert np.allclose(pieces, whole, atol=1e-6)
+
+    def test_oversampled_render_lines_up_with_plain(self):
+        formula = "output = np.sin(t * 0.05)"
+        assert np.allclose(self.render(formula, 4), self.render(formula, 1), atol=1e-3)
+
+    def test_tones_above_nyquist_are_filtered(self):
+        # 0.9 cycles per sample aliases to 0.1 without oversampling
+        formula = "output = np.sin(t * 2 * np.pi * 0.9)"
+        assert np.max(np.abs(self.render(formula, 1))) > 0.9
+        assert np.max(np.abs(self.render(formula, 4)[100:])) < 0.01
+
+    def test_rerendered_row_matches_streamed(self):
+        formula = "output = np.sin(t * 0.05)"
+        renderer = Renderer(FormulaEngine(), {}, [], formula, "import numpy as np\n",
+                            oversample=2)
+        renderer.prepare()
+        streamed = [renderer.render_row({}, start, 500) for start in (0, 500, 1000)]
+        again = renderer.render_row({}, 500, 500)
+        assert np.allclose(again, streamed[1], atol=1e-4)
+
+
+class TestCellChanges:
+    def test_change_patches_one_cell(self):
+        manager = PatternManager()
+        seen = []
+        manager.listeners.append(seen.append)
+        data = manager.patterns[2]['data']
+
+        assert manager.apply_change(CellChange(2, 5, 3, "", "x = 1"))
+        assert manager.patterns[2]['data'] is data
+        assert data.get(5, 3) == "x = 1"
+        assert data.filled == 1
+        assert [(c.pattern, c.row, c.col) for c in seen] == [(2, 5, 3)]
+        assert manager.take_dirty() == {2: {5: data[5]}}
+        assert not manager.apply_change(CellChange(99, 0, 0, "", "x"))
+
+    def test_undo_groups_typing_in_one_cell(self):
+        manager = PatternManager()
+        for old, new in [("", "x"), ("x", "x ="), ("x =", "x = 2")]:
+            manager.apply_change(CellChange(3, 0, 0, old, new))
+        manager.apply_change(CellChange(3, 1, 0, "", "v = 1"))
+
+        change = manager.undo()
+        assert (change.row, change.new) == (1, "")
+        change = manager.undo()
+        assert (change.row, change.old, change.new) == (0, "x = 2", "")
+        assert manager.patterns[3]['data'][0][0] == ""
+        assert manager.undo() is None
+
+    def test_undo_after_load_leaves_new_song_alone(self):
+        manager = PatternManager()
+        manager.apply_change(CellChange(2, 0, 0, "", "x = 1"))
+
+        loaded = Pattern.from_rows([["y = 2"], [""]])
+        manager.replace({2: {'name': 'Loaded', 'data': loaded}}, [2])
+        assert manager.undo() is None
+        assert loaded.get(0, 0) == "y = 2"
+        assert manager.take_dirty() == {}
+
+    def test_undo_skips_cells_changed_since(self):
+        manager = PatternManager()
+        manager.apply_change(CellChange(2, 0, 0, "", "x = 1"))
+        manager.patterns[2]['data'].set(0, 0, "x = 3")
+        assert manager.undo() is None
+        assert manager.patterns[2]['data'].get(0, 0) == "x = 3"
+
+
+class TestPattern:
+    def test_stores_only_filled_cells(self):
+        rows = [["{x}", "{v}", ""], ["", "", ""], ["0.5", "", "1"]] + [[""] * 3] * 61
+        pattern = Pattern.from_rows(rows)
+
+        assert (len(pattern), pattern.num_columns, pattern.filled) == (64, 3, 4)
+        assert pattern.to_rows() == rows
+        assert pattern[2] == ["0.5", "", "1"]
+        assert pattern[-1] == ["", "", ""]
+        assert pattern.row_cells(2) == [(0, "0.5"), (2, "1")]
+        assert list(pattern.cells()) == [(0, 0, "{x}"), (0, 1, "{v}"), (2, 0, "0.5"), (2, 2, "1")]
+        with pytest.raises(IndexError):
+            pattern[64]
+
+    def test_set_keeps_cells_sorted_and_grows(self):
+        pattern = Pattern(4, 2)
+        for row, col, value in [(3, 1, "b"), (0, 0, "a"), (3, 0, "c"), (1, 5, "d")]:
+            pattern.set(row, col, value)
+        assert list(pattern.cells()) == [(0, 0, "a"), (1, 5, "d"), (3, 0, "c"), (3, 1, "b")]
+        assert pattern.num_columns == 6
+
+        pattern.set(3, 0, "")
+        pattern.set(2, 2, "")
+        assert pattern.filled == 3
+        pattern.set(9, 0, "e")
+        assert len(pattern) == 10 and pattern.get(9, 0) == "e" and pattern.get(8, 0) == ""
+
+    def test_row_replacement_and_append(self):
+        pattern = Pattern.from_rows([["a", "b"], ["c", ""], ["", "d"]])
+        pattern[1] = ["", "x", "y"]
+        pattern.append(["z"])
+        assert pattern.to_rows() == [["a", "b", ""], ["", "x", "y"], ["", "d", ""], ["z", "", ""]]
+
+    def test_copy_is_independent_and_values_interned(self):
+        pattern = Pattern.from_rows([["v = " + "0.25"]])
+        copy = pattern.copy()
+        assert copy.version == pattern.version
+        copy.set(0, 0, "v = 1")
+        assert pattern.get(0, 0) == "v = 0.25"
+        assert copy.version != pattern.version
+
+        other = Pattern.from_rows([["v = 0." + "25"]])
+        assert other.get(0, 0) is pattern.get(0, 0)
+
+    def test_blank_patterns_cost_nothing_per_cell(self):
+        manager = PatternManager()
+        assert manager.patterns[1]['data'].filled == 3
+        assert all(manager.patterns[i]['data'].filled == 0 for i in range(2, 13))
+        assert len(manager.patterns[5]['data']) == 64
+
+
+class TestSongSnapshot:
+    def capture(self, manager, previous=None):
+        return SongSnapshot.capture(manager, "output = x", "x = 0", previous=previous)
+
+    def test_snapshot_is_frozen_copy(self):
+        manager = PatternManager()
+        song = self.capture(manager)
+        manager.patterns[1]['data'][0][0] = "x = 9"
+        manager.order_list.append(2)
+
+        assert song.patterns[1][0][0] == "x = 0"
+        assert song.order == ()
+        with pytest.raises(AttributeError):
+            song.speed = 8
+        with pytest.raises(TypeError):
+            song.patterns[1] = ()
+
+    def test_recapture_shares_unchanged_rows(self):
+        manager = PatternManager()
+        first = self.capture(manager)
+        manager.patterns[2]['data'].set(5, 3, "f = 220")
+        second = self.capture(manager, previous=first)
+
+        assert second.patterns[1] is first.patterns[1]
+        assert second.patterns[2][4] is first.patterns[2][4]
+        assert second.patterns[2][4] == ()
+        assert second.edits_since(first) == {2: {5: manager.patterns[2]['data'][5]}}
+
+    def test_dirty_rows_publish_incrementally(self):
+        manager = PatternManager()
+        first = self.capture(manager)
+        manager.apply_change(CellChange(3, 70, 1, "", "v = 1"))
+        second = first.with_rows(manager.take_dirty(), speed=8.0)
+
+        assert second.speed == 8.0 and first.speed == 4.0
+        assert len(second.patterns[3]) == 71
+        edits = second.edits_since(first)
+        assert list(edits) == [3]
+        assert edits[3][70][1] == "v = 1"
+        assert not second.edits_since(second)
+
+    def test_row_edit_copies_only_its_chunk(self):
+        manager = PatternManager()
+        first = self.capture(manager)
+        manager.apply_change(CellChange(2, 40, 0, "", "x = 1"))
+        second = first.with_rows(manager.take_dirty())
+
+        old, new = first.patterns[2].chunks, second.patterns[2].chunks
+        assert new[1] is not old[1]
+        assert all(a is b for index, (a, b) in enumerate(zip(old, new)) if index != 1)
+        assert second.patterns[1] is first.patterns[1]
+        assert second.formula_text is first.formula_text
+        assert second.patterns[2][40][0] == "x = 1"
+        assert second.edits_since(first) == {2: {40: manager.patterns[2]['data'][40]}}
+
+    def test_removed_rows_are_reported(self):
+        first = SongSnapshot({1: (("a",), ("b",), ("c",)), 2: (("d",),)}, [1, 2], "", "")
+        second = first.replace(patterns={1: (("a",),)})
+        assert second.edits_since(first) == {1: {1: None, 2: None}, 2: {0: None}}
+
+    def test_pattern_rows_grow_to_reach_a_row(self):
+        rows = PatternRows([("a",)] * 3)
+        grown = rows.replace({70: ("b",)})
+        assert len(grown) == 71
+        assert list(grown)[:3] == [("a",)] * 3
+        assert grown[69] == () and grown[70] == ("b",)
+        assert [len(chunk) for chunk in grown.chunks] == [32, 32, 7]
+        assert len(rows) == 3
+
+    def test_renderer_gets_its_own_copy(self):
+        song = SongSnapshot({1: (("{x}",), ("0.5",))}, [1], "output = x", "x = 0")
+        renderer = Renderer(FormulaEngine(), song.pattern_lists(), song.order,
+                            song.formula_text, song.globals_text, samples_per_row=10)
+        renderer.patterns[1][1][0] = "0.25"
+        assert song.patterns[1][1] == ("0.5",)
+
+
+class TestRenderer:
+    @pytest.fixture
+    def patterns(self):
+        return {
+            1: [["{x}", "{v}", "{speed}"], ["1", "0.5", "8"], ["", "0.25", ""]],
+            2: [["2", "", "4"], ["", "", ""]],
+        }
+
+    def make_renderer(self, patterns, order=(1, 2), **kwargs):
+        return Renderer(
+            FormulaEngine(), patterns, list(order),
+            "output = np.ones(len(t)) * x * v",
+            "import numpy as np\nx = 0\nv = 0\n",
+            **kwargs
+        )
+
+    def test_playback_values_carries_column_vars(self, patterns):
+        column_vars = {}
+        first = playback_values(patterns[1], column_vars)
+        second = playback_values(patterns[2], column_vars)
+
+        assert first[0] == ["", "", ""]
+        assert first[1] == ["x = 1", "v = 0.5", "speed = 8.0"]
+        assert second[0] == ["x = 2", "", "speed = 4.0"]
+
+    def test_render_uses_row_speed(self, patterns):
+        renderer = self.make_renderer(patterns)
+        buffer = renderer.render()
+
+        # Header row at the default 4 rows/sec, two rows at 8, two at 4
+        assert len(buffer) == 11025 + 2 * 5512 + 2 * 11025
+        assert renderer.t == len(buffer)
+        assert buffer[11025] == pytest.approx(0.5)
+        assert buffer[11025 + 5512] == pytest.approx(0.25)
+        assert buffer[-1] == pytest.approx(0.5)
+
+    def test_render_tracks_memory_per_stage(self, patterns):
+        renderer = self.make_renderer(patterns, samples_per_row=1000, track_memory=True)
+        buffer = renderer.render(gain=0.5)
+
+        assert len(buffer) == 5000
+        assert buffer[1000] == pytest.approx(0.25)
+        assert set(renderer.memory.peaks) >= {'control', 'render', 'gain'}
+
+    def test_render_to_streams_into_writer(self, patterns, tmp_path):
+        path = tmp_path / "streamed.wav"
+        renderer = self.make_renderer(patterns, samples_per_row=100)
+        with WavWriter(str(path), 44100, sample_format='float32') as writer:
+            written = renderer.render_to(writer, gain=0.5)
+
+        assert written == 500
+        assert writer.frames_written == 500
+
+    def test_seek_matches_full_render(self):
+        patterns = {
+            1: [["{x}", "{v}", "{speed}"]] + [[f"{i}", "v + 0.01", str(4 + i % 3)] for i in range(1, 40)],
+            2: [["x * 2", "", ""]] + [["", "v - 0.02", ""] for _ in range(20)],
+        }
+        order = [1, 2, 1]
+        formula = "output = np.sin(t * 0.001) * x * v"
+        full = self.make_renderer(patterns, order)
+        full.formula_text = formula
+        full.prepare()
+        rows = list(full.iter_rows())
+
+        renderer = self.make_renderer(patterns, order)
+        renderer.formula_text = formula
+        renderer.prepare()
+        index = StateIndex(interval=8).build(renderer)
+        assert (1, 0) in index.snapshots and (2, 32) in index.snapshots
+
+        for order_index, row in [(0, 0), (1, 0), (1, 13), (2, 37)]:
+            position = next(i for i, (o, r, _) in enumerate(rows) if (o, r) == (order_index, row))
+            expected = np.concatenate([block for _, _, block in rows[position:]])
+            start = index.state_at(renderer, order_index, row)
+            seeked = np.concatenate([block for _, _, block in renderer.iter_rows(start)])
+            assert np.array_equal(seeked, expected), (order_index, row)
+
+    def test_seek_clamps_and_skips_empty_entries(self, patterns):
+        patterns = {**patterns, 3: []}
+        renderer = self.make_renderer(patterns, order=(1, 3, 99, 2))
+        renderer.prepare()
+        index = StateIndex(interval=2).build(renderer)
+
+        # Past the end of pattern 1 plays its last row
+        past = index.state_at(renderer, 0, 50)
+        assert (past.order_index, past.row) == (0, 2)
+        assert past.vars['x'] == 1
+
+        # Empty and missing patterns fall forward to the next entry with rows
+        for order_index in (1, 2):
+            start = index.state_at(renderer, order_index, 1)
+            assert (start.order_index, start.row) == (3, 0)
+        assert index.state_at(renderer, 4) is None
+
+    def test_loop_over_empty_entry_is_silent(self, patterns):
+        renderer = self.make_renderer({**patterns, 3: []}, order=(3,), samples_per_row=10)
+        assert len(LoopCache().audio_for(renderer, LoopRegion(0, start_row=5))) == 0
+
+    def test_render_stops_on_event(self, patterns):
+        stop = threading.Event()
+        stop.set()
+        renderer = self.make_renderer(patterns, stop_event=stop)
+        assert len(renderer.render()) == 0
+
 if __name__ == "__main__":
     pytest.main([__file__])
\ No newline at end of file